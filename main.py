@@ -3,6 +3,7 @@ author: thomaszdxsn
 """
 import asyncio
 import math
+import os
 
 import uvloop
 asyncio.set_event_loop_policy(uvloop.EventLoopPolicy())
@@ -10,36 +11,83 @@ from dynaconf import settings
 
 from src import MONITOR_MAP
 from src.scheduler import create_scheduler
-from src.tunnels import QueueTunnel
-from src.storage import MongoStorage
+from src.tunnels import (QueueTunnel, SharedMemoryTunnel, SpillTunnel,
+                         FanoutTunnel, FanoutServer)
+from src.latency import latency_enabled, latency_stats
+from src.metrics import (metrics, MetricsServer, collect_storage,
+                         collect_tunnel, collect_writer_pool)
+from src.storage import MongoStorage, WriterPool
 from src.utils import chunk
 
 
+def create_local_tunnel(name: str) -> QueueTunnel:
+    """
+    配置了SPILL_TUNNEL_DIR的时候，积压超过阈值的数据溢出到磁盘
+    name: 每个进程独占的子目录(ingest{index}/writer{index})，多个进程不能共用segment文件
+    """
+    directory = settings.get('SPILL_TUNNEL_DIR')
+    if not directory:
+        return QueueTunnel()
+    return SpillTunnel(os.path.join(directory, name),
+                       threshold=settings.as_int('SPILL_TUNNEL_THRESHOLD'),
+                       segment_size=settings.as_int('SPILL_SEGMENT_SIZE'))
+
+
+def schedule_spill_flush(scheduler, tunnel):
+    """SpillTunnel的segment定期写回磁盘"""
+    if isinstance(tunnel, SpillTunnel):
+        scheduler.add_job(tunnel.flush, trigger='interval',
+                          seconds=settings.as_float('SPILL_FLUSH_INTERVAL'))
+
+
+def flush_tunnel(tunnel):
+    if isinstance(tunnel, SpillTunnel):
+        tunnel.flush()
+
+
+WRITER_METRICS_INDEX = 50     # 写入进程的METRICS_SERVER地址{index}从这里开始
+
+
+def create_metrics_server(index: int=0):
+    """METRICS_SERVER没有配置时返回None"""
+    address = settings.get('METRICS_SERVER')
+    if not address:
+        return None
+    return MetricsServer(metrics, address.format(index=index))
+
+
+def register_metrics(tunnel, storage=None, writer_pool=None):
+    metrics.add_collector(lambda: collect_tunnel(tunnel))
+    if storage is not None:
+        metrics.add_collector(lambda: collect_storage(storage))
+        metrics.add_collector(lambda: collect_writer_pool(writer_pool))
+
+
 class Main(object):
 
-    def __init__(self, exchange_info):
+    def __init__(self, exchange_info, tunnel=None, index: int=0):
+        """tunnel为None时采集和写入在同一个进程，否则只负责采集"""
         self.scheduler = create_scheduler()
-        self.tunnel = QueueTunnel()
-        self.storage = MongoStorage(settings.MONGO_URI,
-                                    settings.as_int('MONGO_POOL_SIZE'))
         self.exchanges_settings: dict = exchange_info
-        self._worked_tunnel = set()
-
-    async def supervisor(self):
-        """定时任务，如果tunnel出现新的key，就为它apawn一个worker"""
-        for key in self.tunnel.keys():
-            if key not in self._worked_tunnel:
-                self._worked_tunnel.add(key)
-                if key.endswith('depth'):
-                    worker_num = 6
-                else:
-                    worker_num = 3
-                for i in range(worker_num):
-                    # 开启两个worker
-                    self.scheduler.run_later(
-                        self.storage.worker,
-                        args=(self.tunnel, key)
-                    )
+        self.storage = self.writer_pool = self.fanout_server = None
+        if tunnel is None:
+            tunnel = create_local_tunnel(f'ingest{index}')
+            self.storage = MongoStorage(settings.MONGO_URI,
+                                        settings.as_int('MONGO_POOL_SIZE'))
+            self.writer_pool = WriterPool(self.storage, tunnel)
+        self.local_tunnel = tunnel
+        address = settings.get('FANOUT_SERVER')
+        if address:     # 实时数据同时推送给订阅者，mongo只是其中一路
+            tunnel = FanoutTunnel(
+                tunnel, limit=settings.as_int('FANOUT_SUBSCRIBER_LIMIT')
+            )
+            self.fanout_server = FanoutServer(
+                tunnel, address.format(index=index),
+                max_buffer=settings.as_int('FANOUT_MAX_BUFFER')
+            )
+        self.tunnel = tunnel
+        self.metrics_server = create_metrics_server(index)
+        register_metrics(tunnel, self.storage, self.writer_pool)
 
     async def schedule_monitors(self):
         for exchange, info in self.exchanges_settings:
@@ -54,34 +102,95 @@ class Main(object):
 
     async def main(self):
         self.scheduler.start()
-        self.scheduler.add_job(self.supervisor, trigger='cron', minute='*')
+        if self.metrics_server is not None:
+            await self.metrics_server.start()
+        if self.fanout_server is not None:
+            await self.fanout_server.start()
+        if self.writer_pool is not None:
+            self.writer_pool.start()    # tunnel出现新key时立即开启worker，并按积压伸缩
+            self.scheduler.add_job(self.storage.log_batch_stats,
+                                   trigger='cron', minute='*/10')
+        schedule_latency_export(self.scheduler)
+        schedule_spill_flush(self.scheduler, self.local_tunnel)
         await self.schedule_monitors()
-        # while True:
-        #     for k, v in self.tunnel._container.items():
-        #         print(f'{k}: {v.qsize()}')
-        #     print(f'{len(self.tunnel.keys())} workers: {len(self._worked_tunnel)}')
-        #     await asyncio.sleep(5)
 
+    def close(self):
+        flush_tunnel(self.local_tunnel)
+
+
+class Writer(object):
+    """共享内存tunnel模式下，专门从tunnel取数据写入mongo的进程"""
 
-def main(exchange_info):
+    def __init__(self, tunnel: SharedMemoryTunnel, index: int=0):
+        self.scheduler = create_scheduler()
+        self.tunnel = tunnel
+        self.index = index
+        self.local_tunnel = None
+        self.storage = MongoStorage(settings.MONGO_URI,
+                                    settings.as_int('MONGO_POOL_SIZE'))
+        self.writer_pool = WriterPool(self.storage, self.tunnel)
+        self.metrics_server = create_metrics_server(WRITER_METRICS_INDEX +
+                                                    index)
+        register_metrics(tunnel, self.storage, self.writer_pool)
+
+    async def main(self):
+        self.local_tunnel = create_local_tunnel(f'writer{self.index}')
+        self.tunnel.start_consumer(self.local_tunnel)
+        self.scheduler.start()
+        if self.metrics_server is not None:
+            await self.metrics_server.start()
+        self.writer_pool.start()
+        self.scheduler.add_job(self.storage.log_batch_stats,
+                               trigger='cron', minute='*/10')
+        schedule_latency_export(self.scheduler)
+        schedule_spill_flush(self.scheduler, self.local_tunnel)
+
+    def close(self):
+        flush_tunnel(self.local_tunnel)
+
+
+def schedule_latency_export(scheduler):
+    if latency_enabled():
+        scheduler.add_job(latency_stats.log_stats, trigger='interval',
+                          seconds=float(settings.LATENCY_EXPORT_INTERVAL))
+
+
+def run_forever(app):
     try:
         import logging
         logging.basicConfig(level=logging.WARNING)
         loop = asyncio.get_event_loop()
-        m = Main(exchange_info)
-        loop.run_until_complete(m.main())
+        loop.run_until_complete(app.main())
         loop.run_forever()
     except KeyboardInterrupt:
         return
+    finally:
+        app.close()     # 溢出到磁盘的数据写回磁盘
+
+
+def main(exchange_info, tunnel=None, index: int=0):
+    run_forever(Main(exchange_info, tunnel, index))
+
+
+def writer_main(tunnel: SharedMemoryTunnel, index: int=0):
+    run_forever(Writer(tunnel, index))
 
 
 if __name__ == '__main__':
-    import os
     import aioprocessing
     processes = []
+    tunnel = None
+    if settings.get('SHM_TUNNEL', False):
+        # 采集进程 -> 共享内存 -> MONGO_WRITER_PROCESSES个写入进程
+        tunnel = SharedMemoryTunnel(settings.as_int('SHM_TUNNEL_CAPACITY'))
+        for i in range(settings.as_int('MONGO_WRITER_PROCESSES')):
+            p = aioprocessing.AioProcess(target=writer_main, args=(tunnel, i))
+            processes.append(p)
     chunk_num = len(settings['EXCHANGES']) //  os.cpu_count()
-    for exchange_info in chunk(settings['EXCHANGES'].items(), chunk_num):
-        p = aioprocessing.AioProcess(target=main, args=(exchange_info,))
+    exchange_chunks = chunk(settings['EXCHANGES'].items(), chunk_num)
+    for i, exchange_info in enumerate(exchange_chunks):
+        p = aioprocessing.AioProcess(target=main,
+                                     args=(exchange_info, tunnel, i))
         processes.append(p)
     [p.start() for p in processes]
 
@@ -0,0 +1,155 @@
+"""
+author: thomaszdxsn
+
+json decode microbenchmark
+
+对每个交易所有代表性的ws消息，对比可用的json解码库(json/orjson/ujson)单条消息的解码耗时
+okex(deflate)和huobi(gzip)的消息先解压，只计算json解码的部分
+
+--frames DIR: 使用录制的消息，DIR下是WS_RECORD_DIR录制的<exchange>-*.frames.gz，
+    或者每个交易所一个<exchange>.jsonl，每行 {"type": "text"|"binary", "data": str或者base64}
+
+usage: python -m scripts.bench_decoder [--frames DIR]
+"""
+import base64
+import gzip
+import json
+import sys
+import timeit
+import zlib
+from pathlib import Path
+from typing import Dict, List, Union
+
+from src.sdk.decoder import DECODERS, get_decoder, json_loads
+from src.sdk.recorder import read_frames
+from src.utils import Inflater, OKEX_WBITS, GZIP_WBITS
+
+
+def _levels(n: int, start: float, step: float) -> list:
+    return [[f'{start + i * step:.8f}', f'{1 + i * 0.01:.8f}', []]
+            for i in range(n)]
+
+
+def _deflate(data: str) -> bytes:
+    compressor = zlib.compressobj(wbits=-zlib.MAX_WBITS)
+    return compressor.compress(data.encode()) + compressor.flush()
+
+
+SAMPLE_FRAMES = {
+    'binance': [json.dumps({
+        'stream': 'btcusdt@depth',
+        'data': {'e': 'depthUpdate', 'E': 1533000000000, 's': 'BTCUSDT',
+                 'U': 157, 'u': 160,
+                 'b': _levels(20, 6000, -0.01), 'a': _levels(20, 6000.01, 0.01)}
+    }), json.dumps({
+        'stream': 'btcusdt@trade',
+        'data': {'e': 'trade', 'E': 1533000000000, 's': 'BTCUSDT', 't': 12345,
+                 'p': '6000.01', 'q': '0.1', 'b': 88, 'a': 50,
+                 'T': 1533000000000, 'm': True, 'M': True}
+    })],
+    'bitfinex': [
+        json.dumps([17470, [[6000.0 - i, 1 + i, 0.5] for i in range(25)] +
+                    [[6001.0 + i, 1 + i, -0.5] for i in range(25)]]),
+        json.dumps([17470, [6000.0, 3, 1.25]]),
+        json.dumps([17471, 'te', [401597393, 1533000000000, 0.01, 6000.1]]),
+    ],
+    'bitmex': [json.dumps({
+        'table': 'orderBookL2', 'action': 'update',
+        'data': [{'symbol': 'XBTUSD', 'id': 8799400000 + i, 'side': 'Sell',
+                  'size': 1000 + i} for i in range(10)]
+    }), json.dumps({
+        'table': 'trade', 'action': 'insert',
+        'data': [{'timestamp': '2018-08-01T00:00:00.000Z', 'symbol': 'XBTUSD',
+                  'side': 'Buy', 'size': 100, 'price': 6000.5,
+                  'tickDirection': 'PlusTick',
+                  'trdMatchID': '00000000-0000-0000-0000-000000000000',
+                  'grossValue': 1666500, 'homeNotional': 0.016665,
+                  'foreignNotional': 100}]
+    })],
+    'poloniex': [json.dumps(
+        [121, 5000000, [['o', 0, f'{6000 - i:.8f}', f'{i:.8f}']
+                        for i in range(10)]]
+    )],
+    'hitbtc': [json.dumps({
+        'jsonrpc': '2.0', 'method': 'updateOrderbook',
+        'params': {'ask': [{'price': f'{6000 + i:.2f}', 'size': '0.01'}
+                           for i in range(10)],
+                   'bid': [{'price': f'{5999 - i:.2f}', 'size': '0.01'}
+                           for i in range(10)],
+                   'symbol': 'BTCUSD', 'sequence': 123456}
+    })],
+    'okex_spot': [_deflate(json.dumps([{
+        'channel': 'ok_sub_spot_btc_usdt_depth',
+        'data': {'asks': [[f'{6000 + i:.4f}', '0.1'] for i in range(20)],
+                 'bids': [[f'{5999 - i:.4f}', '0.1'] for i in range(20)],
+                 'timestamp': 1533000000000}
+    }]))],
+    'huobi': [gzip.compress(json.dumps({
+        'ch': 'market.btcusdt.depth.step0', 'ts': 1533000000000,
+        'tick': {'bids': [[5999.0 - i, 0.1] for i in range(150)],
+                 'asks': [[6000.0 + i, 0.1] for i in range(150)],
+                 'ts': 1533000000000, 'version': 12345}
+    }).encode())],
+}
+
+
+def inflate(exchange: str, data: Union[str, bytes]) -> Union[str, bytes]:
+    """得到monitor交给json解码的数据"""
+    if isinstance(data, str):
+        return data
+    if exchange.startswith('okex'):
+        return Inflater(OKEX_WBITS)(data)
+    if data[:2] == b'\x1f\x8b':
+        return Inflater(GZIP_WBITS)(data)
+    return data
+
+
+def load_frames(directory: str) -> Dict[str, List[Union[str, bytes]]]:
+    frames = {}
+    for path in sorted(Path(directory).glob('*.frames.gz')):
+        exchange = path.name.split('-')[0]
+        frames.setdefault(exchange, []).extend(
+            frame.data for frame in read_frames(str(path))
+        )
+    for path in sorted(Path(directory).glob('*.jsonl')):
+        with path.open() as f:
+            frames[path.stem] = [
+                frame['data'] if frame['type'] == 'text'
+                else base64.b64decode(frame['data'])
+                for frame in map(json.loads, filter(str.strip, f))
+            ]
+    return frames
+
+
+def available_decoders() -> dict:
+    decoders = {}
+    for name in DECODERS:
+        func = get_decoder(name)
+        if name == 'json' or func is not json_loads:
+            decoders[name] = func
+    return decoders
+
+
+def main(frames: Dict[str, List[Union[str, bytes]]], number: int=2000):
+    decoders = available_decoders()
+    header = f'{"exchange":<12} {"frames":>6} {"bytes":>7}'
+    header += ''.join(f' {name + "(us)":>11}' for name in decoders)
+    print(header)
+    for exchange, raw_frames in frames.items():
+        payloads = [inflate(exchange, data) for data in raw_frames]
+        size = sum(map(len, payloads)) / len(payloads)
+        line = f'{exchange:<12} {len(payloads):>6} {size:>7.0f}'
+        for loads in decoders.values():
+            cost = min(timeit.repeat(
+                lambda: [loads(payload) for payload in payloads],
+                number=number, repeat=3
+            )) / number / len(payloads) * 1e6
+            line += f' {cost:>11.2f}'
+        print(line)
+
+
+if __name__ == '__main__':
+    if len(sys.argv) > 2 and sys.argv[1] == '--frames':
+        main(load_frames(sys.argv[2]), number=200)
+    else:
+        main(SAMPLE_FRAMES)
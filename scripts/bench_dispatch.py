@@ -0,0 +1,111 @@
+"""
+author: thomaszdxsn
+
+channel routing microbenchmark
+
+对每个用channel字符串分发消息的monitor，对比每条消息都用正则解析channel(_parse_route，旧的实现)
+和MonitorAbstract.route查表的耗时；消息流是N个symbol的各种channel混在一起
+
+--frames DIR: 使用录制的消息(格式和scripts.bench_decoder一样)，从消息里取出channel
+
+usage: python -m scripts.bench_dispatch [--frames DIR]
+"""
+import asyncio
+import itertools
+import sys
+import timeit
+from typing import Dict, List, Union
+
+from src.monitors import MONITOR_MAP
+from src.scheduler import create_scheduler
+from src.sdk.decoder import loads
+from src.tunnels.queues import QueueTunnel
+from src.utils import Inflater, OKEX_WBITS, GZIP_WBITS
+from scripts.bench_decoder import load_frames
+
+SYMBOLS = [f'{base}usdt' for base in
+           ('btc', 'eth', 'ltc', 'eos', 'xrp', 'bch', 'etc', 'trx', 'ada', 'neo')]
+
+SAMPLE_CHANNELS = {
+    'binance': [f'{s}@{t}' for s in SYMBOLS
+                for t in ('trade', 'depth', 'kline_1m', 'ticker')],
+    'okex_spot': [f'ok_sub_spot_{s[:-4]}_usdt_{t}' for s in SYMBOLS
+                  for t in ('ticker', 'depth', 'deals', 'kline_1min')],
+    'okex_future': [f'ok_sub_futureusd_{s[:-4]}_{t}_{c}{suffix}'
+                    for s in SYMBOLS[:5] for c in ('this_week', 'quarter')
+                    for t, suffix in (('trade', ''), ('depth', '_20'),
+                                      ('kline', '_1min'), ('ticker', ''))],
+    'huobi': [f'market.{s}.{t}' for s in SYMBOLS
+              for t in ('detail', 'kline.1min', 'trade.detail', 'depth.step0')],
+    'bitflyer': [f'lightning_{t}_{p}'
+                 for p in ('BTC_JPY', 'FX_BTC_JPY', 'ETH_BTC')
+                 for t in ('ticker', 'executions', 'board')],
+    'fcoin': [f'{t}.{s}' for s in SYMBOLS
+              for t in ('ticker', 'depth.L20', 'candle.M1', 'trade')],
+    'cointiger': [f'market_{s}_{t}' for s in SYMBOLS
+                  for t in ('ticker', 'depth_step0', 'trade_ticker', 'kline_1min')],
+    'bitmex': ['trade', 'orderBookL2', 'orderBook10', 'tradeBin1m',
+               'quoteBin1m', 'settlement'],
+}
+
+
+def _okex_channel(data: bytes) -> str:
+    return loads(Inflater(OKEX_WBITS)(data))[0]['channel']
+
+
+CHANNEL_GETTERS = {
+    'binance': lambda data: loads(data)['stream'],
+    'okex_spot': _okex_channel,
+    'okex_future': _okex_channel,
+    'huobi': lambda data: loads(Inflater(GZIP_WBITS)(data)).get('ch'),
+    'bitflyer': lambda data: loads(data).get('params', {}).get('channel'),
+    'fcoin': lambda data: loads(data).get('type'),
+    'cointiger': lambda data: loads(Inflater(GZIP_WBITS)(data)).get('channel'),
+    'bitmex': lambda data: loads(data).get('table'),
+}
+
+
+def channels_from_frames(frames: Dict[str, List[Union[str, bytes]]]) -> dict:
+    result = {}
+    for exchange, raw_frames in frames.items():
+        getter = CHANNEL_GETTERS.get(exchange)
+        if getter is None:
+            continue
+        channels = []
+        for data in raw_frames:
+            try:
+                channel = getter(data)
+            except (ValueError, KeyError, IndexError, TypeError):
+                continue
+            if channel:
+                channels.append(channel)
+        result[exchange] = channels
+    return result
+
+
+def main(channels: Dict[str, List[str]], messages: int=20000, number: int=5):
+    loop = asyncio.get_event_loop()
+    scheduler = create_scheduler(loop)
+    print(f'{"exchange":<12} {"channels":>8} {"regex(us)":>10} '
+          f'{"route(us)":>10} {"speedup":>8}')
+    for exchange, chans in channels.items():
+        if not chans:
+            continue
+        monitor = MONITOR_MAP[exchange](symbols=[], scheduler=scheduler,
+                                        tunnel=QueueTunnel(), loop=loop)
+        stream = list(itertools.islice(itertools.cycle(chans), messages))
+        parse, route = monitor._parse_route, monitor.route
+        old = min(timeit.repeat(lambda: [parse(c) for c in stream],
+                                number=number, repeat=3))
+        new = min(timeit.repeat(lambda: [route(c) for c in stream],
+                                number=number, repeat=3))
+        per = number * len(stream) / 1e6
+        print(f'{exchange:<12} {len(set(chans)):>8} {old / per:>10.3f} '
+              f'{new / per:>10.3f} {old / new:>7.1f}x')
+
+
+if __name__ == '__main__':
+    if len(sys.argv) > 2 and sys.argv[1] == '--frames':
+        main(channels_from_frames(load_frames(sys.argv[2])))
+    else:
+        main(SAMPLE_CHANNELS)
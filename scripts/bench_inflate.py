@@ -0,0 +1,68 @@
+"""
+author: thomaszdxsn
+
+inflate microbenchmark
+
+okex(raw deflate)和huobi/cointiger(gzip)的消息从收到到json解码完成的吞吐量，
+对比旧实现(okex: 每帧新建decompressobj + flush + decode成str; huobi: gzip.decompress)
+和每个连接一个的Inflater(zlib.decompress, 返回bytes直接交给json解码)
+
+--frames DIR: 使用录制的消息，格式和scripts.bench_decoder一样，只使用binary帧
+
+usage: python -m scripts.bench_inflate [--frames DIR]
+"""
+import gzip
+import sys
+import timeit
+import zlib
+from typing import Dict, List, Union
+
+from src.sdk.decoder import loads
+from src.utils import Inflater, OKEX_WBITS, GZIP_WBITS
+from scripts.bench_decoder import SAMPLE_FRAMES, load_frames
+
+
+def legacy_okex(raw_data: bytes) -> str:
+    decompressor = zlib.decompressobj(-zlib.MAX_WBITS)
+    inflated = decompressor.decompress(raw_data)
+    inflated += decompressor.flush()
+    return inflated.decode()
+
+
+def main(frames: Dict[str, List[Union[str, bytes]]], number: int=2000):
+    """inflate: 只解压; total: 解压 + json解码，MB/s按解压后的大小计算"""
+    print(f'{"exchange":<12} {"frames":>6} {"bytes":>7} '
+          f'{"inflate old/new(us)":>20} {"total old/new(MB/s)":>20} '
+          f'{"speedup":>8}')
+    for exchange, raw_frames in frames.items():
+        raw_frames = [data for data in raw_frames if isinstance(data, bytes)]
+        if not raw_frames:
+            continue
+        is_gzip = raw_frames[0][:2] == b'\x1f\x8b'
+        legacy = gzip.decompress if is_gzip else legacy_okex
+        inflater = Inflater(GZIP_WBITS if is_gzip else OKEX_WBITS)
+        assert loads(legacy(raw_frames[0])) == loads(inflater(raw_frames[0]))
+        size = sum(len(inflater(data)) for data in raw_frames)
+
+        def run(func):
+            return min(timeit.repeat(
+                lambda: [func(data) for data in raw_frames],
+                number=number, repeat=5
+            )) / number
+
+        old_inflate, new_inflate = run(legacy), run(inflater)
+        old = run(lambda data: loads(legacy(data)))
+        new = run(lambda data: loads(inflater(data)))
+        inflate_cost = (f'{old_inflate / len(raw_frames) * 1e6:.2f}/'
+                        f'{new_inflate / len(raw_frames) * 1e6:.2f}')
+        total = f'{size / old / 1e6:.1f}/{size / new / 1e6:.1f}'
+        print(f'{exchange:<12} {len(raw_frames):>6} '
+              f'{size / len(raw_frames):>7.0f} {inflate_cost:>20} '
+              f'{total:>20} {old / new:>7.2f}x')
+
+
+if __name__ == '__main__':
+    if len(sys.argv) > 2 and sys.argv[1] == '--frames':
+        main(load_frames(sys.argv[2]), number=200)
+    else:
+        main(SAMPLE_FRAMES)
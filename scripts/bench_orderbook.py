@@ -0,0 +1,195 @@
+"""
+author: thomaszdxsn
+
+orderbook microbenchmark
+
+replay: 回放模拟的bitfinex book更新流(价格围绕mid随机游走，大部分更新集中在盘口附近)，
+        每N条更新取一次snapshot，对比旧的dict+sort实现和SortedBook实现
+snapshot: poloniex这种字符串档位的book，对比不同深度下单次snapshot的耗时
+
+usage: python -m scripts.bench_orderbook [replay|snapshot]
+"""
+import random
+import sys
+import timeit
+
+from src.schemas.markets import (BitfinexTradeOrderbook, BitfinexTradeDepth,
+                                 PoloniexOrderbook, PoloniexDepth)
+from src.schemas.markets._orderbook import ORDERBOOK_LEVEL
+from src.schemas.markets._sorted_book import SortedBook
+
+
+class LegacyBitfinexTradeOrderbook(object):
+    """dict + sort的旧实现，只用作对比"""
+
+    def __init__(self, pair: str):
+        self._bids = dict()
+        self._asks = dict()
+        self._pair = pair
+
+    def initialize(self, data_list: list):
+        for item in data_list:
+            self.update(item)
+
+    def update(self, item: list):
+        price, count, amount = item
+        book = self._bids if amount > 0 else self._asks
+        if count > 0:
+            book[price] = {'count': count, 'amount': amount}
+        else:
+            book.pop(price, None)
+
+    def snapshot(self) -> BitfinexTradeDepth:
+        bids = [
+            {'price': price, 'count': info['count'], 'amount': info['amount']}
+            for price, info in
+            sorted(self._bids.items(), key=lambda x: -x[0])[:ORDERBOOK_LEVEL]
+        ]
+        asks = [
+            {'price': price, 'count': info['count'], 'amount': info['amount']}
+            for price, info in
+            sorted(self._asks.items(), key=lambda x: x[0])[:ORDERBOOK_LEVEL]
+        ]
+        return BitfinexTradeDepth(pair=self._pair, asks=asks, bids=bids)
+
+
+class LegacyPoloniexOrderbook(object):
+    """字符串dict + 每次snapshot用float()排序的旧实现"""
+
+    def __init__(self, pair: str):
+        self._pair = pair
+
+    def initialize(self, data_list: list):
+        self._asks = data_list[0]
+        self._bids = data_list[1]
+
+    def snapshot(self) -> PoloniexDepth:
+        asks = [
+            {'price': float(price), 'amount': float(amount)}
+            for price, amount in
+            sorted(self._asks.items(), key=lambda x: float(x[0]))[:ORDERBOOK_LEVEL]
+        ]
+        bids = [
+            {'price': float(price), 'amount': float(amount)}
+            for price, amount in
+            sorted(self._bids.items(), key=lambda x: -float(x[0]))[:ORDERBOOK_LEVEL]
+        ]
+        return PoloniexDepth(asks=asks, bids=bids, pair=self._pair)
+
+
+class FloatKeyPoloniexOrderbook(LegacyPoloniexOrderbook):
+    """SortedBook + float key，数量仍然是字符串，snapshot时再float()"""
+
+    def initialize(self, data_list: list):
+        self._asks, self._bids = SortedBook(), SortedBook(descending=True)
+        for price, size in data_list[0].items():
+            self._asks[float(price)] = size
+        for price, size in data_list[1].items():
+            self._bids[float(price)] = size
+
+    def snapshot(self) -> PoloniexDepth:
+        asks = [{'price': price, 'amount': float(amount)}
+                for price, amount in self._asks.top(ORDERBOOK_LEVEL)]
+        bids = [{'price': price, 'amount': float(amount)}
+                for price, amount in self._bids.top(ORDERBOOK_LEVEL)]
+        return PoloniexDepth(asks=asks, bids=bids, pair=self._pair)
+
+
+def gen_str_book(levels: int, seed: int=0) -> list:
+    """poloniex returnOrderBook格式的快照，每边{levels}档"""
+    rnd = random.Random(seed)
+    mid = 7000000
+    asks = {f'{(mid + i) / 1e8:.8f}': f'{rnd.random() * 10:.8f}'
+            for i in range(1, levels + 1)}
+    bids = {f'{(mid - i) / 1e8:.8f}': f'{rnd.random() * 10:.8f}'
+            for i in range(1, levels + 1)}
+    return [asks, bids]
+
+
+def gen_stream(levels: int, updates: int, tick: float=0.1, seed: int=0):
+    """
+    生成 (snapshot, updates)
+    snapshot每边{levels}档，updates中约20%是删除档位
+    """
+    rnd = random.Random(seed)
+    mid = 6000.0
+    snapshot = []
+    for i in range(1, levels + 1):
+        snapshot.append([round(mid - i * tick, 1), rnd.randint(1, 5),
+                         rnd.random() * 3])
+        snapshot.append([round(mid + i * tick, 1), rnd.randint(1, 5),
+                         -rnd.random() * 3])
+    stream = []
+    for _ in range(updates):
+        mid += rnd.choice((-tick, 0, 0, tick))
+        offset = int(rnd.expovariate(1 / 20)) + 1       # 靠近盘口的更新更多
+        is_bid = rnd.random() < 0.5
+        price = round(mid - offset * tick if is_bid else mid + offset * tick, 1)
+        sign = 1 if is_bid else -1
+        if rnd.random() < 0.2:
+            stream.append([price, 0, sign])
+        else:
+            stream.append([price, rnd.randint(1, 5), sign * rnd.random() * 3])
+    return snapshot, stream
+
+
+def replay(book_class, snapshot: list, stream: list, snapshot_every: int):
+    book = book_class('tBTCUSD')
+    book.initialize(snapshot)
+    for i, item in enumerate(stream, 1):
+        book.update(item)
+        if i % snapshot_every == 0:
+            book.snapshot()
+
+
+def bench_replay(repeat: int=3):
+    print(f'{"levels":>8} {"snap/upd":>9} {"legacy(ms)":>11} '
+          f'{"sorted(ms)":>11} {"speedup":>8}')
+    for levels in (100, 1000, 5000):
+        snapshot, stream = gen_stream(levels, updates=10000)
+        for snapshot_every in (10, 100):
+            result = []
+            for book_class in (LegacyBitfinexTradeOrderbook,
+                               BitfinexTradeOrderbook):
+                cost = min(timeit.repeat(
+                    lambda: replay(book_class, snapshot, stream,
+                                   snapshot_every),
+                    number=1,
+                    repeat=repeat
+                ))
+                result.append(cost * 1000)
+            legacy, new = result
+            print(f'{levels:>8} {"1/" + str(snapshot_every):>9} '
+                  f'{legacy:>11.1f} {new:>11.1f} {legacy / new:>7.1f}x')
+
+
+def bench_snapshot(number: int=200):
+    print(f'{"levels":>8} {"legacy(us)":>11} {"float-key(us)":>14} '
+          f'{"fixed-point(us)":>16}')
+    for levels in (500, 2000, 10000):
+        data_list = gen_str_book(levels)
+        result = []
+        for book_class in (LegacyPoloniexOrderbook,
+                           FloatKeyPoloniexOrderbook,
+                           PoloniexOrderbook):
+            book = book_class('BTC_ETH')
+            book.initialize(data_list)
+            best_ask = book.snapshot().asks[0]
+            if isinstance(best_ask, dict):
+                best_ask = best_ask['price'], best_ask['amount']
+            assert best_ask[0] == 0.07000001
+            cost = min(timeit.repeat(book.snapshot, number=number, repeat=3))
+            result.append(cost / number * 1e6)
+        print(f'{levels:>8} {result[0]:>11.1f} {result[1]:>14.1f} '
+              f'{result[2]:>16.1f}')
+
+
+def main():
+    benches = sys.argv[1:] or ['replay', 'snapshot']
+    for name in benches:
+        print(f'== {name}')
+        globals()[f'bench_{name}']()
+
+
+if __name__ == '__main__':
+    main()
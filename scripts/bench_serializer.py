@@ -0,0 +1,61 @@
+"""
+author: thomaszdxsn
+
+to_dict microbenchmark
+
+对src/schemas/markets里的每个dataclass，对比dataclasses.asdict和生成的serializer
+depth类的asks/bids各填充ORDERBOOK_LEVEL档(dict格式)，模拟MongoStorage.bulk_op的真实负载
+
+usage: python -m scripts.bench_serializer
+"""
+import dataclasses
+import timeit
+from datetime import datetime
+
+from src.schemas import markets
+from src.schemas.markets._orderbook import ORDERBOOK_LEVEL
+
+SAMPLE_VALUES = {
+    str: 'btc_usdt',
+    int: 1,
+    float: 1.5,
+    bool: True,
+    datetime: datetime(2018, 8, 1),
+}
+
+
+def make_sample(cls):
+    levels = [{'price': 6000.0 + i, 'amount': 1.0} for i in range(ORDERBOOK_LEVEL)]
+    kwargs = {}
+    for f in dataclasses.fields(cls):
+        if f.type is list:
+            kwargs[f.name] = list(levels)
+        else:
+            kwargs[f.name] = SAMPLE_VALUES.get(f.type)
+    return cls(**kwargs)
+
+
+def main(number: int=2000):
+    schemas = sorted(
+        (obj for obj in vars(markets).values()
+         if isinstance(obj, type) and dataclasses.is_dataclass(obj)),
+        key=lambda c: c.__name__
+    )
+    print(f'{"schema":<24} {"asdict(us)":>11} {"to_dict(us)":>12} {"speedup":>8}')
+    total_old = total_new = 0
+    for cls in schemas:
+        item = make_sample(cls)
+        assert item.to_dict() == dataclasses.asdict(item)
+        old = min(timeit.repeat(lambda: dataclasses.asdict(item),
+                                number=number, repeat=3)) / number * 1e6
+        new = min(timeit.repeat(item.to_dict,
+                                number=number, repeat=3)) / number * 1e6
+        total_old += old
+        total_new += new
+        print(f'{cls.__name__:<24} {old:>11.2f} {new:>12.2f} {old / new:>7.1f}x')
+    print(f'{"total":<24} {total_old:>11.2f} {total_new:>12.2f} '
+          f'{total_old / total_new:>7.1f}x')
+
+
+if __name__ == '__main__':
+    main()
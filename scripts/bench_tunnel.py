@@ -0,0 +1,70 @@
+"""
+author: thomaszdxsn
+
+tunnel吞吐量benchmark
+
+producer每轮放入{burst}条数据(模拟一条ws消息里的多条trades)后让出事件循环，
+consumer不断取出，对比:
+    per-item: put + get_async
+    batched: put_many + get_many(max_n)
+
+usage: python -m scripts.bench_tunnel
+"""
+import asyncio
+import time
+
+from src.schemas.items import ExchangeItem
+from src.tunnels import QueueTunnel
+
+KEY = 'okex_spot|trades'
+
+
+async def per_item(tunnel: QueueTunnel, items: list, burst: int):
+    async def consume():
+        for _ in range(len(items)):
+            await tunnel.get_async(KEY)
+
+    consumer = asyncio.ensure_future(consume())
+    for i in range(0, len(items), burst):
+        for item in items[i: i + burst]:
+            tunnel.put(item)
+        await asyncio.sleep(0)
+    await consumer
+
+
+async def batched(tunnel: QueueTunnel, items: list, burst: int,
+                  max_n: int=100):
+    async def consume():
+        n = 0
+        while n < len(items):
+            n += len(await tunnel.get_many(KEY, max_n))
+
+    consumer = asyncio.ensure_future(consume())
+    for i in range(0, len(items), burst):
+        tunnel.put_many(items[i: i + burst])
+        await asyncio.sleep(0)
+    await consumer
+
+
+def main(total: int=200000):
+    loop = asyncio.get_event_loop()
+    items = [ExchangeItem('okex_spot', 'trades', i) for i in range(total)]
+    print(f'{"burst":>6} {"per-item(items/s)":>18} {"batched(items/s)":>17} '
+          f'{"speedup":>8}')
+    for burst in (1, 10, 100):
+        result = []
+        for func in (per_item, batched):
+            best = None
+            for _ in range(3):
+                tunnel = QueueTunnel(policies={})
+                start = time.perf_counter()
+                loop.run_until_complete(func(tunnel, items, burst))
+                cost = time.perf_counter() - start
+                best = cost if best is None else min(best, cost)
+            result.append(total / best)
+        print(f'{burst:>6} {result[0]:>18,.0f} {result[1]:>17,.0f} '
+              f'{result[1] / result[0]:>7.1f}x')
+
+
+if __name__ == '__main__':
+    main()
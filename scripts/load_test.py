@@ -0,0 +1,88 @@
+"""
+author: thomaszdxsn
+
+端到端压测: 同一个进程里启动模拟交易所(src.mock)和monitor，
+sdk的ws_url指向模拟服务，数据放进NullTunnel，
+按--rates逐级提高每个连接的推送速率，每一级统计:
+    sent/s: 模拟服务实际推送的速率(客户端处理不过来时socket写满，推送会落后于目标速率)
+    handled/s: monitor.dispatch_ws_msg处理的速率
+    backlog: 已推送但还没有被处理的消息数(在socket缓冲区里)
+handled/s跟不上目标速率时停止
+模拟服务的生成/压缩也在这个进程里，得到的是下限
+
+usage: python -m scripts.load_test huobi [--symbols btcusdt,ethusdt] [--rates 1000,5000,20000] [--seconds 10]
+"""
+import argparse
+import asyncio
+import os
+
+from dynaconf import settings
+
+from src.mock import MOCK_MAP
+from src.monitors import MONITOR_MAP
+from src.scheduler import create_scheduler
+from src.tunnels import NullTunnel
+
+
+async def main(exchange: str, symbols: list, rates: list, seconds: float):
+    loop = asyncio.get_event_loop()
+    server = MOCK_MAP[exchange](rate=rates[0])
+    url = await server.start()
+    monitor_class = MONITOR_MAP[exchange]
+    monitor_class._ws_sdk_class.ws_url = url
+    scheduler = create_scheduler(loop)
+    tunnel = NullTunnel()
+    monitor = monitor_class(symbols=symbols, scheduler=scheduler,
+                            tunnel=tunnel, loop=loop)
+    handled = [0]
+    dispatch = monitor.dispatch_ws_msg
+
+    async def counting_dispatch(msg):
+        handled[0] += 1
+        await dispatch(msg)
+
+    monitor.dispatch_ws_msg = counting_dispatch
+    scheduler.start()
+    await monitor.schedule()
+    while not handled[0]:
+        await asyncio.sleep(0.5)
+    print(f'{exchange}: {server.stats["connections"]} connections, '
+          f'{server.stats["subscribed"]} channels')
+    print(f'{"rate":>8} {"sent/s":>10} {"handled/s":>10} {"backlog":>8} '
+          f'{"items/s":>10}')
+    for rate in rates:
+        server.rate = rate
+        await asyncio.sleep(1)
+        sent, done, items = (server.stats['sent'], handled[0],
+                             sum(tunnel.counts.values()))
+        await asyncio.sleep(seconds)
+        sent_rate = (server.stats['sent'] - sent) / seconds
+        handled_rate = (handled[0] - done) / seconds
+        items_rate = (sum(tunnel.counts.values()) - items) / seconds
+        backlog = server.stats['sent'] - handled[0]
+        target = rate * server.stats['connections']
+        print(f'{target:>8.0f} {sent_rate:>10.0f} {handled_rate:>10.0f} '
+              f'{backlog:>8} {items_rate:>10.0f}')
+        if handled_rate < target * 0.9:
+            print(f'saturated at ~{handled_rate:.0f} msgs/s')
+            break
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('exchange', choices=sorted(MOCK_MAP))
+    parser.add_argument('--symbols', help='逗号分隔，默认是settings里的EXCHANGES')
+    parser.add_argument('--rates', default='500,1000,2000,5000,10000,20000',
+                        help='每个连接每秒推送多少条，逗号分隔')
+    parser.add_argument('--seconds', type=float, default=10)
+    args = parser.parse_args()
+    if args.symbols:
+        symbols = args.symbols.split(',')
+    else:
+        symbols = settings['EXCHANGES'][args.exchange]['symbols']
+    asyncio.get_event_loop().run_until_complete(main(
+        args.exchange, symbols,
+        [float(rate) for rate in args.rates.split(',')], args.seconds
+    ))
+    # keep_connect会一直重连，没有办法优雅地停掉，统计打印完直接退出
+    os._exit(0)
@@ -0,0 +1,37 @@
+"""
+author: thomaszdxsn
+
+单独运行模拟交易所websocket服务(src.mock)，把sdk的ws_url指向打印出来的地址
+
+usage: python -m scripts.mock_exchange huobi [--port 8700] [--rate 5000] [--frames records/huobi-*.frames.gz]
+"""
+import argparse
+import asyncio
+import itertools
+
+from src.mock import MOCK_MAP
+from src.sdk.recorder import read_frames
+
+
+async def main(args):
+    frames = None
+    if args.frames:
+        frames = itertools.chain.from_iterable(map(read_frames, args.frames))
+    server = MOCK_MAP[args.exchange](rate=args.rate, frames=frames)
+    url = await server.start(args.host, args.port)
+    print(f'{args.exchange} mock server: {url}')
+    while True:
+        await asyncio.sleep(10)
+        print(dict(server.stats))
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('exchange', choices=sorted(MOCK_MAP))
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8700)
+    parser.add_argument('--rate', type=float, default=1000,
+                        help='每个连接每秒推送多少条, 0表示尽可能快')
+    parser.add_argument('--frames', nargs='*',
+                        help='推送录制的数据(WS_RECORD_DIR的.frames.gz)')
+    asyncio.get_event_loop().run_until_complete(main(parser.parse_args()))
@@ -0,0 +1,58 @@
+"""
+author: thomaszdxsn
+
+把WS_RECORD_DIR录制的原始消息回放给monitor.dispatch_ws_msg，不需要网络
+
+monitor不会subscribe，只处理消息，数据默认放进NullTunnel(只计数)，
+--tunnel queue使用QueueTunnel(不消费，可以看积压)
+最后打印回放的消息数/耗时/吞吐量和每个key的数据条数
+
+usage: python -m scripts.replay okex_spot records/okex_spot-*.frames.gz [--speed 10|max]
+"""
+import argparse
+import asyncio
+import itertools
+
+from src.monitors import MONITOR_MAP
+from src.scheduler import create_scheduler
+from src.sdk.recorder import read_frames, replay
+from src.tunnels import NullTunnel, QueueTunnel
+
+
+def parse_speed(value: str) -> float:
+    """1: 按录制时的速度, N: 快N倍, max: 不等待"""
+    return 0.0 if value == 'max' else float(value)
+
+
+async def main(exchange: str, paths: list, speed: float, tunnel_type: str):
+    loop = asyncio.get_event_loop()
+    tunnel = NullTunnel() if tunnel_type == 'null' else QueueTunnel()
+    monitor = MONITOR_MAP[exchange](symbols=[],
+                                    scheduler=create_scheduler(loop),
+                                    tunnel=tunnel,
+                                    loop=loop)
+    frames = itertools.chain.from_iterable(map(read_frames, paths))
+    stats = await replay(frames, monitor.dispatch_ws_msg, speed)
+    seconds = stats['seconds'] or 1e-9
+    print(f'frames={stats["frames"]} bytes={stats["bytes"]} '
+          f'errors={stats["errors"]} seconds={seconds:.2f} '
+          f'rate={stats["frames"] / seconds:.0f}/s '
+          f'{stats["bytes"] / seconds / 1e6:.1f}MB/s')
+    if isinstance(tunnel, NullTunnel):
+        counts = tunnel.counts
+    else:
+        counts = {key: tunnel.get_queue(key).qsize() for key in tunnel.keys()}
+    for key, count in sorted(counts.items()):
+        print(f'{key:<40} {count:>10}')
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('exchange', choices=sorted(MONITOR_MAP))
+    parser.add_argument('paths', nargs='+')
+    parser.add_argument('--speed', type=parse_speed, default=0.0)
+    parser.add_argument('--tunnel', choices=('null', 'queue'), default='null')
+    args = parser.parse_args()
+    asyncio.get_event_loop().run_until_complete(
+        main(args.exchange, args.paths, args.speed, args.tunnel)
+    )
@@ -0,0 +1,228 @@
+"""
+author: thomaszdxsn
+
+exchange|data_type|pair的延迟直方图
+
+    receive: 交易所时间戳(event_time/server_created/trade_time) -> created(收到消息、生成数据的时间)
+    write: created -> mongo bulk_write返回(写入是w=0，返回表示已经发出)
+
+直方图是HDR风格的对数-线性分桶: 每个2的幂区间分SUB_BUCKETS/2个等宽的桶，
+相对误差不超过2/SUB_BUCKETS，记录一次只是几次整数运算和一次list下标，
+数值单位是微秒，可以覆盖从1µs到几个小时
+"""
+import dataclasses
+import logging
+from datetime import datetime
+from typing import Dict, Iterable, List, Tuple, Union
+
+from dynaconf import settings
+
+from .schemas.logs import LogMsgFmt
+
+__all__ = (
+    'LatencyHistogram',
+    'LatencyStats',
+    'latency_enabled',
+    'latency_stats',
+)
+
+SUB_BUCKET_BITS = 7
+SUB_BUCKETS = 1 << SUB_BUCKET_BITS      # <128µs精确记录，之后每个2的幂区间64个桶，误差<1.6%
+# 依次尝试的交易所时间字段，第一个是datetime的被使用
+EXCHANGE_TIME_FIELDS = ('event_time', 'server_created', 'trade_time')
+PERCENTILES = (50, 90, 99, 99.9)
+
+# (exchange, data_type, pair)
+Key = Tuple[str, str, str]
+
+
+def bucket_index(value: int) -> int:
+    if value < SUB_BUCKETS:
+        return value
+    shift = value.bit_length() - SUB_BUCKET_BITS
+    return (shift << (SUB_BUCKET_BITS - 1)) + (value >> shift)
+
+
+def bucket_bounds(index: int) -> Tuple[int, int]:
+    """桶的[下限, 上限]"""
+    if index < SUB_BUCKETS:
+        return index, index
+    shift = (index >> (SUB_BUCKET_BITS - 1)) - 1
+    value = index - (shift << (SUB_BUCKET_BITS - 1))
+    return value << shift, ((value + 1) << shift) - 1
+
+
+class LatencyHistogram(object):
+    """
+    记录秒为单位的延迟，负数(时钟偏差)计入negative并按0记录
+    counts按需要增长，只用到几ms的直方图只有几百个桶
+    """
+    __slots__ = ('counts', 'count', 'total', 'max', 'negative')
+
+    def __init__(self):
+        self.counts: List[int] = []
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+        self.negative = 0
+
+    def record(self, seconds: float):
+        # bucket_index内联，每条消息都会调用
+        if seconds < 0:
+            self.negative += 1
+            seconds = 0.0
+        value = int(seconds * 1e6)
+        if value < SUB_BUCKETS:
+            index = value
+        else:
+            shift = value.bit_length() - SUB_BUCKET_BITS
+            index = (shift << (SUB_BUCKET_BITS - 1)) + (value >> shift)
+        try:
+            self.counts[index] += 1
+        except IndexError:
+            self.counts.extend([0] * (index + 1 - len(self.counts)))
+            self.counts[index] += 1
+        self.count += 1
+        self.total += seconds
+        if seconds > self.max:
+            self.max = seconds
+
+    def percentile(self, q: float) -> float:
+        """第q百分位的值(s)，取所在桶的上限"""
+        if not self.count:
+            return 0.0
+        rank = max(1, int(round(self.count * q / 100)))
+        seen = 0
+        for index, n in enumerate(self.counts):
+            seen += n
+            if seen >= rank:
+                return min(bucket_bounds(index)[1] / 1e6, self.max)
+        return self.max
+
+    @property
+    def mean(self) -> float:
+        return self.total / self.count if self.count else 0.0
+
+    def merge(self, other: 'LatencyHistogram'):
+        if len(other.counts) > len(self.counts):
+            self.counts.extend([0] * (len(other.counts) - len(self.counts)))
+        for index, n in enumerate(other.counts):
+            self.counts[index] += n
+        self.count += other.count
+        self.total += other.total
+        self.max = max(self.max, other.max)
+        self.negative += other.negative
+
+    def reset(self):
+        self.counts = []
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+        self.negative = 0
+
+    def summary(self) -> dict:
+        """count/mean/p50/p90/p99/p99.9/max，时间单位是ms"""
+        data = {'count': self.count,
+                'mean': round(self.mean * 1e3, 3)}
+        for q in PERCENTILES:
+            data[f'p{q:g}'] = round(self.percentile(q) * 1e3, 3)
+        data['max'] = round(self.max * 1e3, 3)
+        if self.negative:
+            data['negative'] = self.negative
+        return data
+
+
+class LatencyStats(object):
+    """
+    一个进程里所有monitor和MongoStorage共用一个实例(latency_stats)
+    key是(exchange, data_type, pair)元组，不在每条消息上拼接字符串
+    """
+
+    def __init__(self):
+        self.logger = logging.getLogger('latency')
+        self.receive: Dict[Key, LatencyHistogram] = {}
+        self.write: Dict[Key, LatencyHistogram] = {}
+        self._time_fields: Dict[type, Tuple[str, ...]] = {}
+        self.exported: List[dict] = []      # 最近一次export的结果
+
+    def histogram(self, stage: str, key: Key) -> LatencyHistogram:
+        histograms = getattr(self, stage)
+        hist = histograms.get(key)
+        if hist is None:
+            hist = histograms[key] = LatencyHistogram()
+        return hist
+
+    def exchange_time(self, data) -> Union[datetime, None]:
+        cls = type(data)
+        fields = self._time_fields.get(cls)
+        if fields is None:
+            names = {f.name for f in dataclasses.fields(cls)}
+            fields = self._time_fields[cls] = tuple(
+                name for name in EXCHANGE_TIME_FIELDS if name in names
+            )
+        for name in fields:
+            value = getattr(data, name)
+            if value.__class__ is datetime:
+                return value
+        return None
+
+    def observe_receive(self, exchange: str, data_type: str, data):
+        """没有交易所时间或者created的数据不记录"""
+        exchange_time = self.exchange_time(data)
+        if exchange_time is None:
+            return
+        created = getattr(data, 'created', None)
+        if created is None:
+            return
+        key = (exchange, data_type, getattr(data, 'pair', ''))
+        hist = self.receive.get(key)
+        if hist is None:
+            hist = self.histogram('receive', key)
+        hist.record((created - exchange_time).total_seconds())
+
+    def observe_write(self, items: Iterable, now: datetime=None):
+        """一个batch写入完成之后调用，items是ExchangeItem"""
+        if now is None:
+            now = datetime.utcnow()
+        for item in items:
+            data = item.data
+            created = getattr(data, 'created', None)
+            if created is None:
+                continue
+            key = (item.exchange, item.data_type, getattr(data, 'pair', ''))
+            self.histogram('write', key).record(
+                (now - created).total_seconds()
+            )
+
+    def export(self, reset: bool=True) -> List[dict]:
+        """
+        每个key每个阶段一条记录，reset=True时之后重新统计(每个导出周期的分布)
+        """
+        records = []
+        for stage in ('receive', 'write'):
+            for key, hist in getattr(self, stage).items():
+                if not hist.count:
+                    continue
+                record = {'key': '|'.join(key), 'stage': stage}
+                record.update(hist.summary())
+                records.append(record)
+                if reset:
+                    hist.reset()
+        self.exported = records
+        return records
+
+    def log_stats(self):
+        for record in self.export():
+            msg = LogMsgFmt.LATENCY_STATS.value.format(
+                key=record.pop('key'),
+                stage=record.pop('stage'),
+                stats=record
+            )
+            self.logger.info(msg)
+
+
+def latency_enabled() -> bool:
+    return float(settings.get('LATENCY_EXPORT_INTERVAL', 0) or 0) > 0
+
+
+latency_stats = LatencyStats()
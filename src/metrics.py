@@ -0,0 +1,365 @@
+"""
+author: thomaszdxsn
+
+Prometheus文本格式的metrics，每个进程一个可选的HTTP端点(METRICS_SERVER)
+
+热路径上只有预先绑定好label的Counter:
+    counter = metrics.counter('marketking_ws_messages_total', '...', exchange='huobi')
+    counter.inc()       # 一次属性加法，不格式化label
+其他数据(queue积压、mongo batch、重连次数、orderbook数量、延迟直方图...)都是
+抓取的时候由collector从各个对象已有的stats里读出来
+
+usage:
+    curl http://127.0.0.1:9100/metrics
+"""
+import asyncio
+import collections
+import logging
+import time
+import weakref
+from typing import Callable, Dict, Iterable, List, Tuple, Union
+
+from aiohttp import web
+
+from .latency import latency_stats
+from .schemas.sdk import DOWNTIME_BUCKETS
+from .storage.batching import BATCH_SIZE_BUCKETS
+from .tunnels.server import parse_address
+
+__all__ = (
+    'Sample',
+    'Counter',
+    'MetricsRegistry',
+    'MetricsServer',
+    'LoopLagMonitor',
+    'metrics',
+    'collect_monitor',
+    'collect_tunnel',
+    'collect_storage',
+    'collect_writer_pool',
+    'collect_latency',
+)
+
+COUNTER = 'counter'
+GAUGE = 'gauge'
+HISTOGRAM = 'histogram'
+CONTENT_TYPE = 'text/plain; version=0.0.4'
+
+# (name, type, help, labels, value)
+Sample = Tuple[str, str, str, Dict[str, str], float]
+
+
+def format_labels(labels: Dict[str, str]) -> str:
+    if not labels:
+        return ''
+    pairs = ','.join(
+        '{}="{}"'.format(
+            key,
+            str(value).replace('\\', r'\\').replace('\n', r'\n')
+                      .replace('"', r'\"')
+        )
+        for key, value in labels.items()
+    )
+    return '{' + pairs + '}'
+
+
+def format_value(value: float) -> str:
+    if value == float('inf'):
+        return '+Inf'
+    if isinstance(value, int) or float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+
+class Counter(object):
+    """label在创建的时候就格式化好，inc()只是一次加法"""
+    __slots__ = ('value',)
+
+    def __init__(self):
+        self.value = 0
+
+    def inc(self, n: int=1):
+        self.value += n
+
+
+class MetricsRegistry(object):
+
+    def __init__(self):
+        self.logger = logging.getLogger('metrics')
+        # name -> (help, {formatted labels -> Counter})
+        self._counters: Dict[str, Tuple[str, Dict[str, Counter]]] = {}
+        # 返回collector的弱引用或者闭包
+        self._collectors: List[Callable[[], Union[Callable, None]]] = []
+
+    def counter(self, name: str, help: str, **labels) -> Counter:
+        """同样的name和labels返回同一个Counter"""
+        _, counters = self._counters.setdefault(name, (help, {}))
+        key = format_labels(labels)
+        counter = counters.get(key)
+        if counter is None:
+            counter = counters[key] = Counter()
+        return counter
+
+    def add_collector(self, collector: Callable[[], Iterable[Sample]]):
+        """
+        collector()在每次抓取的时候调用，返回Sample
+        绑定方法只保持弱引用，对象(monitor/storage...)被回收之后自动移除
+        """
+        if hasattr(collector, '__self__'):
+            self._collectors.append(weakref.WeakMethod(collector))
+        else:
+            self._collectors.append(lambda: collector)
+
+    def collect(self) -> Iterable[Sample]:
+        for name, (help_, counters) in self._counters.items():
+            for labels, counter in counters.items():
+                yield name, COUNTER, help_, labels, counter.value
+        alive = []
+        for ref in self._collectors:
+            collector = ref()
+            if collector is None:
+                continue
+            alive.append(ref)
+            try:
+                yield from collector()
+            except Exception as exc:
+                self.logger.error(f'metrics|collector failed|{exc!r}')
+        self._collectors = alive
+
+    def render(self) -> str:
+        """
+        Prometheus text exposition format，同一个metric的sample放在一起
+        histogram的_bucket/_sum/_count属于同一个metric
+        """
+        families = collections.OrderedDict()
+        for name, type_, help_, labels, value in self.collect():
+            if not isinstance(labels, str):
+                labels = format_labels(labels)
+            family = name
+            if type_ == HISTOGRAM:
+                family = name.rsplit('_', 1)[0]
+            entry = families.get(family)
+            if entry is None:
+                entry = families[family] = (type_, help_, [])
+            entry[2].append(f'{name}{labels} {format_value(value)}')
+        lines = []
+        for family, (type_, help_, samples) in families.items():
+            lines.append(f'# HELP {family} {help_}')
+            lines.append(f'# TYPE {family} {type_}')
+            lines.extend(samples)
+        return '\n'.join(lines) + '\n'
+
+
+def histogram_samples(name: str,
+                      help_: str,
+                      labels: Dict[str, str],
+                      bounds: Iterable[float],
+                      counts: Iterable[int],
+                      total: float) -> Iterable[Sample]:
+    """counts是每个桶(不累加)的数量，最后一个是+Inf"""
+    cumulative = 0
+    for bound, n in zip(list(bounds) + [float('inf')], counts):
+        cumulative += n
+        yield (f'{name}_bucket', HISTOGRAM, help_,
+               dict(labels, le=format_value(bound)), cumulative)
+    yield f'{name}_sum', HISTOGRAM, help_, labels, total
+    yield f'{name}_count', HISTOGRAM, help_, labels, cumulative
+
+
+def collect_monitor(monitor) -> Iterable[Sample]:
+    """重连次数/停机时间/未确认channel(每个websocket分片一组)和本地orderbook数量"""
+    labels = {'exchange': monitor.exchange}
+    yield ('marketking_orderbooks', GAUGE,
+           'orderbooks maintained in memory', labels,
+           monitor.orderbook_count())
+    if monitor.ws_sdk is None:
+        return
+    shards = getattr(monitor.ws_sdk, 'shards', None) or [monitor.ws_sdk]
+    for shard in shards:
+        stats = shard.connection_stats
+        shard_labels = dict(labels, shard=str(shard.shard_index or 0))
+        yield ('marketking_ws_reconnects_total', COUNTER,
+               'websocket reconnects', shard_labels, stats.reconnects)
+        yield ('marketking_ws_decode_errors_total', COUNTER,
+               'websocket messages that failed to inflate or decode',
+               shard_labels, stats.decode_errors)
+        yield ('marketking_ws_unacked_channels', GAUGE,
+               'channels not acked after the last subscribe', shard_labels,
+               stats.unacked)
+        yield from histogram_samples(
+            'marketking_ws_downtime_seconds',
+            'disconnect -> resubscribed', shard_labels,
+            DOWNTIME_BUCKETS, stats.downtimes, stats.downtime_total
+        )
+
+
+def collect_tunnel(tunnel) -> Iterable[Sample]:
+    """
+    每个key的queue积压和溢出策略计数，FanoutTunnel的订阅者断开次数
+    共享内存tunnel在采集进程里没有本地queue，只有写入缓冲区时的溢出计数
+    """
+    disconnected = getattr(tunnel, 'disconnected', None)
+    if disconnected is not None:
+        for reason, n in disconnected.items():
+            yield ('marketking_fanout_disconnected_total', COUNTER,
+                   'fanout subscribers disconnected', {'reason': reason}, n)
+        yield ('marketking_fanout_subscribers', GAUGE,
+               'fanout subscribers', {}, len(tunnel.subscriptions))
+        tunnel = tunnel.tunnel
+    try:
+        keys = tunnel.keys()
+    except RuntimeError:
+        keys = []
+    for key in keys:
+        exchange, data_type = key.split('|', 1)
+        labels = {'exchange': exchange, 'data_type': data_type}
+        yield ('marketking_tunnel_queue_depth', GAUGE,
+               'items waiting in the tunnel queue', labels,
+               tunnel.get_queue(key).qsize())
+        spilled_count = getattr(tunnel, 'spilled_count', None)
+        if spilled_count is not None:
+            yield ('marketking_tunnel_spilled_items', GAUGE,
+                   'items spilled to disk', labels, spilled_count(key))
+    stats = getattr(tunnel, 'stats', None)
+    if stats is None:
+        return
+    for key, counts in stats().items():
+        exchange, data_type = key.split('|', 1)
+        for event, n in counts.items():
+            yield ('marketking_tunnel_overflow_total', COUNTER,
+                   'bounded queue overflow events',
+                   {'exchange': exchange, 'data_type': data_type,
+                    'event': event}, n)
+
+
+def collect_storage(storage) -> Iterable[Sample]:
+    """每个collection的batch大小直方图、flush原因、写入耗时，写入优先级类别的名额"""
+    for collection, stats in storage.batch_stats.items():
+        labels = {'collection': collection}
+        yield from histogram_samples(
+            'marketking_mongo_batch_size', 'items per bulk_write', labels,
+            BATCH_SIZE_BUCKETS, stats.batch_sizes, stats.items
+        )
+        for reason, n in stats.flush_reasons.items():
+            yield ('marketking_mongo_flushes_total', COUNTER,
+                   'batch flushes by reason',
+                   dict(labels, reason=reason), n)
+        yield ('marketking_mongo_write_seconds_total', COUNTER,
+               'time spent in bulk_write', labels, stats.write_seconds)
+        yield ('marketking_mongo_writes_total', COUNTER,
+               'bulk_write calls', labels, stats.writes)
+        if stats.write_latency is not None:
+            yield ('marketking_mongo_write_latency_seconds', GAUGE,
+                   'bulk_write latency (moving average)', labels,
+                   stats.write_latency)
+    for name, stats in storage.write_scheduler.stats().items():
+        labels = {'priority_class': name}
+        for field in ('in_use', 'waiting'):
+            yield (f'marketking_mongo_slots_{field}', GAUGE,
+                   f'write slots {field}', labels, stats[field])
+        for field in ('acquired', 'waited', 'late'):
+            yield (f'marketking_mongo_slots_{field}_total', COUNTER,
+                   f'write slots {field}', labels, stats[field])
+
+
+def collect_writer_pool(pool) -> Iterable[Sample]:
+    for key in pool.tunnel.keys():
+        exchange, data_type = key.split('|', 1)
+        yield ('marketking_mongo_workers', GAUGE, 'writer workers per key',
+               {'exchange': exchange, 'data_type': data_type},
+               pool.worker_count(key))
+
+
+def collect_latency() -> Iterable[Sample]:
+    """最近一个LATENCY_EXPORT_INTERVAL周期的延迟分位数(见src.latency)"""
+    for record in latency_stats.exported:
+        exchange, data_type, pair = record['key'].split('|', 2)
+        labels = {'exchange': exchange, 'data_type': data_type, 'pair': pair,
+                  'stage': record['stage']}
+        for q in ('p50', 'p90', 'p99', 'p99.9'):
+            yield ('marketking_latency_seconds', GAUGE,
+                   'exchange -> receive / receive -> mongo latency',
+                   dict(labels, quantile=str(float(q[1:]) / 100)),
+                   record[q] / 1e3)
+        yield ('marketking_latency_max_seconds', GAUGE,
+               'max latency in the last export interval', labels,
+               record['max'] / 1e3)
+
+
+class LoopLagMonitor(object):
+    """每interval秒sleep一次，实际醒来的时间比预期晚多少就是event loop的延迟"""
+
+    def __init__(self, interval: float=0.5):
+        self.interval = interval
+        self.last = 0.0
+        self.max = 0.0
+        self.total = 0.0
+        self.samples = 0
+        self._task = None
+
+    def start(self):
+        self._task = asyncio.ensure_future(self._run())
+
+    def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+
+    async def _run(self):
+        while True:
+            start = time.monotonic()
+            await asyncio.sleep(self.interval)
+            lag = max(0.0, time.monotonic() - start - self.interval)
+            self.last = lag
+            self.max = max(self.max, lag)
+            self.total += lag
+            self.samples += 1
+
+    def collect(self) -> Iterable[Sample]:
+        yield ('marketking_event_loop_lag_seconds', GAUGE,
+               'event loop lag of the last sample', {}, self.last)
+        yield ('marketking_event_loop_lag_max_seconds', GAUGE,
+               'max event loop lag since start', {}, self.max)
+        yield ('marketking_event_loop_lag_seconds_total', COUNTER,
+               'sum of sampled event loop lag', {}, self.total)
+        yield ('marketking_event_loop_lag_samples_total', COUNTER,
+               'event loop lag samples', {}, self.samples)
+
+
+class MetricsServer(object):
+    """GET /metrics, address是'host:port'"""
+
+    def __init__(self,
+                 registry: MetricsRegistry,
+                 address: str,
+                 lag_interval: float=0.5):
+        self.registry = registry
+        self.address = address
+        self.logger = logging.getLogger(f'metrics.{self.__class__.__name__}')
+        self.loop_lag = LoopLagMonitor(lag_interval)
+        self._runner = None
+
+    async def handle(self, request: web.Request) -> web.Response:
+        body = self.registry.render()
+        return web.Response(body=body.encode(),
+                            headers={'Content-Type': CONTENT_TYPE})
+
+    async def start(self):
+        kwargs = parse_address(self.address)
+        app = web.Application()
+        app.router.add_get('/metrics', self.handle)
+        self._runner = web.AppRunner(app)
+        await self._runner.setup()
+        site = web.TCPSite(self._runner, kwargs.get('host'), kwargs.get('port'))
+        await site.start()
+        self.loop_lag.start()
+        self.registry.add_collector(self.loop_lag.collect)
+        self.logger.info(f'metrics server listening on {self.address}')
+
+    async def stop(self):
+        self.loop_lag.stop()
+        if self._runner is not None:
+            await self._runner.cleanup()
+
+
+metrics = MetricsRegistry()
+metrics.add_collector(collect_latency)
@@ -0,0 +1,215 @@
+"""
+author: thomaszdxsn
+
+本地的模拟交易所websocket服务，用来离线做端到端压测
+
+每个交易所实现自己的订阅/确认/心跳协议(bitfinex chanId, poloniex数字channel,
+huobi gzip ping/pong, okex deflate)，订阅之后按rate(条/秒, 每个连接)推送:
+    - 合成数据: 每个channel有自己的生成器，数据结构和真实交易所一致，monitor可以正常处理
+    - 录制数据: frames(sdk.recorder.read_frames)原样循环推送
+
+    server = HuobiMock(rate=5000)
+    url = await server.start()
+    monitor.ws_sdk.ws_url = url
+"""
+import asyncio
+import collections
+import json
+import logging
+import random
+from abc import ABC, abstractmethod
+from typing import Any, Iterable, List, Union
+
+from aiohttp import web, WSMsgType
+
+from ..sdk.recorder import Frame
+
+
+class MockChannel(object):
+    """一个订阅: name是交易所的channel标识，kind是数据类型"""
+
+    def __init__(self, name: Any, kind: str, pair: str, **extra):
+        self.name = name
+        self.kind = kind
+        self.pair = pair
+        self.extra = extra
+        self.sequence = 0
+
+
+class MockConnection(object):
+
+    def __init__(self, ws: web.WebSocketResponse):
+        self.ws = ws
+        self.channels: List[MockChannel] = []
+        self.subscribed = asyncio.Event()
+        self.state = dict()
+        self._cursor = 0
+
+    def add_channel(self, channel: MockChannel):
+        self.channels.append(channel)
+        self.subscribed.set()
+
+    def next_channel(self) -> MockChannel:
+        """所有channel轮流推送"""
+        self._cursor = (self._cursor + 1) % len(self.channels)
+        return self.channels[self._cursor]
+
+
+class MockExchange(ABC):
+    """
+    rate: 每个连接每秒推送多少条数据，0表示尽可能快，运行中可以修改
+    frames: 不为None的时候推送录制的数据，而不是合成数据
+    heartbeat: 心跳间隔(s)
+    stats: connections/subscribed/sent/bytes/pongs计数
+    """
+    exchange: str
+    heartbeat: float = 5
+
+    def __init__(self,
+                 rate: float=100,
+                 frames: Union[Iterable[Frame], None]=None,
+                 heartbeat: Union[float, None]=None,
+                 seed: int=0):
+        self.rate = rate
+        self.frames = None
+        if frames is not None:
+            self.frames = [f for f in frames if self.replayable(f)]
+        if heartbeat is not None:
+            self.heartbeat = heartbeat
+        self.connections: List[MockConnection] = []
+        self.stats = collections.Counter()
+        self.random = random.Random(seed)
+        self._prices = dict()
+        self.logger = logging.getLogger(f'mock.{self.__class__.__name__}')
+        self._runner = None
+
+    def create_app(self) -> web.Application:
+        app = web.Application()
+        app.router.add_get('/ws', self.handle)
+        return app
+
+    async def start(self, host: str='127.0.0.1', port: int=0) -> str:
+        """返回ws_url, port=0时随机选择一个端口"""
+        self._runner = web.AppRunner(self.create_app())
+        await self._runner.setup()
+        site = web.TCPSite(self._runner, host, port)
+        await site.start()
+        port = site._server.sockets[0].getsockname()[1]
+        return f'ws://{host}:{port}/ws'
+
+    async def stop(self):
+        for conn in self.connections:
+            await conn.ws.close()
+        if self._runner is not None:
+            await self._runner.cleanup()
+
+    async def handle(self, request: web.Request) -> web.WebSocketResponse:
+        ws = web.WebSocketResponse()
+        await ws.prepare(request)
+        conn = MockConnection(ws)
+        self.connections.append(conn)
+        self.stats['connections'] += 1
+        tasks = [asyncio.ensure_future(self._stream(conn)),
+                 asyncio.ensure_future(self._keep_heartbeat(conn))]
+        try:
+            await self.on_connect(conn)
+            async for msg in ws:
+                if msg.type == WSMsgType.TEXT:
+                    await self.on_message(conn, json.loads(msg.data))
+                elif msg.type == WSMsgType.BINARY:
+                    await self.on_message(conn, json.loads(msg.data.decode()))
+        finally:
+            for task in tasks:
+                task.cancel()
+            self.connections.remove(conn)
+        return ws
+
+    def encode(self, data: Any) -> Union[str, bytes]:
+        """交易所的消息格式，比如okex的deflate和huobi的gzip"""
+        return json.dumps(data)
+
+    async def send(self, conn: MockConnection, data: Any):
+        await self.send_raw(conn, self.encode(data))
+
+    async def send_raw(self, conn: MockConnection, payload: Union[str, bytes]):
+        if isinstance(payload, str):
+            await conn.ws.send_str(payload)
+        else:
+            await conn.ws.send_bytes(payload)
+        self.stats['sent'] += 1
+        self.stats['bytes'] += len(payload)
+
+    async def _stream(self, conn: MockConnection):
+        await conn.subscribed.wait()
+        loop = asyncio.get_event_loop()
+        rate, started, sent = self.rate, loop.time(), 0
+        frames = iter(())
+        while not conn.ws.closed:
+            if self.rate != rate:
+                # 运行中修改了rate
+                rate, started, sent = self.rate, loop.time(), 0
+            if self.rate > 0:
+                due = int((loop.time() - started) * self.rate) - sent
+                if due <= 0:
+                    await asyncio.sleep(min(1 / self.rate, 0.01))
+                    continue
+            else:
+                due = 100
+            for _ in range(due):
+                if self.frames is not None:
+                    frame = next(frames, None)
+                    if frame is None:
+                        frames = iter(self.frames)
+                        frame = next(frames)
+                    await self.send_raw(conn, frame.data)
+                else:
+                    channel = conn.next_channel()
+                    channel.sequence += 1
+                    await self.send(conn, self.generate(conn, channel))
+            sent += due
+            if self.rate <= 0:
+                await asyncio.sleep(0)
+
+    async def _keep_heartbeat(self, conn: MockConnection):
+        while not conn.ws.closed:
+            await asyncio.sleep(self.heartbeat)
+            await self.send_heartbeat(conn)
+
+    def replayable(self, frame: Frame) -> bool:
+        """录制的数据里哪些可以推送(订阅确认之类的消息由协议处理)"""
+        return True
+
+    async def on_connect(self, conn: MockConnection):
+        pass
+
+    async def send_heartbeat(self, conn: MockConnection):
+        pass
+
+    @abstractmethod
+    async def on_message(self, conn: MockConnection, data: Any):
+        """处理客户端的订阅/pong等消息"""
+
+    @abstractmethod
+    def generate(self, conn: MockConnection, channel: MockChannel) -> Any:
+        """channel的下一条合成数据"""
+
+    def price(self, pair: str) -> float:
+        """围绕一个固定价格随机游走"""
+        price = self._prices.get(pair, 100.0 + len(self._prices) * 10)
+        price = max(1.0, price + self.random.uniform(-0.05, 0.05))
+        self._prices[pair] = price
+        return round(price, 4)
+
+
+from .bitfinex import *
+from .huobi import *
+from .okex import *
+from .poloniex import *
+
+MOCK_MAP = {
+    'bitfinex': BitfinexMock,
+    'huobi': HuobiMock,
+    'okex_spot': OkexSpotMock,
+    'okex_future': OkexFutureMock,
+    'poloniex': PoloniexMock,
+}
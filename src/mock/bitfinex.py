@@ -0,0 +1,138 @@
+"""
+author: thomaszdxsn
+"""
+import json
+import time
+from typing import Any
+
+from . import MockChannel, MockConnection, MockExchange
+from ..sdk.recorder import Frame
+from ..schemas.markets import BitfinexFundingOrderbook, BitfinexTradeOrderbook
+
+__all__ = (
+    'BitfinexMock',
+)
+
+FLAG_CHECKSUM = 131072
+KINDS = {
+    'ticker': 'ticker',
+    'trades': 'trades',
+    'candles': 'kline',
+    'book': 'depth',
+}
+
+
+class BitfinexMock(MockExchange):
+    """
+    连接之后发送{'event': 'info', 'version': 2}，
+    订阅成功返回{'event': 'subscribed', 'chanId'}，之后的数据都是[chanId, ...]，
+    每个连接最多max_channels个channel，每heartbeat秒每个channel一条[chanId, 'hb']，
+    conf开启checksum之后book channel每次更新之后推送[chanId, 'cs', checksum]
+    f开头的是funding，数据格式和trade不一样
+    """
+    exchange = 'bitfinex'
+    heartbeat = 15
+    max_channels = 30
+
+    def __init__(self, *args, **kwargs):
+        self._recorded_ids = dict()
+        super(BitfinexMock, self).__init__(*args, **kwargs)
+
+    def replayable(self, frame: Frame) -> bool:
+        """录制数据里的chanId按订阅的(channel, symbol|key)分配给新的订阅"""
+        data = json.loads(frame.data)
+        if isinstance(data, dict):
+            if data.get('event') == 'subscribed':
+                key = (data['channel'], data.get('key') or data.get('symbol'))
+                self._recorded_ids[key] = data['chanId']
+            return False
+        return True
+
+    async def on_connect(self, conn: MockConnection):
+        conn.state['chan_id'] = 0
+        await self.send(conn, {'event': 'info', 'version': 2})
+
+    async def send_heartbeat(self, conn: MockConnection):
+        for channel in list(conn.channels):
+            await self.send(conn, [channel.name, 'hb'])
+
+    async def on_message(self, conn: MockConnection, data: dict):
+        event = data.get('event')
+        if event == 'conf':
+            conn.state['flags'] = data.get('flags', 0)
+            await self.send(conn, {'event': 'conf', 'status': 'OK',
+                                   'flags': conn.state['flags']})
+        elif event == 'ping':
+            self.stats['pongs'] += 1
+            await self.send(conn, {'event': 'pong', 'cid': data.get('cid')})
+        elif event == 'subscribe':
+            await self._subscribe(conn, data)
+
+    async def _subscribe(self, conn: MockConnection, data: dict):
+        name = data.get('channel')
+        symbol = data.get('key') or data.get('symbol') or ''
+        kind = KINDS.get(name)
+        if kind is None or len(conn.channels) >= self.max_channels:
+            await self.send(conn, {
+                'event': 'error',
+                'msg': 'subscribe: limit' if kind else 'channel: unknown',
+                'code': 10305 if kind else 10300,
+                'channel': name,
+                'symbol': symbol
+            })
+            return
+        conn.state['chan_id'] += 1
+        chan_id = self._recorded_ids.get((name, symbol), conn.state['chan_id'])
+        reply = {'event': 'subscribed', 'channel': name, 'chanId': chan_id}
+        reply['key' if 'key' in data else 'symbol'] = symbol
+        await self.send(conn, reply)
+        pair = symbol.split(':')[-1]
+        channel = MockChannel(chan_id, kind, pair)
+        conn.add_channel(channel)
+        self.stats['subscribed'] += 1
+        if kind == 'depth' and self.frames is None:
+            price = self.price(pair)
+            if pair.startswith('f'):
+                book = BitfinexFundingOrderbook(pair)
+                levels = [[round(price - 0.1 * (i + 1), 1), 2, 1, side]
+                          for i in range(25) for side in (1.0, -1.0)]
+            else:
+                book = BitfinexTradeOrderbook(pair)
+                levels = [[round(price - 0.1 * (i + 1), 1), 1, 1.0]
+                          for i in range(25)]
+                levels += [[round(price + 0.1 * (i + 1), 1), 1, -1.0]
+                           for i in range(25)]
+            book.initialize(levels)
+            channel.extra['book'] = book
+            await self.send(conn, [chan_id, levels])
+
+    def generate(self, conn: MockConnection, channel: MockChannel) -> list:
+        price = self.price(channel.pair)
+        if channel.kind == 'depth':
+            book = channel.extra['book']
+            checksum = conn.state.get('flags', 0) & FLAG_CHECKSUM
+            if checksum and channel.sequence % 2 == 0:
+                return [channel.name, 'cs', book.checksum()]
+            side = self.random.choice((1, -1))
+            level = round(price - side * 0.1 * self.random.randint(1, 30), 1)
+            count = self.random.choice((0, 1, 2))
+            amount = side * round(self.random.uniform(0.1, 5), 4)
+            item = [level, count, amount if count else float(side)]
+            if channel.pair.startswith('f'):
+                item.insert(1, 2)
+            book.update(item)
+            return [channel.name, item]
+        if channel.kind == 'trades':
+            amount = round(self.random.uniform(-2, 2), 4) or 0.01
+            item = [channel.sequence, int(time.time() * 1000), amount, price]
+            if channel.pair.startswith('f'):
+                item.append(2)
+            return [channel.name, 'te', item]
+        if channel.kind == 'kline':
+            return [channel.name, [int(time.time()) // 60 * 60000, price,
+                                   price, price + 1, price - 1, 100.0]]
+        ticker = [price - 0.1, 10.0, price + 0.1, 10.0, 1.0, 0.01, price,
+                  10000.0, price + 5, price - 5]
+        if channel.pair.startswith('f'):
+            ticker = [price, price - 0.1, 2, 10.0, price + 0.1, 2] + ticker[3:]
+        return [channel.name, ticker]
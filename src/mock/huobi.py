@@ -0,0 +1,110 @@
+"""
+author: thomaszdxsn
+"""
+import json
+import time
+import zlib
+from typing import Any
+
+from . import MockChannel, MockConnection, MockExchange
+from ..schemas.regexes import HUOBI_WS_CHANS
+from ..utils import GZIP_WBITS
+
+__all__ = (
+    'HuobiMock',
+)
+
+KINDS = {
+    'detail': 'ticker',
+    'kline': 'kline',
+    'trade': 'trades',
+    'depth': 'depth',
+}
+
+
+class HuobiMock(MockExchange):
+    """
+    gzip压缩的消息，服务端每heartbeat秒发送{'ping': ts}，
+    客户端需要回复{'pong': ts}，连续max_missed_pongs次没有回复就断开连接
+    """
+    exchange = 'huobi'
+    heartbeat = 5
+    max_missed_pongs = 2
+
+    def encode(self, data: Any) -> bytes:
+        compressor = zlib.compressobj(wbits=GZIP_WBITS)
+        return compressor.compress(json.dumps(data).encode()) + \
+            compressor.flush()
+
+    async def send_heartbeat(self, conn: MockConnection):
+        missed = conn.state.get('missed_pongs', 0)
+        if missed >= self.max_missed_pongs:
+            await conn.ws.close()
+            return
+        conn.state['missed_pongs'] = missed + 1
+        await self.send(conn, {'ping': int(time.time() * 1000)})
+
+    async def on_message(self, conn: MockConnection, data: dict):
+        if 'pong' in data:
+            conn.state['missed_pongs'] = 0
+            self.stats['pongs'] += 1
+            return
+        sub = data.get('sub')
+        if sub is None:
+            return
+        match = HUOBI_WS_CHANS.match(sub)
+        kind = KINDS.get(match.group('data_type')) if match else None
+        if kind is None:
+            await self.send(conn, {
+                'id': data.get('id'),
+                'status': 'error',
+                'err-code': 'bad-request',
+                'err-msg': f'invalid topic {sub}',
+                'ts': int(time.time() * 1000)
+            })
+            return
+        await self.send(conn, {
+            'id': data.get('id'),
+            'status': 'ok',
+            'subbed': sub,
+            'ts': int(time.time() * 1000)
+        })
+        conn.add_channel(MockChannel(sub, kind, match.group('symbol')))
+        self.stats['subscribed'] += 1
+
+    def generate(self, conn: MockConnection, channel: MockChannel) -> dict:
+        now = int(time.time() * 1000)
+        price = self.price(channel.pair)
+        if channel.kind == 'depth':
+            tick = {
+                'bids': [[round(price - 0.01 * (i + 1), 4),
+                          round(self.random.uniform(0.1, 5), 4)]
+                         for i in range(150)],
+                'asks': [[round(price + 0.01 * (i + 1), 4),
+                          round(self.random.uniform(0.1, 5), 4)]
+                         for i in range(150)],
+                'ts': now,
+                'version': channel.sequence
+            }
+        elif channel.kind == 'trades':
+            tick = {
+                'id': channel.sequence,
+                'ts': now,
+                'data': [{
+                    'amount': round(self.random.uniform(0.01, 2), 4),
+                    'ts': now,
+                    'id': channel.sequence * 100 + i,
+                    'price': price,
+                    'direction': self.random.choice(('buy', 'sell'))
+                } for i in range(self.random.randint(1, 3))]
+            }
+        else:
+            tick = {
+                'id': now // 60000 * 60 if channel.kind == 'kline'
+                else channel.sequence,
+                'open': price, 'close': price,
+                'high': price + 1, 'low': price - 1,
+                'amount': 1000.0, 'vol': 100000.0,
+                'count': channel.sequence
+            }
+        return {'ch': channel.name, 'ts': now, 'tick': tick}
@@ -0,0 +1,158 @@
+"""
+author: thomaszdxsn
+"""
+import json
+import time
+import zlib
+from datetime import datetime
+from typing import Any
+
+from . import MockChannel, MockConnection, MockExchange
+from ..schemas.regexes import OKEX_SPOT_WS_CHANS, OKEX_FUTURE_WS_CHANS
+from ..utils import OKEX_WBITS
+
+__all__ = (
+    'OkexSpotMock',
+    'OkexFutureMock',
+)
+
+
+class OkexMock(MockExchange):
+    """
+    v1 websocket: 所有消息都是raw deflate压缩，
+    订阅{'event': 'addChannel', 'channel'} -> [{'channel': 'addChannel', 'data': {'result': true, 'channel'}}]
+    心跳由客户端发起: {'event': 'ping'} -> {'event': 'pong'}
+    """
+
+    def encode(self, data: Any) -> bytes:
+        compressor = zlib.compressobj(wbits=OKEX_WBITS)
+        return compressor.compress(json.dumps(data).encode()) + \
+            compressor.flush()
+
+    def parse_channel(self, name: str) -> MockChannel:
+        raise NotImplementedError()
+
+    async def on_message(self, conn: MockConnection, data: dict):
+        event = data.get('event')
+        if event == 'ping':
+            self.stats['pongs'] += 1
+            await self.send(conn, {'event': 'pong'})
+        elif event == 'addChannel':
+            name = data.get('channel', '')
+            channel = self.parse_channel(name)
+            if channel is None:
+                await self.send(conn, [{
+                    'channel': 'addChannel',
+                    'data': {'result': False, 'error_code': 20116}
+                }])
+                return
+            await self.send(conn, [{
+                'channel': 'addChannel',
+                'data': {'result': True, 'channel': name}
+            }])
+            conn.add_channel(channel)
+            self.stats['subscribed'] += 1
+
+    def _trades(self, channel: MockChannel) -> list:
+        price = self.price(channel.pair)
+        return [[str(channel.sequence * 10 + i), f'{price:.4f}',
+                 f'{self.random.uniform(0.01, 2):.4f}',
+                 datetime.now().strftime('%H:%M:%S'),
+                 self.random.choice(('bid', 'ask'))]
+                for i in range(self.random.randint(1, 3))]
+
+    def _depth(self, channel: MockChannel, fields: int) -> dict:
+        price = self.price(channel.pair)
+
+        def level(p):
+            return [f'{p:.4f}'] + [
+                f'{self.random.uniform(0.1, 5):.4f}' for _ in range(fields - 1)
+            ]
+
+        return {
+            # asks从高到低
+            'asks': [level(price + 0.01 * (20 - i)) for i in range(20)],
+            'bids': [level(price - 0.01 * (i + 1)) for i in range(20)],
+            'timestamp': int(time.time() * 1000)
+        }
+
+
+class OkexSpotMock(OkexMock):
+    exchange = 'okex_spot'
+
+    def parse_channel(self, name: str):
+        match = OKEX_SPOT_WS_CHANS.match(name)
+        if match is None:
+            return None
+        data_type = match.group('data_type')
+        if data_type == 'ticker':
+            kind = 'ticker'
+        elif 'depth' in data_type:
+            kind = 'depth'
+        elif data_type == 'deals':
+            kind = 'trades'
+        else:
+            kind = 'kline'
+        return MockChannel(name, kind,
+                           f"{match.group('base')}_{match.group('quote')}")
+
+    def generate(self, conn: MockConnection, channel: MockChannel) -> list:
+        price = self.price(channel.pair)
+        now = int(time.time() * 1000)
+        if channel.kind == 'depth':
+            data = self._depth(channel, 2)
+        elif channel.kind == 'trades':
+            data = self._trades(channel)
+        elif channel.kind == 'kline':
+            data = [[str(now // 60000 * 60000), f'{price:.4f}',
+                     f'{price + 1:.4f}', f'{price - 1:.4f}', f'{price:.4f}',
+                     '1000.0']]
+        else:
+            data = {
+                'high': f'{price + 1:.4f}', 'low': f'{price - 1:.4f}',
+                'last': f'{price:.4f}', 'open': f'{price:.4f}',
+                'close': f'{price:.4f}', 'buy': f'{price - 0.01:.4f}',
+                'sell': f'{price + 0.01:.4f}', 'vol': '10000.0',
+                'dayHigh': f'{price + 2:.4f}', 'dayLow': f'{price - 2:.4f}',
+                'timestamp': now
+            }
+        return [{'channel': channel.name, 'data': data}]
+
+
+class OkexFutureMock(OkexMock):
+    exchange = 'okex_future'
+
+    def parse_channel(self, name: str):
+        match = OKEX_FUTURE_WS_CHANS.match(name)
+        if match is None:
+            return None
+        kind = {
+            'trade': 'trades',
+            'kline': 'kline',
+            'depth': 'depth',
+            'ticker': 'ticker',
+        }.get(match.group('data_type'))
+        if kind is None:
+            return None
+        return MockChannel(name, kind, match.group('symbol'),
+                           contract_type=match.group('contract_type'))
+
+    def generate(self, conn: MockConnection, channel: MockChannel) -> list:
+        price = self.price(channel.pair)
+        now = int(time.time() * 1000)
+        if channel.kind == 'depth':
+            data = self._depth(channel, 5)
+        elif channel.kind == 'trades':
+            data = self._trades(channel)
+        elif channel.kind == 'kline':
+            data = [[now // 60000 * 60000, price, price + 1, price - 1,
+                     price, 100.0, 1.0]]
+        else:
+            data = {
+                'high': price + 1, 'limitLow': price * 0.97, 'vol': 10000.0,
+                'last': price, 'low': price - 1, 'sell': price + 0.01,
+                'buy': price - 0.01, 'hold_amount': 5000.0,
+                'contractId': 201810190000013, 'unitAmount': 100.0,
+                'limitHigh': price * 1.03
+            }
+        return [{'channel': channel.name, 'data': data}]
@@ -0,0 +1,80 @@
+"""
+author: thomaszdxsn
+"""
+import time
+from typing import Union
+
+from . import MockChannel, MockConnection, MockExchange
+from ..sdk.poloniex import SYMBOLS_MAP
+
+__all__ = (
+    'PoloniexMock',
+)
+
+TICKER_CHANNEL = 1002
+HEARTBEAT_CHANNEL = 1010
+PAIR_IDS = {pair: id_ for id_, pair in SYMBOLS_MAP.items()}
+
+
+class PoloniexMock(MockExchange):
+    """
+    {'command': 'subscribe', 'channel': 1002|'BTC_ETH'}
+    ticker订阅确认是[1002, 1]，交易对的channel是数字id，
+    订阅之后第一条是orderbook snapshot: [id, seq, [['i', {'currencyPair', 'orderBook'}]]]
+    之后是[id, seq, [['o', side, price, size], ['t', tid, side, price, size, ts]]]，
+    空闲时每heartbeat秒一条[1010]
+    """
+    exchange = 'poloniex'
+    heartbeat = 1
+
+    async def send_heartbeat(self, conn: MockConnection):
+        await self.send(conn, [HEARTBEAT_CHANNEL])
+
+    async def on_message(self, conn: MockConnection, data: dict):
+        if data.get('command') != 'subscribe':
+            return
+        name: Union[str, int] = data.get('channel')
+        if name == TICKER_CHANNEL:
+            await self.send(conn, [TICKER_CHANNEL, 1])
+            conn.add_channel(MockChannel(TICKER_CHANNEL, 'ticker', ''))
+            self.stats['subscribed'] += 1
+            return
+        pair_id = PAIR_IDS.get(name)
+        if pair_id is None:
+            await self.send(conn, {'error': 'Invalid channel.'})
+            return
+        channel = MockChannel(pair_id, 'depth', name)
+        conn.add_channel(channel)
+        self.stats['subscribed'] += 1
+        if self.frames is None:
+            price = self.price(name)
+            asks = {f'{price + 0.0001 * (i + 1):.8f}': f'{i + 1:.8f}'
+                    for i in range(50)}
+            bids = {f'{price - 0.0001 * (i + 1):.8f}': f'{i + 1:.8f}'
+                    for i in range(50)}
+            channel.sequence += 1
+            await self.send(conn, [pair_id, channel.sequence, [[
+                'i', {'currencyPair': name, 'orderBook': [asks, bids]}
+            ]]])
+
+    def generate(self, conn: MockConnection, channel: MockChannel) -> list:
+        if channel.kind == 'ticker':
+            pairs = [c.pair for c in conn.channels if c.kind == 'depth']
+            pair = self.random.choice(pairs) if pairs else 'BTC_ETH'
+            price = self.price(pair)
+            return [TICKER_CHANNEL, None, [
+                PAIR_IDS[pair], f'{price:.8f}', f'{price + 0.0001:.8f}',
+                f'{price - 0.0001:.8f}', '0.01', '100.0', '1000.0', 0,
+                f'{price + 0.01:.8f}', f'{price - 0.01:.8f}'
+            ]]
+        price = self.price(channel.pair)
+        side = self.random.choice((0, 1))
+        level = price + (0.0001 if side == 0 else -0.0001) * \
+            self.random.randint(1, 50)
+        size = self.random.choice((0, self.random.uniform(0.1, 5)))
+        updates = [['o', side, f'{level:.8f}', f'{size:.8f}']]
+        if self.random.random() < 0.2:
+            updates.append(['t', str(channel.sequence), side, f'{price:.8f}',
+                            f'{self.random.uniform(0.01, 1):.8f}',
+                            int(time.time())])
+        return [channel.name, channel.sequence, updates]
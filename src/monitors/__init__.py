@@ -5,23 +5,36 @@ import asyncio
 import logging
 from asyncio import AbstractEventLoop
 from abc import ABC, abstractmethod
-from typing import Union, List, Coroutine, Callable
+from typing import Union, List, Coroutine, Callable, Dict, Iterable, Tuple
 
 import arrow
 from aiohttp import WSMessage
 from apscheduler.schedulers.asyncio import AsyncIOScheduler
+from dynaconf import settings
 
+from ..latency import latency_enabled, latency_stats
+from ..metrics import Sample, collect_monitor, metrics
 from ..sdk import RestSdkAbstract, WebsocketSdkAbstract
+from ..sdk.sharding import ShardedWebsocket
+from ..sdk.recorder import FrameRecorder
 from ..schemas import DataClassAbstract
 from ..schemas.logs import LogMsgFmt
 from ..schemas.items import Item, ExchangeItem
+from ..schemas.markets import Orderbook
+from ..schemas.markets.depth import Depth
 from ..tunnels import TunnelAbstract
 
+# channel -> (handler, pair, extra)
+Route = Tuple[Callable, Union[str, None], tuple]
+
 
 class MonitorAbstract(ABC):
     exchange: str
     _rest_sdk_class: Union[RestSdkAbstract, None]=None
     _ws_sdk_class: Union[WebsocketSdkAbstract, None]=None
+    _depth_only_changed: bool = settings.get('DEPTH_SNAPSHOT_ONLY_CHANGED',
+                                             False)
+    _route_cache_size: int = 4096       # 最多缓存多少个channel的路由
 
     def __init__(self,
                  symbols: List[str],
@@ -39,8 +52,41 @@ class MonitorAbstract(ABC):
         self.tunnel = tunnel
         self.rest_sdk = self._rest_sdk_class(self._loop) \
                             if self._rest_sdk_class else None
-        self.ws_sdk = self._ws_sdk_class(self._loop)    \
-                            if self._ws_sdk_class else None
+        self.ws_sdk = self._create_ws_sdk()
+        self._resyncing = set()
+        self._routes: Dict[str, Union[Route, None]] = {}
+        # LATENCY_EXPORT_INTERVAL大于0时记录交易所->收到的延迟
+        self.latency = latency_stats if latency_enabled() else None
+        self._received = metrics.counter('marketking_ws_messages_total',
+                                         'websocket messages received',
+                                         exchange=self.exchange)
+        self._handler_errors = metrics.counter(
+            'marketking_ws_handler_errors_total',
+            'exceptions raised while handling a websocket message',
+            exchange=self.exchange
+        )
+        metrics.add_collector(self.collect_metrics)
+
+    def _create_ws_sdk(self) -> Union[WebsocketSdkAbstract, None]:
+        """
+        WS_SHARDS配置了这个交易所的时候，channel分到多个websocket连接上
+        WS_SUBSCRIBE_RATES可以按交易所覆盖订阅消息的发送速率
+        WS_RECORD_DIR非空时录制收到的原始消息
+        """
+        if self._ws_sdk_class is None:
+            return None
+        shards = int((settings.get('WS_SHARDS') or {}).get(self.exchange, 1))
+        if shards > 1:
+            ws_sdk = ShardedWebsocket(self._ws_sdk_class, shards, self._loop)
+        else:
+            ws_sdk = self._ws_sdk_class(self._loop)
+        rate = (settings.get('WS_SUBSCRIBE_RATES') or {}).get(self.exchange)
+        if rate is not None:
+            ws_sdk.subscribe_rate = float(rate)
+        record_dir = settings.get('WS_RECORD_DIR')
+        if record_dir:
+            ws_sdk.recorder = FrameRecorder(record_dir, self.exchange)
+        return ws_sdk
 
     def _run_later(self,
                    coro: Coroutine,
@@ -59,17 +105,63 @@ class MonitorAbstract(ABC):
     def dispatch_ws_msg(self, msg: WSMessage):
         raise NotImplemented
 
+    def route(self, channel: str) -> Union[Route, None]:
+        """
+        channel -> (handler, pair, extra)
+
+        订阅的channel是固定的，每个channel只在第一次收到的时候用_parse_route(正则)解析，
+        之后直接查表；不认识的channel返回None
+        """
+        try:
+            return self._routes[channel]
+        except KeyError:
+            pass
+        route = self._parse_route(channel)
+        if route is None:
+            self.logger.warning(f'unknown channel: {channel}')
+        if len(self._routes) < self._route_cache_size:
+            self._routes[channel] = route
+        return route
+
+    def _parse_route(self, channel: str) -> Union[Route, None]:
+        raise NotImplementedError()
+
     def run_ws_in_background(self, handler: Callable=None, sec: int=5):
         if handler is None:
             handler = self.dispatch_ws_msg
+        received, handler_errors = self._received, self._handler_errors
+
+        async def handle_with_backpressure(msg):
+            received.value += 1
+            try:
+                await handler(msg)
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                # 解码失败也会走到这里，单独的计数见ws_sdk.decode
+                handler_errors.value += 1
+                raise
+            # tunnel里block策略的queue超过上限时暂停读取websocket
+            await self.tunnel.drain(self.exchange)
+
         self._run_later(self.ws_sdk.keep_connect,
-                        args=(handler,),
+                        args=(handle_with_backpressure,),
                         sec=sec)
 
     @abstractmethod
     async def schedule(self):
         pass
 
+    def orderbook_count(self) -> int:
+        """内存里维护的orderbook数量，monitor用orderbooks或者_orderbooks保存"""
+        orderbooks = getattr(self, 'orderbooks', None)
+        if orderbooks is None:
+            orderbooks = getattr(self, '_orderbooks', ())
+        return len(orderbooks)
+
+    def collect_metrics(self) -> Iterable[Sample]:
+        return collect_monitor(self)
+
     def _log_msg(self, msg):
         log_msg = LogMsgFmt.WS_RECV_MSG.value.format(msg=msg)
         self.logger.debug(log_msg)
@@ -91,12 +183,56 @@ class MonitorAbstract(ABC):
         self.tunnel.put(item)
 
     async def tunnel_put_async(self, item: ExchangeItem):
-        await self.tunnel.put(item)
+        await self.tunnel.put_async(item)
+
+    async def snapshot_orderbook(self,
+                                 orderbook: Orderbook) -> Union[Depth, None]:
+        """
+        stale的orderbook返回None
+        DEPTH_SNAPSHOT_ONLY_CHANGED开启时，可见档位没变化的orderbook返回None
+        """
+        if orderbook.stale:
+            return None
+        if self._depth_only_changed:
+            return await orderbook.snapshot_if_changed_async()
+        return await orderbook.snapshot_async()
+
+    def resync_orderbook_later(self, pair: str):
+        """orderbook出现sequence gap之后调用，同一个pair同时只会有一个resync任务"""
+        if pair not in self._resyncing:
+            self._resyncing.add(pair)
+            self._run_later(self._run_resync_orderbook, args=(pair,), sec=0)
+
+    async def _run_resync_orderbook(self, pair: str):
+        try:
+            await self._resync_orderbook(pair)
+        except Exception as exc:
+            msg = LogMsgFmt.EXCEPTION.value.format(exc=exc)
+            self.logger.error(msg, exc_info=True)
+        finally:
+            self._resyncing.discard(pair)
+
+    async def _resync_orderbook(self, pair: str):
+        """重新同步orderbook，不断开websocket"""
+        raise NotImplementedError()
 
     def transport(self, data_type: str, data: DataClassAbstract):
+        if self.latency is not None:
+            self.latency.observe_receive(self.exchange, data_type, data)
         item = self.build_item(data_type, data)
         self.tunnel_put(item)
 
+    def transport_many(self,
+                       data_type: str,
+                       data_list: List[DataClassAbstract]):
+        """一条ws消息里的多条数据(trades/kline...)一次性放入tunnel"""
+        if self.latency is not None:
+            for data in data_list:
+                self.latency.observe_receive(self.exchange, data_type, data)
+        self.tunnel.put_many([
+            self.build_item(data_type, data) for data in data_list
+        ])
+
 
 from .okex_spot import *
 from .okex_future import *
@@ -1,46 +1,75 @@
 """
 author: thomaszdxsn
 """
-import json
+import asyncio
+import collections
 from datetime import datetime
+from typing import Dict
 
 from . import MonitorAbstract
 from ..sdk.binance import BinanceWebsocket, BinanceRest
 from ..schemas.regexes import BINANCE_WS_CHANS
-from ..schemas.markets import (BinanceTicker, BinanceTrades, 
-                               BinanceKline, BinanceDepth)
+from ..schemas.markets import (BinanceTicker, BinanceTrades,
+                               BinanceKline, BinanceOrderbook)
 
 __all__ = (
     'BinanceMonitor',
 )
 
+ORDERBOOKS_DICT = Dict[str, BinanceOrderbook]
+
 
 class BinanceMonitor(MonitorAbstract):
     exchange = 'binance'
     _rest_sdk_class = BinanceRest
     _ws_sdk_class = BinanceWebsocket
+    _depth_snapshot_limit = 1000
+    _depth_buffer_size = 1000
+
+    def __init__(self, *args, **kwargs):
+        super(BinanceMonitor, self).__init__(*args, **kwargs)
+        self.orderbooks: ORDERBOOKS_DICT = dict()
+        # 同步REST snapshot期间收到的diff事件
+        self._depth_buffers = collections.defaultdict(
+            lambda: collections.deque(maxlen=self._depth_buffer_size)
+        )
 
     async def schedule(self):
         for symbol in self.symbols:
-            self.ws_sdk.register_depth(symbol)
+            self.ws_sdk.register_diff_depth(symbol)
             self.ws_sdk.register_trades(symbol)
             self.ws_sdk.register_kline(symbol)
             self.ws_sdk.register_ticker(symbol)
         await self.ws_sdk.subscribe()
         self.run_ws_in_background(handler=self.dispatch_ws_msg)
+        self.scheduler.add_job(
+            self._transport_depth_snapshots,
+            trigger='cron',
+            second=f'*/{self._depth_interval}'
+        )
 
     async def dispatch_ws_msg(self, msg):
-        data = json.loads(msg.data)
-        match_dict = BINANCE_WS_CHANS.match(data['stream']).groupdict()
+        data = self.ws_sdk.decode(msg.data)
+        route = self.route(data['stream'])
+        if route is not None:
+            handler, pair, _ = route
+            await handler(data, pair)
+
+    def _parse_route(self, channel: str):
+        match = BINANCE_WS_CHANS.match(channel)
+        if match is None:
+            return None
+        match_dict = match.groupdict()
         pair, data_type = match_dict['symbol'], match_dict['data_type']
         if 'ticker' in data_type:
-            await self._handle_ticker(data, pair)
+            handler = self._handle_ticker
         elif 'trade' in data_type:
-            await self._handle_trade(data, pair)
+            handler = self._handle_trade
         elif 'depth' in data_type:
-            await self._handle_depth(data, pair)
+            handler = self._handle_depth
         else:
-            await self._handle_kline(data, pair)
+            handler = self._handle_kline
+        return handler, pair, ()
 
     async def _handle_ticker(self, data: dict, pair: str):
         data_dict = data['data']
@@ -84,28 +113,43 @@ class BinanceMonitor(MonitorAbstract):
         self.transport('trades', trade)
 
     async def _handle_depth(self, data: dict, pair: str):
-        data_dict = data['data']
-        asks = [
-            {
-                'price': float(item[0]),
-                'amount': float(item[1])
-            }
-            for item in data_dict['asks']
-        ]
-        bids = [
-            {
-                'price': float(item[0]),
-                'amount': float(item[1])
-            }
-            for item in data_dict['bids']
-        ]
-        depth = BinanceDepth(
-            bids=bids,
-            asks=asks,
-            last_update_id=data_dict['lastUpdateId'],
-            pair=pair
-        )
-        self.transport('depth', depth)
+        event = data['data']
+        orderbook = self.orderbooks.get(pair)
+        if orderbook is None:
+            self._depth_buffers[pair].append(event)
+            self.resync_orderbook_later(pair)
+            return
+        await orderbook.update_async(event)
+        if orderbook.stale:
+            self.logger.warning(f'depth gap|{pair}|{orderbook.last_update_id}'
+                                f'|{event["U"]}')
+            del self.orderbooks[pair]
+            self._depth_buffers[pair].append(event)
+            self.resync_orderbook_later(pair)
+
+    async def _resync_orderbook(self, pair: str):
+        """REST snapshot + 缓存的diff事件 -> 新的orderbook"""
+        while True:
+            resp = await self.rest_sdk.get_depth_async(
+                pair, limit=self._depth_snapshot_limit
+            )
+            if not resp.error:
+                orderbook = BinanceOrderbook(pair)
+                orderbook.initialize(resp.data)
+                buffer = self._depth_buffers[pair]
+                for event in buffer:
+                    orderbook.update(event)
+                if not orderbook.stale:
+                    buffer.clear()
+                    self.orderbooks[pair] = orderbook
+                    return
+            await asyncio.sleep(1)
+
+    async def _transport_depth_snapshots(self):
+        for orderbook in self.orderbooks.values():
+            depth = await self.snapshot_orderbook(orderbook)
+            if depth is not None:
+                self.transport('depth', depth)
 
     async def _handle_kline(self, data: dict, pair: str):
         data_dict = data['data']
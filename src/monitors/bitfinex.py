@@ -1,8 +1,8 @@
 """
 author: thomaszdxsn
 """
+import asyncio
 import collections
-import json
 from datetime import datetime
 from typing import Callable, Union, Dict
 
@@ -31,6 +31,10 @@ class BitfinexMonitor(MonitorAbstract):
         super(BitfinexMonitor, self).__init__(*args, **kwargs)
         self.channel_hub = collections.defaultdict(dict)
         self.orderbooks: ORDERBOOKS_DICT=dict()
+        # orderbook重新同步期间收到的updates
+        self._depth_buffers = collections.defaultdict(
+            lambda: collections.deque(maxlen=1000)
+        )
         self.scheduler.add_job(
             self._transport_depth_snapshots,
             trigger='cron',
@@ -63,6 +67,8 @@ class BitfinexMonitor(MonitorAbstract):
                                     symbol)
 
     async def schedule(self):
+        # 每次book更新之后推送checksum: [chanId, 'cs', checksum]
+        self.ws_sdk.register_conf(self.ws_sdk.FLAG_CHECKSUM)
         for symbol in self.symbols:
             self.ws_sdk.register_depth(symbol)
             self.ws_sdk.register_trades(symbol)
@@ -73,7 +79,7 @@ class BitfinexMonitor(MonitorAbstract):
         self.run_ws_in_background(handler=self.dispatch_ws_msg)
 
     async def dispatch_ws_msg(self, msg: WSMessage):
-        data = json.loads(msg.data)
+        data = self.ws_sdk.decode(msg.data)
         if isinstance(data, dict):
             self._log_sub_msg(data)
             if data.get('code', 0) == 20051:
@@ -81,8 +87,10 @@ class BitfinexMonitor(MonitorAbstract):
             event = data['event']
             if event != 'subscribed':
                 return
+            self.ws_sdk.ack(self.ws_sdk.channel_id(data))
             channel = data['channel']
-            channel_id = data['chanId']
+            # chanId只在同一个连接里唯一，分片的时候加上分片序号
+            channel_id = (self.ws_sdk.current_shard_index(), data['chanId'])
             symbol = (data.get('symbol')
                       if data.get('symbol') else data['key'].split(':')[-1])
             self._parse_channel(channel, channel_id, symbol)
@@ -90,7 +98,7 @@ class BitfinexMonitor(MonitorAbstract):
             is_hb = isinstance(data[1], str) and data[1] == 'hb'
             if is_hb:
                 return
-            channel_id = data[0]
+            channel_id = (self.ws_sdk.current_shard_index(), data[0])
             channel_info = self.channel_hub[channel_id]
             symbol, callback = channel_info['symbol'], channel_info['callback']
             await callback(data, symbol)
@@ -187,10 +195,7 @@ class BitfinexMonitor(MonitorAbstract):
             klines = [self.__gen_kline(i, pair) for i in item]
         else:
             klines = [self.__gen_kline(item, pair)]
-        list(map(
-            lambda x: self.transport('kline', x),
-            klines
-        ))
+        self.transport_many('kline', klines)
 
     def __gen_kline(self, data: list, pair: str) -> BitfinexKline:
         return BitfinexKline(
@@ -203,19 +208,59 @@ class BitfinexMonitor(MonitorAbstract):
             vol=data[5]
         )
 
+    def _new_orderbook(self, pair: str) -> Orderbook:
+        if pair.startswith('f'):
+            return BitfinexFundingOrderbook(pair)
+        return BitfinexTradeOrderbook(pair)
+
     async def _handle_depth(self, data: list, pair: str):
         data_list = data[1]
+        if data_list == 'cs':
+            self._handle_depth_checksum(data[2], pair)
+            return
         is_snapshot = isinstance(data_list[0], list)
         if is_snapshot:
-            if pair.startswith('f'):
-                self.orderbooks[pair] = BitfinexFundingOrderbook(pair)
-            else:
-                self.orderbooks[pair] = BitfinexTradeOrderbook(pair)
+            self.orderbooks[pair] = self._new_orderbook(pair)
             self.orderbooks[pair].initialize(data_list)
-        else:
-            await self.orderbooks[pair].update_async(data_list)
+            self._depth_buffers.pop(pair, None)
+            return
+        orderbook = self.orderbooks[pair]
+        if orderbook.stale:
+            self._depth_buffers[pair].append(data_list)
+            return
+        await orderbook.update_async(data_list)
+
+    def _handle_depth_checksum(self, checksum: int, pair: str):
+        orderbook = self.orderbooks.get(pair)
+        if orderbook is None or orderbook.stale:
+            return
+        if not orderbook.verify_checksum(checksum):
+            self.logger.warning(f'depth checksum mismatch|{pair}|{checksum}')
+            self.resync_orderbook_later(pair)
+
+    async def _resync_orderbook(self, pair: str):
+        """
+        REST book + 重新同步期间缓存的updates -> 新的orderbook
+        bitfinex的update是档位的最新状态，下一个checksum会再次校验结果
+        """
+        while True:
+            current = self.orderbooks.get(pair)
+            if current is not None and not current.stale:
+                # ws已经推送了新的snapshot(重连)
+                return
+            resp = await self.rest_sdk.get_depth_async(pair)
+            if not resp.error and isinstance(resp.data, list):
+                orderbook = self._new_orderbook(pair)
+                orderbook.initialize(resp.data)
+                buffer = self._depth_buffers.pop(pair, [])
+                for item in buffer:
+                    orderbook.update(item)
+                self.orderbooks[pair] = orderbook
+                return
+            await asyncio.sleep(1)
 
     async def _transport_depth_snapshots(self):
         for val in self.orderbooks.values():
-            depth = await val.snapshot_async()
-            self.transport('depth', depth)
\ No newline at end of file
+            depth = await self.snapshot_orderbook(val)
+            if depth is not None:
+                self.transport('depth', depth)
\ No newline at end of file
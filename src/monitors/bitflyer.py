@@ -1,7 +1,6 @@
 """
 author: thomaszdxsn
 """
-import json
 
 import arrow
 from aiohttp import WSMessage
@@ -10,6 +9,7 @@ from . import MonitorAbstract
 from ..sdk.bitflyer import BitflyerRest, BitflyerWebsocket
 from ..schemas.regexes import BITFLYER_WS_CHANS
 from ..schemas.markets import BitFlyerTicker, BitflyerTrades, BitflyerDepth
+from ..schemas.markets.depth import format_levels
 
 __all__ = ('BitflyerMonitor',)
 
@@ -28,19 +28,29 @@ class BitflyerMonitor(MonitorAbstract):
         self.run_ws_in_background(handler=self.dispatch_ws_msg)
 
     async def dispatch_ws_msg(self, msg: WSMessage):
-        data = json.loads(msg.data)
+        data = self.ws_sdk.decode(msg.data)
         if "method" not in data:
             return
         channel = data["params"]["channel"]
-        match_dict = BITFLYER_WS_CHANS.match(channel).groupdict()
+        route = self.route(channel)
+        if route is not None:
+            handler, pair, _ = route
+            await handler(data, pair)
+
+    def _parse_route(self, channel: str):
+        match = BITFLYER_WS_CHANS.match(channel)
+        if match is None:
+            return None
+        match_dict = match.groupdict()
         data_type = match_dict["data_type"]
         pair = match_dict["product_code"]
         if data_type == "ticker":
-            await self._handle_ticker(data, pair)
+            handler = self._handle_ticker
         elif data_type == "executions":
-            await self._handle_trades(data, pair)
+            handler = self._handle_trades
         else:
-            await self._handle_depth(data, pair)
+            handler = self._handle_depth
+        return handler, pair, ()
 
     async def _handle_ticker(self, data: dict, pair: str):
         data_dict = data["params"]["message"]
@@ -69,27 +79,20 @@ class BitflyerMonitor(MonitorAbstract):
             )
             for item in data["params"]["message"]
         ]
-        list(map(lambda x: self.transport('trades', x),
-                 trades))
+        self.transport_many('trades', trades)
 
     async def _handle_depth(self, data: dict, pair: str, size:int=20):
         # don't need sorted asks or bids
-        asks = [
-            {
-                'price': item['price'],
-                'amount': item['size']
-            }
+        asks = format_levels(
+            (item['price'], item['size'])
             for item in
             data['params']['message']['asks'][:size]
-        ]
-        bids = [
-            {
-                'price': item['price'],
-                'amount': item['size']
-            }
+        )
+        bids = format_levels(
+            (item['price'], item['size'])
             for item in
             list(reversed(data['params']['message']['bids']))[:size]
-        ]
+        )
         if not asks and not bids:
             return
         depth = BitflyerDepth(
@@ -9,6 +9,7 @@ import arrow
 from . import MonitorAbstract
 from ..sdk.bithumb import BithumbRest
 from ..schemas.markets import BithumbTicker, BithumbDepth, BithumbTrades
+from ..schemas.markets.depth import format_levels
 
 __all__ = (
     'BithumbMonitor',
@@ -76,20 +77,14 @@ class BithumbMonitor(MonitorAbstract):
         for symbol, value in depth_data.items():
             if symbol not in self.symbols_set:
                 continue
-            asks = [
-                {
-                    'price': float(item['price']),
-                    'amount': float(item['quantity'])
-                }
+            asks = format_levels(
+                (float(item['price']), float(item['quantity']))
                 for item in value['asks']
-            ]
-            bids = [
-                {
-                    'price': float(item['price']),
-                    'amount': float(item['quantity'])
-                }
+            )
+            bids = format_levels(
+                (float(item['price']), float(item['quantity']))
                 for item in value['bids']
-            ]
+            )
             depth = BithumbDepth(
                 asks=asks,
                 bids=bids,
@@ -2,8 +2,7 @@
 author: thomaszdxsn
 """
 import collections
-import json
-from asyncio.locks import Lock
+from typing import Dict
 
 import arrow
 from aiohttp import WSMessage
@@ -12,10 +11,13 @@ from . import MonitorAbstract
 from ..sdk.bitmex import BitmexWebsocket
 from ..schemas.markets import (BitmexTrade, BitmexTradeBin,
                                BitmexQuoteBin, BitmexDepth,
-                               BitmexSettlement)
+                               BitmexSettlement, BitmexOrderbook)
+from ..schemas.markets.depth import format_levels
 
 __all__ = ('BitmexMonitor',)
 
+ORDERBOOKS_DICT = Dict[str, BitmexOrderbook]
+
 
 class BitmexMonitor(MonitorAbstract):
     exchange = 'bitmex'
@@ -24,37 +26,55 @@ class BitmexMonitor(MonitorAbstract):
     def __init__(self, *args, **kwargs):
         super(BitmexMonitor, self).__init__(*args, **kwargs)
         self._instrument_books = collections.defaultdict(dict)  # TODO
-        self._orderbooks = collections.defaultdict(dict)
-        self._orderbooks_lock = Lock()
-        self._orderbooks_use_snapshots = False
+        self._orderbooks: ORDERBOOKS_DICT = dict()
+        # True: 订阅orderBookL2_25维护本地orderbook，按_depth_interval采样
+        # False: 订阅orderBook10，每次推送都保存
+        self._orderbooks_use_snapshots = True
 
     async def schedule(self):
         for symbol in self.symbols:
             self.ws_sdk.register_trade_bin(symbol)
             self.ws_sdk.register_trades(symbol)
             self.ws_sdk.register_quote_bin(symbol)
-            self.ws_sdk.register_orderbook10(symbol)
+            if self._orderbooks_use_snapshots:
+                self.ws_sdk.register_orderbook_l2(symbol)
+            else:
+                self.ws_sdk.register_orderbook10(symbol)
         self.ws_sdk.register_settlement()
         await self.ws_sdk.subscribe()
         self.run_ws_in_background(handler=self.dispatch_ws_msg)
         if self._orderbooks_use_snapshots:
             self.scheduler.add_job(self._transport_orderbook_snapshot,
                                    trigger='cron',
-                                   second='*')
+                                   second=f'*/{self._depth_interval}')
 
     async def dispatch_ws_msg(self, msg: WSMessage):
-        data = json.loads(msg.data)
-        table = data.get('table', '')
+        data = self.ws_sdk.decode(msg.data)
+        table = data.get('table')
+        if table is None:
+            # 订阅确认/info
+            return
+        route = self.route(table)
+        if route is not None:
+            await route[0](data)
+
+    def _parse_route(self, table: str):
+        """pair在每条数据的symbol里，这里只路由handler"""
         if 'tradeBin' in table:
-            await self._handle_trade_bin(data)
+            handler = self._handle_trade_bin
         elif 'quoteBin' in table:
-            await self._handle_quote_bin(data)
+            handler = self._handle_quote_bin
+        elif 'orderBookL2' in table:
+            handler = self._handle_orderbook_l2
         elif 'orderBook' in table:
-            await self._handle_orderbook10(data)
+            handler = self._handle_orderbook10
         elif table == 'trade':
-            await self._handle_trade(data)
+            handler = self._handle_trade
         elif table == 'settlement':
-            await self._handle_settlement(data)
+            handler = self._handle_settlement
+        else:
+            return None
+        return handler, None, ()
 
     async def _handle_trade_bin(self, data: dict):
         trade_bin_list = [
@@ -75,7 +95,7 @@ class BitmexMonitor(MonitorAbstract):
             )
             for item in data['data']
         ]
-        [self.transport('trade_bin', i) for i in trade_bin_list]
+        self.transport_many('trade_bin', trade_bin_list)
 
     async def _handle_quote_bin(self, data: dict):
         quote_bin_list = [
@@ -89,7 +109,7 @@ class BitmexMonitor(MonitorAbstract):
             )
             for item in data['data']
         ]
-        [self.transport('quote_bin', i) for i in quote_bin_list]
+        self.transport_many('quote_bin', quote_bin_list)
 
     async def _handle_trade(self, data: dict):
         trades = [
@@ -107,7 +127,7 @@ class BitmexMonitor(MonitorAbstract):
             )
             for item in data['data']
         ]
-        [self.transport('trades', i) for i in trades]
+        self.transport_many('trades', trades)
 
     async def _handle_settlement(self, data: dict):
         settlements = [
@@ -124,35 +144,39 @@ class BitmexMonitor(MonitorAbstract):
             )
             for item in data['data']
         ]
-        [self.transport('settlement', i) for i in settlements]
+        self.transport_many('settlement', settlements)
 
     async def _handle_orderbook10(self, data: dict):
         item = data['data'][0]
-        symbol = item['symbol']
-        if self._orderbooks_use_snapshots:
-            async with self._orderbooks_lock:
-                self._orderbooks[symbol].update(item)
-        else:
-            depth = self._format_orderbook10(item)
-            self.transport('depth', depth)
+        depth = self._format_orderbook10(item)
+        self.transport('depth', depth)
+
+    async def _handle_orderbook_l2(self, data: dict):
+        if not data.get('data'):
+            return
+        symbol = data['data'][0]['symbol']
+        if data['action'] == 'partial':
+            orderbook = BitmexOrderbook(symbol)
+            orderbook.initialize(data['data'])
+            self._orderbooks[symbol] = orderbook
+            return
+        orderbook = self._orderbooks.get(symbol)
+        if orderbook is None:
+            # partial之前的消息直接丢弃
+            return
+        await orderbook.update_async(data)
 
     async def _transport_orderbook_snapshot(self):
-        async with self._orderbooks_lock:
-            for item in self._orderbooks.values():
-                depth = self._format_orderbook10(item)
+        for orderbook in self._orderbooks.values():
+            depth = await self.snapshot_orderbook(orderbook)
+            if depth is not None:
                 self.transport('depth', depth)
 
     def _format_orderbook10(self, item: dict) -> BitmexDepth:
         depth = BitmexDepth(
             pair=item['symbol'],
-            asks=[
-                {'price': i[0], 'amount': i[1]}
-                for i in item['asks']
-            ],
-            bids=[
-                {'price': i[0], 'amount': i[1]}
-                for i in item['bids']
-            ],
+            asks=format_levels(item['asks']),
+            bids=format_levels(item['bids']),
             server_created=arrow.get(item['timestamp']).naive
         )
         return depth
@@ -10,6 +10,7 @@ from ..sdk.cointiger import CointigerRest, CointigerWebsocket
 from ..schemas.regexes import COINTIGER_WS_CHANS
 from ..schemas.markets import (CointigerTicker, CointigerDepth,
                                CointigerTrades, CointigerKline)
+from ..schemas.markets.depth import format_levels
 
 __all__ = (
     'CointigerMonitor',
@@ -37,17 +38,27 @@ class CointigerMonitor(MonitorAbstract):
             return
         print(msg)
         channel = msg['channel']
-        match_dict = COINTIGER_WS_CHANS.match(channel).groupdict()
+        route = self.route(channel)
+        if route is not None:
+            handler, pair, _ = route
+            await handler(msg, pair)
+
+    def _parse_route(self, channel: str):
+        match = COINTIGER_WS_CHANS.match(channel)
+        if match is None:
+            return None
+        match_dict = match.groupdict()
         data_type = match_dict['data_type']
         pair = match_dict['symbol']
-        if data_type == 'ticker':
-            await self._handle_ticker(msg, pair)
-        elif data_type == 'depth':
-            await self._handle_depth(msg, pair)
-        elif data_type == 'trade':
-            await self._handle_trades(msg, pair)
-        elif data_type == 'kline':
-            await self._handle_kline(msg, pair)
+        handler = {
+            'ticker': self._handle_ticker,
+            'depth': self._handle_depth,
+            'trade': self._handle_trades,
+            'kline': self._handle_kline,
+        }.get(data_type)
+        if handler is None:
+            return None
+        return handler, pair, ()
 
     async def _handle_ticker(self, data: dict, pair: str):
         ticker = CointigerTicker(
@@ -61,20 +72,14 @@ class CointigerMonitor(MonitorAbstract):
                             data: dict,
                             pair: str,
                             size: int=ORDERBOOK_LEVEL):
-        asks = [
-            {
-                'price': float(item[0]),
-                'amount': float(item[1])
-            }
+        asks = format_levels(
+            (float(item[0]), float(item[1]))
             for item in data['tick']['asks'][:size]
-        ]
-        bids = [
-            {
-                'price': float(item[0]),
-                'amount': float(item[1])
-            }
+        )
+        bids = format_levels(
+            (float(item[0]), float(item[1]))
             for item in data['tick']['buys'][:size]
-        ]
+        )
         depth = CointigerDepth(
             pair=pair,
             asks=asks,
@@ -96,7 +101,7 @@ class CointigerMonitor(MonitorAbstract):
             )
             for item in data['tick']['data']
         ]
-        [self.transport('trades', t) for t in trades]
+        self.transport_many('trades', trades)
 
     async def _handle_kline(self, data: dict, pair: str):
         tick = data['tick']
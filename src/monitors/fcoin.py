@@ -1,7 +1,6 @@
 """
 author: thomaszdxsn
 """
-import json
 from datetime import datetime
 
 from aiohttp import WSMessage
@@ -12,6 +11,7 @@ from ..sdk.fcoin import FcoinWebsocket, FcoinRest
 from ..schemas.regexes import FCOIN_WS_CHANS
 from ..schemas.markets import (FcoinTicker, FcoinDepth,
                                FcoinKline, FcoinTrades)
+from ..schemas.markets.depth import format_levels
 
 __all__ = (
     'FcoinMonitor',
@@ -33,24 +33,33 @@ class FcoinMonitor(MonitorAbstract):
         self.run_ws_in_background(handler=self.dispatch_ws_msg)
 
     async def dispatch_ws_msg(self, msg: WSMessage):
-        data = json.loads(msg.data)
+        data = self.ws_sdk.decode(msg.data)
         if 'type'  not in data:
             return
         type_field = data['type']
         if type_field in ('hello', 'topics'):
             return
-        match_dict = FCOIN_WS_CHANS.match(type_field).groupdict()
+        route = self.route(type_field)
+        if route is not None:
+            handler, pair, _ = route
+            await handler(data, pair)
+
+    def _parse_route(self, channel: str):
+        match = FCOIN_WS_CHANS.match(channel)
+        if match is None:
+            return None
+        match_dict = match.groupdict()
         data_type = match_dict['data_type']
         pair = match_dict['symbol']
-
-        if data_type == 'ticker':
-            await self._handle_ticker(data, pair)
-        elif data_type == 'depth':
-            await self._handle_depth(data, pair)
-        elif data_type == 'candle':
-            await self._handle_kline(data, pair)
-        elif data_type == 'trade':
-            await self._handle_trades(data, pair)
+        handler = {
+            'ticker': self._handle_ticker,
+            'depth': self._handle_depth,
+            'candle': self._handle_kline,
+            'trade': self._handle_trades,
+        }.get(data_type)
+        if handler is None:
+            return None
+        return handler, pair, ()
 
     async def _handle_ticker(self, data: dict, pair: str):
         tick_data = data['ticker']
@@ -71,20 +80,8 @@ class FcoinMonitor(MonitorAbstract):
         self.transport('ticker', ticker)
 
     async def _handle_depth(self, data: dict, pair: str):
-        bids = [
-            {
-                'price': item[0],
-                'amount': item[1]
-            }
-            for item in chunk(data['bids'], 2)
-        ]
-        asks = [
-            {
-                'price': item[0],
-                'amount': item[1]
-            }
-            for item in chunk(data['asks'], 2)
-        ]
+        bids = format_levels(chunk(data['bids'], 2))
+        asks = format_levels(chunk(data['asks'], 2))
         depth = FcoinDepth(
             asks=asks,
             bids=bids,
@@ -1,7 +1,7 @@
 """
 author: thomaszdxsn
 """
-import json
+import asyncio
 from typing import Dict
 
 import arrow
@@ -23,6 +23,7 @@ class HitBTCMonitor(MonitorAbstract):
     exchange = 'hitbtc'
     _rest_sdk_class = HitBTCRest
     _ws_sdk_class = HitBTCWebsocket
+    _resync_timeout = 10
 
     def __init__(self, *args, **kwargs):
         super(HitBTCMonitor, self).__init__(*args, **kwargs)
@@ -43,7 +44,7 @@ class HitBTCMonitor(MonitorAbstract):
         )
 
     async def dispatch_ws_msg(self, msg: WSMessage):
-        data = json.loads(msg.data)
+        data = self.ws_sdk.decode(msg.data)
         if 'method' not in data:
             return
         method = data['method']
@@ -68,7 +69,7 @@ class HitBTCMonitor(MonitorAbstract):
             )
             for item in data['params']['data']
         ]
-        [self.transport('trades', t) for t in trades]
+        self.transport_many('trades', trades)
 
     async def _handle_kline(self, data: dict):
         klines = [
@@ -84,7 +85,7 @@ class HitBTCMonitor(MonitorAbstract):
             )
             for item in data['params']['data']
         ]
-        [self.transport('kline', k) for k in klines]
+        self.transport_many('kline', klines)
 
     async def _handle_ticker(self, data: dict):
         params = data['params']
@@ -104,16 +105,39 @@ class HitBTCMonitor(MonitorAbstract):
 
     async def _handle_depth(self, data: dict):
         method = data['method']
-        pair = data['params']['symbol']
+        params = data['params']
+        pair = params['symbol']
         if method == 'snapshotOrderbook':
             orderbook = HitBTCOrderbook(pair)
             orderbook.initialize(data)
+            orderbook.sequence = params['sequence']
             self.orderbooks[pair] = orderbook
-        else:
-            orderbook = self.orderbooks[pair]
+            return
+        orderbook = self.orderbooks.get(pair)
+        if orderbook is None:
+            return
+        if orderbook.check_sequence(params['sequence']):
             await orderbook.update_async(data)
+        elif orderbook.stale:
+            if pair not in self._resyncing:
+                self.logger.warning(f'depth gap|{pair}|{orderbook.sequence}'
+                                    f'|{params["sequence"]}')
+            self.resync_orderbook_later(pair)
+
+    async def _resync_orderbook(self, pair: str):
+        """
+        hitbtc REST orderbook没有sequence，没办法和ws的更新对齐，
+        所以在同一个ws连接上重新订阅，等待新的snapshotOrderbook
+        """
+        await self.ws_sdk.resubscribe_depth(pair)
+        for _ in range(self._resync_timeout):
+            await asyncio.sleep(1)
+            orderbook = self.orderbooks.get(pair)
+            if orderbook is not None and not orderbook.stale:
+                return
 
     async def _transport_depth_snapshot(self):
         for orderbook in self.orderbooks.values():
-            snapshot = await orderbook.snapshot_async()
-            self.transport('depth', snapshot)
\ No newline at end of file
+            snapshot = await self.snapshot_orderbook(orderbook)
+            if snapshot is not None:
+                self.transport('depth', snapshot)
\ No newline at end of file
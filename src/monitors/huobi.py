@@ -10,6 +10,7 @@ from ..sdk.huobi import HuobiRest, HuobiWebsocket
 from ..schemas.regexes import HUOBI_WS_CHANS
 from ..schemas.markets import (HuobiDepth, HuobiTicker, HuobiKline,
                                HuobiTrades)
+from ..schemas.markets.depth import format_levels
 
 __all__ = (
     'HuobiMonitor',
@@ -33,37 +34,37 @@ class HuobiMonitor(MonitorAbstract):
     async def dispatch_ws_msg(self, msg: WSMessage):
         data = await self.ws_sdk.handle_ws_ping(msg)
         if not data.get('ch'):
+            if data.get('subbed') and data.get('status') == 'ok':
+                self.ws_sdk.ack(data['subbed'])
             if 'ping' not in data:
                 self._log_sub_msg(data)
             return
         self._log_msg(data)
-        match_dict = HUOBI_WS_CHANS.match(data['ch']).groupdict()
+        route = self.route(data['ch'])
+        if route is not None:
+            handler, pair, _ = route
+            await handler(data, pair)
+
+    def _parse_route(self, channel: str):
+        match = HUOBI_WS_CHANS.match(channel)
+        if match is None:
+            return None
+        match_dict = match.groupdict()
         pair, data_type = match_dict['symbol'], match_dict['data_type']
         if data_type == 'detail':
-            await self._handle_ticker(data, pair)
+            handler = self._handle_ticker
         elif data_type == 'kline':
-            await self._handle_kline(data, pair)
+            handler = self._handle_kline
         elif data_type == 'trade':
-            await self._handle_trades(data, pair)
+            handler = self._handle_trades
         else:
-            await self._handle_depth(data, pair)
+            handler = self._handle_depth
+        return handler, pair, ()
 
     async def _handle_depth(self, data: dict, pair: str, size: int=20):
         tick = data['tick']
-        asks = [
-            {
-                'price': item[0],
-                'amount': item[1]
-            }
-            for item in tick['asks'][:size]
-        ]
-        bids = [
-            {
-                'price': item[0],
-                'amount': item[1]
-            }
-            for item in tick['bids'][:size]
-        ]
+        asks = format_levels(tick['asks'][:size])
+        bids = format_levels(tick['bids'][:size])
         depth = HuobiDepth(
             pair=pair,
             server_created=datetime.utcfromtimestamp(tick['ts'] / 1000),
@@ -121,7 +122,4 @@ class HuobiMonitor(MonitorAbstract):
             )
             for item in tick['data']
         ]
-        list(map(
-            lambda x: self.transport('trades', x),
-            trades
-        ))
+        self.transport_many('trades', trades)
@@ -2,7 +2,6 @@
 author: thomaszdxsn
 """
 import itertools
-import json
 import collections
 from datetime import datetime
 from asyncio.locks import Lock
@@ -11,10 +10,10 @@ import arrow
 from aiohttp import WSMsgType
 
 from . import MonitorAbstract
-from ..utils import decompress_okex_data
 from ..schemas.regexes import OKEX_FUTURE_WS_CHANS
 from ..schemas.markets import (OkexFutureDepth, OkexFutureTicker,
                                OkexFutureKline, OkexFutureTrades)
+from ..schemas.markets.depth import format_levels
 from ..sdk.okex_future import (OkexFutureRest, OkexFutureWebsocket,
                                CONTRACT_TYPES)
 
@@ -51,34 +50,35 @@ class OkexFutureMonitor(MonitorAbstract):
                                    second='*')
 
     async def dispatch_ws_msg(self, msg):
-        json_data = decompress_okex_data(msg.data)
-        data = json.loads(json_data)[0]
+        data = self.ws_sdk.decode(msg.data, inflate=True)[0]
         channel = data['channel']
         if channel == 'addChannel':
+            if data['data'].get('result'):
+                self.ws_sdk.ack(self.ws_sdk.channel_id(data['data']))
             return
 
-        match_dict = OKEX_FUTURE_WS_CHANS.match(channel).groupdict()
+        route = self.route(channel)
+        if route is not None:
+            handler, symbol, (contract_type,) = route
+            await handler(data, symbol, contract_type)
+
+    def _parse_route(self, channel: str):
+        match = OKEX_FUTURE_WS_CHANS.match(channel)
+        if match is None:
+            return None
+        match_dict = match.groupdict()
         data_type, symbol, contract_type = (match_dict['data_type'],
                                             match_dict['symbol'],
                                             match_dict['contract_type'])
-
         if data_type == 'trade':
-            await self._handle_trades(data, symbol, contract_type)
+            handler = self._handle_trades
         elif data_type == 'kline':
-            await self._handle_kline(data, symbol, contract_type)
+            handler = self._handle_kline
         elif data_type == 'depth':
-            await self._handle_depth(data, symbol, contract_type)
+            handler = self._handle_depth
         else:
-            await self._handle_ticker(data, symbol, contract_type)
-
-    def __handle_depth_item(self, item: list) -> dict:
-        return {
-            'price': float(item[0]),
-            'sheet_quantity': float(item[1]),
-            'token_quantity': float(item[2]),
-            'sheet_cumulant': float(item[3]),
-            'token_cumulant': float(item[4])
-        }
+            handler = self._handle_ticker
+        return handler, symbol, (contract_type,)
 
     async def _handle_depth(self, data: dict, symbol: str, contract_type: str):
         if self._orderbooks_use_snapshots:
@@ -100,18 +100,20 @@ class OkexFutureMonitor(MonitorAbstract):
                             data: dict,
                             symbol: str,
                             contract_type: str) -> OkexFutureDepth:
+        fields = OkexFutureDepth.level_fields
         if data['data'].get('asks'):
-            asks = [
-                self.__handle_depth_item(item)
-                for item in reversed(data['data']['asks'])
-            ]
+            asks = format_levels(
+                (tuple(map(float, item))
+                 for item in reversed(data['data']['asks'])),
+                fields
+            )
         else:
             asks = []
         if data['data'].get('bids'):
-            bids = [
-                self.__handle_depth_item(item)
-                for item in data['data']['bids']
-            ]
+            bids = format_levels(
+                (tuple(map(float, item)) for item in data['data']['bids']),
+                fields
+            )
         else:
             bids = []
         server_created = datetime.utcfromtimestamp(
@@ -161,10 +163,7 @@ class OkexFutureMonitor(MonitorAbstract):
             )
             for item in data_lst
         ]
-        list(map(
-            lambda x: self.transport('kline', x),
-            klines
-        ))
+        self.transport_many('kline', klines)
 
     def __format_trade_time(self, trade_time: str) -> datetime:
         """
@@ -191,7 +190,4 @@ class OkexFutureMonitor(MonitorAbstract):
             )
             for item in data['data']
         ]
-        list(map(
-            lambda x: self.transport('trades', x),
-            trades
-        ))
+        self.transport_many('trades', trades)
@@ -1,7 +1,6 @@
 """
 author: thomaszdxsn
 """
-import json
 import collections
 from datetime import datetime
 from asyncio.locks import Lock
@@ -10,11 +9,11 @@ import arrow
 from aiohttp import WSMsgType
 
 from . import MonitorAbstract
-from ..utils import decompress_okex_data
 from ..sdk.okex_spot import OkexSpotRest, OkexSpotWebsocket
 from ..schemas import regexes
 from ..schemas.markets import (OkexSpotDepth, OkexSpotTicker,
                                OkexSpotTrades, OkexSpotKline)
+from ..schemas.markets.depth import format_levels
 
 __all__ = (
     'OkexSpotMonitor',
@@ -46,26 +45,37 @@ class OkexSpotMonitor(MonitorAbstract):
                                    second='*')
 
     async def dispatch_ws_msg(self, msg):
-        json_data = decompress_okex_data(msg.data)
-        data = json.loads(json_data)[0]
+        data = self.ws_sdk.decode(msg.data, inflate=True)[0]
         channel = data['channel']
         if channel == 'addChannel':
+            if data['data'].get('result'):
+                self.ws_sdk.ack(self.ws_sdk.channel_id(data['data']))
             return
         # bch_eth 403?
         if isinstance(data['data'], dict) and data['data'].get('result', None) is False:
             return
 
-        match_dict = regexes.OKEX_SPOT_WS_CHANS.match(channel).groupdict()
+        route = self.route(channel)
+        if route is not None:
+            handler, pair, _ = route
+            await handler(data, pair)
+
+    def _parse_route(self, channel: str):
+        match = regexes.OKEX_SPOT_WS_CHANS.match(channel)
+        if match is None:
+            return None
+        match_dict = match.groupdict()
         pair = f"{match_dict['base']}_{match_dict['quote']}"
         data_type = match_dict['data_type']
         if data_type == 'ticker':
-            await self._handle_ticker(data, pair)
+            handler = self._handle_ticker
         elif 'depth' in data_type:
-            await self._handle_depth(data, pair)
+            handler = self._handle_depth
         elif data_type == 'deals':
-            await self._handle_trades(data, pair)
+            handler = self._handle_trades
         else:
-            await self._handle_kline(data, pair)
+            handler = self._handle_kline
+        return handler, pair, ()
 
     async def _handle_ticker(self, data: dict, pair: str):
         data_dict = data['data']
@@ -109,10 +119,7 @@ class OkexSpotMonitor(MonitorAbstract):
             )
             for item in data['data']
         ]
-        list(map(
-            lambda x: self.transport('trades', x),
-            trades
-        ))
+        self.transport_many('trades', trades)
 
     async def _handle_kline(self, data: dict, pair: str):
         klines = [
@@ -127,10 +134,7 @@ class OkexSpotMonitor(MonitorAbstract):
             )
             for item in data['data']
         ]
-        list(map(
-            lambda x: self.transport('kline', x),
-            klines
-        ))
+        self.transport_many('kline', klines)
 
     async def _handle_depth(self, data: dict, pair: str):
         if self._orderbooks_use_snapshots:
@@ -147,20 +151,14 @@ class OkexSpotMonitor(MonitorAbstract):
                 self.transport('depth', depth)
 
     def _format_depth(self, data: dict, pair: str) -> OkexSpotDepth:
-        asks = [
-            {
-                'price': float(item[0]),
-                'amount': float(item[1])
-            }
+        asks = format_levels(
+            (float(item[0]), float(item[1]))
             for item in reversed(data['data']['asks'])
-        ]
-        bids = [
-            {
-                'price': float(item[0]),
-                'amount': float(item[1])
-            }
+        )
+        bids = format_levels(
+            (float(item[0]), float(item[1]))
             for item in data['data']['bids']
-        ]
+        )
         server_created = datetime.utcfromtimestamp(
             data['data']['timestamp']/1000
         )
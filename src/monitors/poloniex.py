@@ -1,7 +1,8 @@
 """
 author: thomaszdxsn
 """
-import json
+import asyncio
+import collections
 from typing import Dict
 
 import arrow
@@ -23,11 +24,17 @@ class PoloniexMonitor(MonitorAbstract):
     exchange = 'poloniex'
     _ws_sdk_class = PoloniexWebsocket
     _rest_sdk_class = PoloniexRest
+    _depth_resync_limit = 10000     # 重新同步时REST请求的档位数，尽量拿到完整的orderbook
+    _depth_buffer_size = 1000
 
     def __init__(self, *args, **kwargs):
         super(PoloniexMonitor, self).__init__(*args, **kwargs)
         self.symbols_set = set(self.symbols)    # for O(1) lookup
         self._orderbooks: ORDERBOOKS_DICT = dict()
+        # orderbook重新同步期间收到的(seq, depth updates)
+        self._depth_buffers = collections.defaultdict(
+            lambda: collections.deque(maxlen=self._depth_buffer_size)
+        )
 
     async def schedule(self):
         for symbol in self.symbols:
@@ -42,7 +49,7 @@ class PoloniexMonitor(MonitorAbstract):
         )
 
     async def dispatch_ws_msg(self, msg: WSMessage):
-        data = json.loads(msg.data)
+        data = self.ws_sdk.decode(msg.data)
         code = data[0]
         if code == 1010:
             # heartbeat
@@ -54,30 +61,74 @@ class PoloniexMonitor(MonitorAbstract):
             await self._handle_orderbook_data(data)
 
     async def _handle_orderbook_data(self, data: list):
+        """[<channel id>, <sequence number>, <update array>]"""
         pair = SYMBOLS_MAP[data[0]]
+        sequence = data[1]
         condition_node = data[2][0][1]
         is_snapshot = isinstance(condition_node, dict)
         if is_snapshot:
             orderbook = PoloniexOrderbook(pair)
             orderbook.initialize(condition_node['orderBook'])
+            orderbook.sequence = sequence
             self._orderbooks[pair] = orderbook
+            self._depth_buffers.pop(pair, None)
             return
         # handle update
+        depth_items = []
         for item in data[2]:
             data_type = item[0]
             if data_type == 'o':
-                await self._handle_depth(item, pair)
+                depth_items.append(item)
             else:
                 await self._handle_trades(item, pair)
-
-    async def _handle_depth(self, item: list, pair: str):
-        orderbook = self._orderbooks[pair]
-        await orderbook.update_async(item)
+        await self._handle_depth(depth_items, sequence, pair)
+
+    async def _handle_depth(self, items: list, sequence: int, pair: str):
+        orderbook = self._orderbooks.get(pair)
+        if orderbook is not None and not orderbook.stale:
+            if orderbook.check_sequence(sequence):
+                for item in items:
+                    await orderbook.update_async(item)
+                return
+            if not orderbook.stale:
+                # 重复的消息
+                return
+            self.logger.warning(f'depth gap|{pair}|{orderbook.sequence}'
+                                f'|{sequence}')
+        self._depth_buffers[pair].append((sequence, items))
+        self.resync_orderbook_later(pair)
+
+    async def _resync_orderbook(self, pair: str):
+        """REST returnOrderBook + 缓存的updates -> 新的orderbook"""
+        while True:
+            current = self._orderbooks.get(pair)
+            if current is not None and not current.stale:
+                # ws已经推送了新的snapshot
+                return
+            resp = await self.rest_sdk.get_depth_async(
+                pair, depth=self._depth_resync_limit
+            )
+            if not resp.error and 'seq' in resp.data:
+                orderbook = PoloniexOrderbook(pair)
+                # 返回的档位数达到limit时是截断的，范围外的更新会被丢掉
+                orderbook.initialize_rest(resp.data,
+                                          depth=self._depth_resync_limit)
+                buffer = self._depth_buffers[pair]
+                for sequence, items in buffer:
+                    if orderbook.check_sequence(sequence):
+                        for item in items:
+                            orderbook.update(item)
+                if not orderbook.stale:
+                    buffer.clear()
+                    self._orderbooks[pair] = orderbook
+                    return
+            await asyncio.sleep(1)
 
     async def _transport_depth_snapshots(self):
         for orderbook in self._orderbooks.values():
-            depth: PoloniexDepth = await orderbook.snapshot_async()
-            self.transport('depth', depth)
+            depth: PoloniexDepth = await self.snapshot_orderbook(orderbook)
+            if depth is not None:
+                self.transport('depth', depth)
 
     async def _handle_trades(self, item: list, pair: str):
         trade = PoloniexTrades(
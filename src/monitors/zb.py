@@ -2,7 +2,6 @@
 author: thomaszdxsn
 """
 import asyncio
-import json
 from datetime import datetime
 
 from aiohttp import WSMessage
@@ -10,6 +9,7 @@ from aiohttp import WSMessage
 from . import MonitorAbstract
 from ..sdk.zb import ZBRest, ZBWebsocket
 from ..schemas.markets import ZBTrades, ZBTicker, ZBDepth, ZBKline
+from ..schemas.markets.depth import format_levels
 
 __all__ = (
     'ZBMonitor',
@@ -37,7 +37,7 @@ class ZBMonitor(MonitorAbstract):
         )
 
     async def dispatch_ws_msg(self, msg: WSMessage):
-        data = json.loads(msg.data)
+        data = self.ws_sdk.decode(msg.data)
         if data.get('success', None) is False:
             return
         data_type = data['dataType']
@@ -61,7 +61,7 @@ class ZBMonitor(MonitorAbstract):
             )
             for item in data['data']
         ]
-        [self.transport('trades', t) for t in trades]
+        self.transport_many('trades', trades)
 
     async def _handle_ticker(self, data: dict, pair: str):
         tick_data = data['ticker']
@@ -78,20 +78,8 @@ class ZBMonitor(MonitorAbstract):
         self.transport('ticker', ticker)
 
     async def _handle_depth(self, data: dict, pair: str):
-        asks = [
-            {
-                'price': item[0],
-                'amount': item[1]
-            }
-            for item in reversed(data['asks'])
-        ]
-        bids = [
-            {
-                'price': item[0],
-                'amount': item[1]
-            }
-            for item in data['bids']
-        ]
+        asks = format_levels(reversed(data['asks']))
+        bids = format_levels(data['bids'])
         depth = ZBDepth(
             asks=asks,
             bids=bids,
@@ -127,4 +115,4 @@ class ZBMonitor(MonitorAbstract):
             )
             for item in kline_resp.data['data']
         ]
-        [self.transport('kline', k) for k in klines]
+        self.transport_many('kline', klines)
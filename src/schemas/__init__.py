@@ -3,13 +3,16 @@ author: thomaszdxsn
 """
 import dataclasses
 from abc import ABC
-from dataclasses import asdict, dataclass, field
+from dataclasses import dataclass, field
+
+from ._serializer import get_serializer
 
 
 class DataClassAbstract(ABC):
 
     def to_dict(self, dict_factory=dict):
-        return asdict(self, dict_factory=dict_factory)
+        # list/dict字段是浅引用，不会像dataclasses.asdict那样deepcopy，见_serializer
+        return get_serializer(type(self))(self, dict_factory)
 
 
 @dataclass
@@ -0,0 +1,81 @@
+"""
+author: thomaszdxsn
+
+dataclass -> dict的序列化函数，每个类第一次to_dict的时候生成一次，之后直接复用
+
+和dataclasses.asdict的区别:
+    - asdict会递归deepcopy所有的list/dict，depth一条数据就要复制50个dict;
+      这里list/dict/str/float/datetime这类BSON可以直接写入的字段只做浅引用，
+      返回的dict和原数据共享这些list，调用方不要修改它们
+    - 只有类型不确定(Any/Union/tuple/嵌套dataclass...)的字段才会逐个转换
+"""
+import dataclasses
+from datetime import datetime
+from typing import Any, Callable, Dict
+
+__all__ = (
+    'get_serializer',
+    'convert_value',
+)
+
+# BSON原生支持的类型，字段注解是这些类型的时候值原样放进dict
+PASSTHROUGH_TYPES = frozenset((
+    str, int, float, bool, bytes, datetime, list, dict, type(None)
+))
+
+_serializers: Dict[type, Callable] = {}
+
+
+def convert_value(value: Any, dict_factory: Callable=dict) -> Any:
+    """类型不确定的字段，只转换嵌套的dataclass，容器只在里面有dataclass的时候才复制"""
+    if hasattr(type(value), '__dataclass_fields__'):
+        return get_serializer(type(value))(value, dict_factory)
+    if isinstance(value, (list, tuple)):
+        converted = [convert_value(v, dict_factory) for v in value]
+        if all(a is b for a, b in zip(converted, value)):
+            return value
+        if hasattr(value, '_fields'):           # namedtuple
+            return type(value)(*converted)
+        return type(value)(converted)
+    if isinstance(value, dict):
+        converted = {k: convert_value(v, dict_factory)
+                     for k, v in value.items()}
+        if all(converted[k] is v for k, v in value.items()):
+            return value
+        return type(value)(converted)
+    return value
+
+
+def _build_serializer(cls: type) -> Callable:
+    names = []
+    exprs = []
+    for f in dataclasses.fields(cls):
+        names.append(f.name)
+        if f.type in PASSTHROUGH_TYPES:
+            exprs.append(f'self.{f.name}')
+        else:
+            exprs.append(f'_convert(self.{f.name}, dict_factory)')
+    items = ', '.join(f'{name!r}: {expr}'
+                      for name, expr in zip(names, exprs))
+    pairs = ', '.join(f'({name!r}, {expr})'
+                      for name, expr in zip(names, exprs))
+    source = (
+        f'def to_dict(self, dict_factory=dict):\n'
+        f'    if dict_factory is dict:\n'
+        f'        return {{{items}}}\n'
+        f'    return dict_factory([{pairs}])\n'
+    )
+    namespace = {'_convert': convert_value}
+    exec(compile(source, f'<to_dict {cls.__qualname__}>', 'exec'), namespace)
+    serializer = namespace['to_dict']
+    serializer.__qualname__ = f'{cls.__qualname__}.to_dict'
+    return serializer
+
+
+def get_serializer(cls: type) -> Callable:
+    """cls对应的serializer(self, dict_factory)，第一次调用的时候生成"""
+    try:
+        return _serializers[cls]
+    except KeyError:
+        serializer = _serializers[cls] = _build_serializer(cls)
+        return serializer
@@ -14,4 +14,9 @@ class LogMsgFmt(enum.Enum):
     EXCEPTION = '{exc.__class__.__name__}|{exc.args}'
     WS_SUB_MSG = 'sub|{msg}'
     WS_RECV_MSG = 'recv|{msg}'
-    MONGO_OPS = 'mongo-ops|{}'
\ No newline at end of file
+    WS_RECONNECT = 'reconnect|downtime={downtime:.1f}s|reconnects={reconnects}'
+    WS_UNACKED = 'unacked|{count}|{channels}'
+    MONGO_OPS = 'mongo-ops|{}'
+    MONGO_BATCH_STATS = 'mongo-batch|{collection}|reasons={reasons}|sizes={sizes}'
+    MONGO_PRIORITY_STATS = 'mongo-priority|{name}|{stats}'
+    LATENCY_STATS = 'latency|{key}|{stage}|{stats}'
@@ -5,7 +5,7 @@ author: thomaszdxsn
 """
 from datetime import datetime
 from dataclasses import field, dataclass
-from typing import Union
+from typing import Union, ClassVar, Tuple
 
 from . import MarketItemBase
 from .. import add_slots
@@ -84,6 +84,7 @@ class BitmexDepth(MarketItemBase):
     bids: list
     server_created: datetime
     created: datetime = field(default_factory=factory_utcnow)
+    level_fields: ClassVar[Tuple[str, ...]] = ('price', 'amount')
 
 
 @add_slots
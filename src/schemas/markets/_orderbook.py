@@ -1,33 +1,65 @@
 """
 author: thomaszdxsn
 """
+import zlib
 from abc import ABC, abstractmethod
 from asyncio import locks
-from typing import List
+from datetime import datetime
+from decimal import Decimal
+from typing import List, Union
 
 from dynaconf import settings
 
 from .depth import (Depth, BitfinexTradeDepth, BitfinexFundingDepth,
-                    HitBTCDepth, PoloniexDepth)
+                    HitBTCDepth, PoloniexDepth, BinanceDepth, format_levels)
+from ._bitmex import BitmexDepth
+from ._sorted_book import SortedBook, to_ticks
 
 __all__ = (
     'BitfinexTradeOrderbook',
     'BitfinexFundingOrderbook',
     'Orderbook',
+    'FixedPointOrderbook',
     'HitBTCOrderbook',
-    'PoloniexOrderbook'
+    'PoloniexOrderbook',
+    'BinanceOrderbook',
+    'BitmexOrderbook'
 )
 
 ORDERBOOK_LEVEL = settings.as_int('ORDERBOOK_LEVEL')
+BITFINEX_CHECKSUM_LEVEL = 25
+
+
+def js_number_str(value) -> str:
+    """
+    按javascript的Number.toString格式化数字(bitfinex checksum需要)
+    python: 1e-05, 1.5e-07    js: 0.00001, 1.5e-7
+    """
+    if isinstance(value, int):
+        return str(value)
+    text = repr(value)
+    if 'e' not in text:
+        return text
+    mantissa, exp = text.split('e')
+    exp = int(exp)
+    if -7 < exp < 21:
+        return format(Decimal(text), 'f')
+    return f"{mantissa}e{'-' if exp < 0 else '+'}{abs(exp)}"
 
 
 class Orderbook(ABC):
 
     def __init__(self, pair: str):
-        self._bids = dict()
-        self._asks = dict()
+        self._bids = SortedBook(descending=True)
+        self._asks = SortedBook()
         self._async_lock = locks.Lock()
         self._pair = pair
+        # 前ORDERBOOK_LEVEL档是否在上次snapshot之后发生过变化
+        self.changed = True
+        self.suppressed_snapshots = 0
+        # 最后应用的交易所sequence，出现gap之后stale为True，需要重新同步
+        self.sequence = None
+        self.stale = False
 
     def initialize(self, data_list: List[list]):
         """通过snapshot初始化"""
@@ -49,6 +81,45 @@ class Orderbook(ABC):
         async with self._async_lock:
             return self.snapshot()
 
+    def snapshot_if_changed(self) -> Union[Depth, None]:
+        """可见档位没有变化的时候返回None，并计入suppressed_snapshots"""
+        if not self.changed:
+            self.suppressed_snapshots += 1
+            return None
+        self.changed = False
+        return self.snapshot()
+
+    async def snapshot_if_changed_async(self) -> Union[Depth, None]:
+        async with self._async_lock:
+            return self.snapshot_if_changed()
+
+    def check_sequence(self, sequence: int) -> bool:
+        """
+        sequence连续的时候返回True并记录
+        重复或者过期的sequence返回False; 出现gap时返回False并标记stale
+        """
+        if self.stale:
+            return False
+        if self.sequence is not None:
+            if sequence <= self.sequence:
+                return False
+            if sequence != self.sequence + 1:
+                self.stale = True
+                return False
+        self.sequence = sequence
+        return True
+
+    def _set_level(self, book: SortedBook, price, value):
+        if not self.changed and book.is_visible(price, ORDERBOOK_LEVEL):
+            self.changed = True
+        book[price] = value
+
+    def _remove_level(self, book: SortedBook, price):
+        if not self.changed and price in book \
+                and book.is_visible(price, ORDERBOOK_LEVEL):
+            self.changed = True
+        book.pop(price)
+
 
 class BitfinexTradeOrderbook(Orderbook):
     """
@@ -63,38 +134,55 @@ class BitfinexTradeOrderbook(Orderbook):
         price, count, amount = item
         book = self._bids if amount > 0 else self._asks
         if count > 0:
-            book[price] = {
-                'count': count,
-                'amount': amount,
-            }
+            self._set_level(book, price, (count, amount))
         else:
-            book.pop(price, None)
+            self._remove_level(book, price)
 
     def snapshot(self) -> BitfinexTradeDepth:
-        bids = [
-            {
-                'price': price,
-                'count': info['count'],
-                'amount': info['amount']
-            }
-            for price, info in
-            sorted(self._bids.items(), key=lambda x: -x[0])[:ORDERBOOK_LEVEL]
-        ]
-        asks = [
-            {
-                'price': price,
-                'count': info['count'],
-                'amount': info['amount']
-            }
-            for price, info in
-            sorted(self._asks.items(), key=lambda x: x[0])[:ORDERBOOK_LEVEL]
-        ]
+        fields = BitfinexTradeDepth.level_fields
+        bids = format_levels(
+            ((price, count, amount)
+             for price, (count, amount) in self._bids.top(ORDERBOOK_LEVEL)),
+            fields
+        )
+        asks = format_levels(
+            ((price, count, amount)
+             for price, (count, amount) in self._asks.top(ORDERBOOK_LEVEL)),
+            fields
+        )
         return BitfinexTradeDepth(
             pair=self._pair,
             asks=asks,
             bids=bids
         )
 
+    def checksum(self) -> int:
+        """
+        doc: https://docs.bitfinex.com/v2/docs/ws-general#section-checksums
+
+        前25档bids和asks交替排列 "bid_price:bid_amount:ask_price:ask_amount..."
+        的CRC32(signed int32)
+        """
+        bids = list(self._bids.top(BITFINEX_CHECKSUM_LEVEL))
+        asks = list(self._asks.top(BITFINEX_CHECKSUM_LEVEL))
+        values = []
+        for i in range(BITFINEX_CHECKSUM_LEVEL):
+            if i < len(bids):
+                price, (_, amount) = bids[i]
+                values.extend((price, amount))
+            if i < len(asks):
+                price, (_, amount) = asks[i]
+                values.extend((price, amount))
+        payload = ':'.join(js_number_str(v) for v in values)
+        crc = zlib.crc32(payload.encode())
+        return crc - (1 << 32) if crc >= (1 << 31) else crc
+
+    def verify_checksum(self, checksum: int) -> bool:
+        """checksum不一致时标记stale"""
+        if self.checksum() != checksum:
+            self.stale = True
+        return not self.stale
+
 
 class BitfinexFundingOrderbook(Orderbook):
     """
@@ -112,102 +200,103 @@ class BitfinexFundingOrderbook(Orderbook):
         rate, period, count, amount = item
         book = self._bids if amount < 0 else self._asks
         if count > 0:
-            book[rate] = {
-                'count': count,
-                'amount': amount,
-                'period': period
-            }
+            self._set_level(book, rate, (count, amount, period))
         else:
-            book.pop(rate, None)
+            self._remove_level(book, rate)
 
     def snapshot(self) -> BitfinexFundingDepth:
-        bids = [
-            {
-                'rate': rate,
-                'count': info['count'],
-                'amount': info['amount'],
-                'period': info['period']
-            }
-            for rate, info in
-            sorted(self._bids.items(), key=lambda x: -x[0])[:ORDERBOOK_LEVEL]
-        ]
-        asks = [
-            {
-                'rate': rate,
-                'count': info['count'],
-                'amount': info['amount'],
-                'period': info['period']
-            }
-            for rate, info in
-            sorted(self._asks.items(), key=lambda x: x[0])[:ORDERBOOK_LEVEL]
-        ]
+        fields = BitfinexFundingDepth.level_fields
+        bids = format_levels(
+            ((rate, count, amount, period)
+             for rate, (count, amount, period) in
+             self._bids.top(ORDERBOOK_LEVEL)),
+            fields
+        )
+        asks = format_levels(
+            ((rate, count, amount, period)
+             for rate, (count, amount, period) in
+             self._asks.top(ORDERBOOK_LEVEL)),
+            fields
+        )
         return BitfinexFundingDepth(
             pair=self._pair,
             asks=asks,
             bids=bids
         )
 
+    def verify_checksum(self, checksum: int) -> bool:
+        # funding book的checksum格式没有文档，不做校验
+        return not self.stale
+
 
-class HitBTCOrderbook(Orderbook):
+class FixedPointOrderbook(Orderbook):
+    """
+    价格和数量都是字符串的orderbook(hitbtc, poloniex)
+
+    每个档位在写入的时候只解析一次:
+    key是精确的定点整数(price * 10 ** price_precision)，
+    value是(price, amount)两个float，snapshot的时候不需要再解析字符串
+    """
+    price_precision: int = 8
+
+    def __init__(self, pair: str):
+        super(FixedPointOrderbook, self).__init__(pair)
+        self._price_scale = 10 ** self.price_precision
+
+    def _ingest_level(self, book: SortedBook, price: str, size: str):
+        ticks = to_ticks(price, self.price_precision)
+        amount = float(size)
+        if amount == 0:
+            self._remove_level(book, ticks)
+        else:
+            self._set_level(book, ticks,
+                            (ticks / self._price_scale, amount))
+
+    @staticmethod
+    def _format_levels(book: SortedBook) -> list:
+        return format_levels(
+            level for _, level in book.top(ORDERBOOK_LEVEL)
+        )
+
+
+class HitBTCOrderbook(FixedPointOrderbook):
     """
     doc: https://api.hitbtc.com/?python#subscribe-to-orderbook
     """
+    price_precision = 12
 
     def initialize(self, data: dict):
-        params = data['params']
-        for item in params['ask']:
-            price, size = item['price'], item['size']
-            self._asks[price] = size
-        for item in params['bid']:
-            price, size = item['price'], item['size']
-            self._bids[price] = size
+        self.update(data)
 
     def update(self, data: dict):
         params = data['params']
         for item in params['ask']:
-            price, size = item['price'], item['size']
-            if float(item['size']) == 0:
-                self._asks.pop(price)
-            else:
-                self._asks[price] = size
+            self._ingest_level(self._asks, item['price'], item['size'])
         for item in params['bid']:
-            price, size = item['price'], item['size']
-            if float(item['size']) == 0:
-                self._bids.pop(price)
-            else:
-                self._bids[price] = size
-
-    def snapshot(self):
-        asks = [
-            {
-                'price': float(price),
-                'amount': float(amount)
-            }
-            for price, amount in sorted(
-                self._asks.items(),
-                key=lambda x: float(x[0])
-            )[:ORDERBOOK_LEVEL]
-        ]
-        bids = [
-            {
-                'price': float(price),
-                'amount': float(amount)
-            }
-            for price, amount in sorted(
-                self._bids.items(),
-                key=lambda x: -float(x[0])
-            )[:ORDERBOOK_LEVEL]
-        ]
+            self._ingest_level(self._bids, item['price'], item['size'])
+
+    def snapshot(self) -> HitBTCDepth:
         return HitBTCDepth(
             pair=self._pair,
-            asks=asks,
-            bids=bids
+            asks=self._format_levels(self._asks),
+            bids=self._format_levels(self._bids)
         )
 
 
-class PoloniexOrderbook(Orderbook):
+class PoloniexOrderbook(FixedPointOrderbook):
+    """
+    ws的snapshot是完整的orderbook；REST returnOrderBook只有depth档，
+    返回的档位数等于depth时是截断的，超出snapshot价格范围的更新直接丢掉，
+    否则范围外缺失的档位会在价格移动过去之后出现在前N档里
+    """
+    price_precision = 8
 
-    def initialize(self, data_list:List[dict]):
+    def __init__(self, pair: str):
+        super(PoloniexOrderbook, self).__init__(pair)
+        self.ask_bound = None       # 截断时snapshot里最高的ask(ticks)
+        self.bid_bound = None       # 截断时snapshot里最低的bid(ticks)
+
+    def initialize(self, data_list: List[dict]):
         """
         "orderBook": [
           {
@@ -221,8 +310,29 @@ class PoloniexOrderbook(Orderbook):
             …
           }
         """
-        self._asks = data_list[0]
-        self._bids = data_list[1]
+        for price, size in data_list[0].items():
+            self._ingest_level(self._asks, price, size)
+        for price, size in data_list[1].items():
+            self._ingest_level(self._bids, price, size)
+
+    def initialize_rest(self, data: dict, depth: int=None):
+        """
+        returnOrderBook:
+        {"asks": [["0.07000000", 1.5], ...], "bids": [...],
+         "isFrozen": "0", "seq": 123456}
+        depth: 请求的档位数，某一边返回的档位数达到depth时记录这一边的价格边界
+        """
+        for price, size in data['asks']:
+            self._ingest_level(self._asks, price, size)
+        for price, size in data['bids']:
+            self._ingest_level(self._bids, price, size)
+        if depth and len(data['asks']) >= depth:
+            self.ask_bound = to_ticks(data['asks'][-1][0],
+                                      self.price_precision)
+        if depth and len(data['bids']) >= depth:
+            self.bid_bound = to_ticks(data['bids'][-1][0],
+                                      self.price_precision)
+        self.sequence = data['seq']
 
     def update(self, item: list):
         """
@@ -230,40 +340,135 @@ class PoloniexOrderbook(Orderbook):
         ["o", <1 for buy 0 for sell>, "<price>", "<size>"]
         """
         side, price, size = item[1:]
-        book = self._bids if side == 1 else self._asks
-        if float(size) == 0:
-            # remove
-            book.pop(price)
+        if side == 1:
+            if self.bid_bound is not None and \
+                    to_ticks(price, self.price_precision) < self.bid_bound:
+                return
+            self._ingest_level(self._bids, price, size)
         else:
-            # update
-            book[price] = size
+            if self.ask_bound is not None and \
+                    to_ticks(price, self.price_precision) > self.ask_bound:
+                return
+            self._ingest_level(self._asks, price, size)
 
     def snapshot(self) -> PoloniexDepth:
-        asks = [
-            {
-                'price': float(price),
-                'amount': float(amount)
-            }
-            for price, amount in
-            sorted(
-                self._asks.items(), key=lambda x: float(x[0])
-            )[:ORDERBOOK_LEVEL]
-        ]
-        bids = [
-            {
-                'price': float(price),
-                'amount': float(amount)
-            }
-            for price, amount in
-            sorted(
-                self._bids.items(), key=lambda x: -float(x[0])
-            )[:ORDERBOOK_LEVEL]
-        ]
         return PoloniexDepth(
-            asks=asks,
-            bids=bids,
+            asks=self._format_levels(self._asks),
+            bids=self._format_levels(self._bids),
             pair=self._pair
         )
 
 
+class BinanceOrderbook(FixedPointOrderbook):
+    """
+    doc: https://github.com/binance-exchange/binance-official-api-docs/blob/master/web-socket-streams.md#how-to-manage-a-local-order-book-correctly
+
+    通过REST /api/v1/depth初始化，然后应用<symbol>@depth的diff事件
+    事件的U/u和lastUpdateId不连续时，stale设置为True，需要重新同步
+    """
+    price_precision = 8
+
+    def __init__(self, pair: str):
+        super(BinanceOrderbook, self).__init__(pair)
+        self.last_update_id = 0
+
+    def initialize(self, data: dict):
+        """
+        {
+          "lastUpdateId": 1027024,
+          "bids": [["4.00000000", "431.00000000", []]],
+          "asks": [["4.00000200", "12.00000000", []]]
+        }
+        """
+        self.last_update_id = data['lastUpdateId']
+        for item in data['asks']:
+            self._ingest_level(self._asks, item[0], item[1])
+        for item in data['bids']:
+            self._ingest_level(self._bids, item[0], item[1])
+
+    def update(self, data: dict):
+        """
+        {
+          "e": "depthUpdate", "E": 123456789, "s": "BNBBTC",
+          "U": 157, "u": 160,
+          "b": [["0.0024", "10", []]],
+          "a": [["0.0026", "100", []]]
+        }
+        """
+        if self.stale or data['u'] <= self.last_update_id:
+            # 已经包含在snapshot里面的事件
+            return
+        if data['U'] > self.last_update_id + 1:
+            # 中间丢了事件
+            self.stale = True
+            return
+        for item in data['a']:
+            self._ingest_level(self._asks, item[0], item[1])
+        for item in data['b']:
+            self._ingest_level(self._bids, item[0], item[1])
+        self.last_update_id = data['u']
+
+    def snapshot(self) -> BinanceDepth:
+        return BinanceDepth(
+            pair=self._pair,
+            asks=self._format_levels(self._asks),
+            bids=self._format_levels(self._bids),
+            last_update_id=self.last_update_id
+        )
+
+
+class BitmexOrderbook(Orderbook):
+    """
+    doc: https://www.bitmex.com/app/wsAPI#OrderBookL2
+
+    orderBookL2/orderBookL2_25, 档位通过id定位:
+    {"table": "orderBookL2_25", "action": "partial|insert|update|delete",
+     "data": [{"symbol": "XBTUSD", "id": 8799000000, "side": "Sell",
+               "size": 100, "price": 10000}]}
+    update和delete只带id，不带price
+    """
+
+    def __init__(self, pair: str):
+        super(BitmexOrderbook, self).__init__(pair)
+        self._levels = dict()           # id -> (book, price)
+        # L2数据里没有时间戳，用最后一次更新的本地时间
+        self.server_created = datetime.utcnow()
 
+    def initialize(self, data_list: List[dict]):
+        for item in data_list:
+            self._insert(item)
+
+    def update(self, data: dict):
+        action = data['action']
+        if action == 'update':
+            for item in data['data']:
+                level = self._levels.get(item['id'])
+                if level is not None:
+                    book, price = level
+                    self._set_level(book, price, item['size'])
+        elif action == 'insert':
+            for item in data['data']:
+                self._insert(item)
+        elif action == 'delete':
+            for item in data['data']:
+                level = self._levels.pop(item['id'], None)
+                if level is not None:
+                    book, price = level
+                    self._remove_level(book, price)
+        self.server_created = datetime.utcnow()
+
+    def _insert(self, item: dict):
+        book = self._bids if item['side'] == 'Buy' else self._asks
+        price = item['price']
+        self._levels[item['id']] = (book, price)
+        self._set_level(book, price, item['size'])
+
+    def snapshot(self) -> BitmexDepth:
+        asks = format_levels(self._asks.top(ORDERBOOK_LEVEL))
+        bids = format_levels(self._bids.top(ORDERBOOK_LEVEL))
+        return BitmexDepth(
+            pair=self._pair,
+            asks=asks,
+            bids=bids,
+            server_created=self.server_created
+        )
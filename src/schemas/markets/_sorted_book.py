@@ -0,0 +1,72 @@
+"""
+author: thomaszdxsn
+
+orderbook单边的价格档位容器，档位始终保持有序，
+插入/删除是O(log n)，读取前N档是O(N)，不需要每次snapshot都全量排序
+"""
+import operator
+from itertools import islice
+from typing import Any, Iterator, Tuple
+
+from sortedcontainers import SortedDict
+
+__all__ = (
+    'SortedBook',
+    'to_ticks',
+)
+
+
+def to_ticks(value: str, precision: int) -> int:
+    """
+    十进制字符串 -> 精确的定点整数，不经过float
+    to_ticks('0.00001823', 8) -> 1823
+    """
+    whole, _, frac = value.partition('.')
+    if len(frac) > precision:
+        frac = frac.rstrip('0')
+        if len(frac) > precision:
+            raise ValueError(f'{value!r} has more than {precision} decimals')
+    return int(whole + frac.ljust(precision, '0'))
+
+
+class SortedBook(object):
+    """
+    price -> level info
+    bids使用descending=True(价格从高到低), asks使用默认(价格从低到高)
+    price必须是数字类型
+    """
+    __slots__ = ('_levels', 'descending')
+
+    def __init__(self, descending: bool=False):
+        self.descending = descending
+        self._levels = SortedDict(operator.neg) if descending else SortedDict()
+
+    def __len__(self) -> int:
+        return len(self._levels)
+
+    def __contains__(self, price) -> bool:
+        return price in self._levels
+
+    def __getitem__(self, price) -> Any:
+        return self._levels[price]
+
+    def __setitem__(self, price, value: Any):
+        self._levels[price] = value
+
+    def pop(self, price, default: Any=None) -> Any:
+        return self._levels.pop(price, default)
+
+    def clear(self):
+        self._levels.clear()
+
+    def is_visible(self, price, n: int) -> bool:
+        """price是否落在(或者会落在)前n档之内, O(log n)"""
+        if len(self._levels) < n:
+            return True
+        nth_price = self._levels.keys()[n - 1]
+        return price >= nth_price if self.descending else price <= nth_price
+
+    def top(self, n: int) -> Iterator[Tuple[Any, Any]]:
+        """最优的n个档位, (price, value)"""
+        levels = self._levels
+        return ((price, levels[price]) for price in islice(levels, n))
@@ -3,12 +3,17 @@ author: thomaszdxsn
 """
 from datetime import datetime
 from dataclasses import dataclass, field
+from typing import ClassVar, Iterable, Sequence, Tuple
+
+from dynaconf import settings
 
 from . import MarketItemBase
 from .. import add_slots
 from .._factories import factory_utcnow
 
 __all__ = (
+    'format_levels',
+    'PRICE_AMOUNT',
     'OkexSpotDepth',
     'OkexFutureDepth',
     'BinanceDepth',
@@ -25,6 +30,20 @@ __all__ = (
 )
 
 
+# packed: [[price, amount], ...]，每一档的字段顺序见Depth.level_fields
+# dict: [{'price': price, 'amount': amount}, ...]，旧格式
+DEPTH_LEVEL_FORMAT = settings.get('DEPTH_LEVEL_FORMAT', 'dict')
+PRICE_AMOUNT = ('price', 'amount')
+
+
+def format_levels(levels: Iterable[Sequence],
+                  fields: Tuple[str, ...]=PRICE_AMOUNT) -> list:
+    """depth档位 -> DEPTH_LEVEL_FORMAT指定的格式"""
+    if DEPTH_LEVEL_FORMAT == 'dict':
+        return [dict(zip(fields, level)) for level in levels]
+    return [list(level) for level in levels]
+
+
 @add_slots
 @dataclass
 class Depth(MarketItemBase):
@@ -32,6 +51,7 @@ class Depth(MarketItemBase):
     asks: list
     pair: str
     created: datetime=field(default_factory=factory_utcnow)
+    level_fields: ClassVar[Tuple[str, ...]] = PRICE_AMOUNT
 
 
 @add_slots
@@ -45,6 +65,10 @@ class OkexSpotDepth(Depth):
 class OkexFutureDepth(Depth):
     contract_type: str='this_week'
     server_created: datetime=field(default_factory=factory_utcnow)
+    level_fields: ClassVar[Tuple[str, ...]] = (
+        'price', 'sheet_quantity', 'token_quantity',
+        'sheet_cumulant', 'token_cumulant'
+    )
 
 
 @add_slots
@@ -64,13 +88,15 @@ class HuobiDepth(Depth):
 @add_slots
 @dataclass
 class BitfinexTradeDepth(Depth):
-    pass
+    level_fields: ClassVar[Tuple[str, ...]] = ('price', 'count', 'amount')
 
 
 @add_slots
 @dataclass
 class BitfinexFundingDepth(Depth):
-    pass
+    level_fields: ClassVar[Tuple[str, ...]] = (
+        'rate', 'count', 'amount', 'period'
+    )
 
 
 @add_slots
@@ -81,6 +107,7 @@ class BitflyerDepth(MarketItemBase):
     bids: list
     mid_price: float
     created: datetime=field(default_factory=factory_utcnow)
+    level_fields: ClassVar[Tuple[str, ...]] = PRICE_AMOUNT
 
 
 @add_slots
@@ -1,9 +1,10 @@
 """
 author: thomaszdxsn
 """
+import bisect
 import dataclasses
 import enum
-from typing import Any
+from typing import Any, Dict, List
 
 from . import DataClassAbstract
 
@@ -18,3 +19,32 @@ class HttpErrorEnum(enum.Enum):
 class ResponseMsg(DataClassAbstract):
     data: Any
     error: int = HttpErrorEnum.NotError.value
+
+
+DOWNTIME_BUCKETS = (1, 2, 5, 10, 30, 60, 120, 300)
+
+
+@dataclasses.dataclass
+class ConnectionStats:
+    """websocket重连次数和每次重连的停机时间(连接断开 -> 重新订阅完成)"""
+    reconnects: int = 0
+    downtime_total: float = 0.0
+    downtime_last: float = 0.0
+    downtime_max: float = 0.0
+    # downtimes[i]: 停机时间 <= DOWNTIME_BUCKETS[i] 秒的次数，最后一个是+Inf
+    downtimes: List[int] = dataclasses.field(
+        default_factory=lambda: [0] * (len(DOWNTIME_BUCKETS) + 1)
+    )
+    unacked: int = 0            # 最近一次订阅之后没有被确认的channel数
+    decode_errors: int = 0      # 解压/json解码失败的消息数
+
+    def observe_downtime(self, seconds: float):
+        self.reconnects += 1
+        self.downtime_total += seconds
+        self.downtime_last = seconds
+        self.downtime_max = max(self.downtime_max, seconds)
+        self.downtimes[bisect.bisect_left(DOWNTIME_BUCKETS, seconds)] += 1
+
+    def histogram(self) -> Dict[str, int]:
+        bounds = [str(b) for b in DOWNTIME_BUCKETS] + ['+Inf']
+        return dict(zip(bounds, self.downtimes))
@@ -3,21 +3,25 @@ author: thomaszdxsn
 """
 import asyncio
 import atexit
+import contextvars
 import logging
 import os
+import random
+import time
 from abc import ABC
 from asyncio import AbstractEventLoop
-from typing import Union, Callable
+from typing import Any, Union, Callable, Hashable, List
 
 from aiohttp import ClientSession, ClientTimeout, ClientWebSocketResponse
 from dynaconf import settings
 from requests import Session
 
 from ..schemas import Params
-from ..schemas.sdk import ResponseMsg
+from ..schemas.sdk import ConnectionStats, ResponseMsg
 from ..schemas.logs import LogMsgFmt
 from ..utils import (NoSSlVerifyTCPConnector, close_session,
-                     SessionWrapper, AsyncSessionWrapper)
+                     SessionWrapper, AsyncSessionWrapper, Inflater)
+from .decoder import DECODE_ERRORS, loads
 
 
 class RestSdkAbstract(ABC):
@@ -124,10 +128,19 @@ class RestSdkAbstract(ABC):
         raise NotImplementedError()
 
 
+# 分片模式下，当前协程正在处理的是哪个分片的消息，见sharding.ShardedWebsocket
+current_shard = contextvars.ContextVar('current_shard', default=None)
+
+
 class WebsocketSdkAbstract(ABC):
     """
     运行流程:
     register_xxx |> setup_ws_client |> subscribe |> connect
+
+    断线重连: 指数退避 + jitter，间隔从WS_RECONNECT_INTERVAL开始翻倍，最多WS_RECONNECT_MAX_INTERVAL
+    订阅: 按subscribe_rate(条/秒)匀速发送，
+          子类实现了channel_id的话，WS_ACK_TIMEOUT秒之后只重发没有被确认(ack)的channel
+    录制: recorder(recorder.FrameRecorder)不为None时，connect收到的原始消息都会写入文件
     """
     _request_read_timeout: float = settings.as_float('REQUEST_READ_TIMEOUT')
     _request_conn_timeout: float = settings.as_float('REQUEST_CONN_TIMEOUT')
@@ -136,6 +149,13 @@ class WebsocketSdkAbstract(ABC):
     _ws_heartbeat: float = settings.as_float('WS_HEARTBEAT')
     _ws_reconnect_interval: float = settings.as_float('WS_RECONNECT_INTERVAL')
     _ws_retry: bool = settings['WS_RETRY_ON_CONNECT_LOST']
+    _ws_reconnect_max_interval: float = float(
+        settings.get('WS_RECONNECT_MAX_INTERVAL', 60)
+    )
+    _ws_subscribe_rate: float = float(settings.get('WS_SUBSCRIBE_RATE', 0))
+    _ws_ack_timeout: float = float(settings.get('WS_ACK_TIMEOUT', 10))
+    _ws_ack_retries: int = int(settings.get('WS_ACK_RETRIES', 3))
+    _ws_wbits: Union[int, None] = None     # 消息是压缩的时候是zlib的wbits
     ws_url: str
 
     def __init__(self, loop: Union[AbstractEventLoop, None]=None):
@@ -155,13 +175,79 @@ class WebsocketSdkAbstract(ABC):
             connector=NoSSlVerifyTCPConnector(),
             timeout=self._async_timeout
         )
-        self.ws_client = None
+        self._ws_client = None
         self.register_hub = list()
+        self.connection_hub = list()    # 每个连接都要先发送的消息(比如bitfinex的conf)
+        self.shard_index = 0
+        self._shards: List['WebsocketSdkAbstract'] = []
+        self.subscribe_rate = self._ws_subscribe_rate
+        self.connection_stats = ConnectionStats()
+        self._reconnect_attempt = 0
+        self._acked = set()
+        self._ack_watcher = None
+        self.inflater = (Inflater(self._ws_wbits)
+                         if self._ws_wbits is not None else None)
+        self.recorder = None
         atexit.register(close_session, self._session)
 
+    @property
+    def ws_client(self) -> Union[ClientWebSocketResponse, None]:
+        """分片模式下，返回正在处理的消息所在分片的连接"""
+        if self._ws_client is None and self._shards:
+            shard = current_shard.get()
+            if shard is not None:
+                return shard.ws_client
+        return self._ws_client
+
+    @ws_client.setter
+    def ws_client(self, ws_client: Union[ClientWebSocketResponse, None]):
+        self._ws_client = ws_client
+
+    @staticmethod
+    def is_open(ws_client: Union[ClientWebSocketResponse, None]) -> bool:
+        """连接建立之前、重连期间和回放(recorder.replay)时没有可用的连接"""
+        return ws_client is not None and not ws_client.closed
+
+    def ws_client_for(self, channel_info) -> ClientWebSocketResponse:
+        """订阅了channel_info的连接，用于在消息处理之外(比如resync)发送消息"""
+        for shard in self._shards:
+            if channel_info in shard.register_hub:
+                return shard.ws_client
+        return self.ws_client
+
+    def current_shard_index(self) -> int:
+        shard = current_shard.get()
+        return shard.shard_index if shard is not None else self.shard_index
+
+    def _current(self) -> 'WebsocketSdkAbstract':
+        """分片模式下是正在处理的消息所在的分片"""
+        shard = current_shard.get()
+        return shard if self._shards and shard is not None else self
+
+    def inflate(self, raw_data: bytes) -> bytes:
+        """用收到这条消息的连接的解压上下文解压"""
+        return self._current().inflater(raw_data)
+
+    def decode(self, raw_data: Union[str, bytes], inflate: bool=False) -> Any:
+        """
+        解压(inflate=True)并解码json，
+        失败的消息计入收到这条消息的连接的connection_stats.decode_errors
+        """
+        current = self._current()
+        try:
+            if inflate:
+                raw_data = current.inflater(raw_data)
+            return loads(raw_data)
+        except DECODE_ERRORS:
+            current.connection_stats.decode_errors += 1
+            raise
+
     def register_channel(self, channel_info):
         self.register_hub.append(channel_info)
 
+    def register_connection_channel(self, channel_info):
+        self.connection_hub.append(channel_info)
+
     def register_kline(self, *args, **kwargs):
         raise NotImplementedError()
 
@@ -188,30 +274,137 @@ class WebsocketSdkAbstract(ABC):
             atexit.register(close_session, self.ws_client)
         return self.ws_client
 
+    async def send_channels(self, channels: list):
+        """按subscribe_rate匀速发送订阅消息，避免被交易所限流"""
+        interval = 1 / self.subscribe_rate if self.subscribe_rate else 0
+        for i, channel_info in enumerate(channels):
+            if interval and i:
+                await asyncio.sleep(interval)
+            await self.ws_client.send_json(channel_info)
+
+    def build_subscribe_msgs(self, channels: list) -> list:
+        """
+        register_hub里的channel -> 实际发送的订阅消息
+        默认每个channel就是一条订阅消息，一条消息订阅多个channel的交易所在子类里合并
+        """
+        return channels
+
+    def channel_id(self, channel_info) -> Union[Hashable, None]:
+        """
+        订阅确认消息里能拿到的channel标识，返回None表示不跟踪这个channel的确认
+        子类实现之后，monitor收到确认消息时调用ack(channel_id)
+        """
+        return None
+
+    def ack(self, channel_id: Hashable):
+        self._current()._acked.add(channel_id)
+
+    def unacked_channels(self) -> list:
+        unacked = []
+        for channel_info in self.register_hub:
+            channel_id = self.channel_id(channel_info)
+            if channel_id is not None and channel_id not in self._acked:
+                unacked.append(channel_info)
+        return unacked
+
+    def _watch_acks(self):
+        """订阅消息发送完之后开始计时"""
+        if any(self.channel_id(c) is not None for c in self.register_hub):
+            self._ack_watcher = asyncio.ensure_future(self._resend_unacked())
+
+    async def _resend_unacked(self):
+        """同一个连接上只重发没有被确认的channel"""
+        for _ in range(self._ws_ack_retries):
+            await asyncio.sleep(self._ws_ack_timeout)
+            unacked = self.unacked_channels()
+            self.connection_stats.unacked = len(unacked)
+            if not unacked:
+                return
+            msg = LogMsgFmt.WS_UNACKED.value.format(
+                count=len(unacked),
+                channels=[self.channel_id(c) for c in unacked[:5]]
+            )
+            self.logger.warning(msg)
+            try:
+                await self.send_channels(self.build_subscribe_msgs(unacked))
+            except Exception as exc:
+                msg = LogMsgFmt.EXCEPTION.value.format(exc=exc)
+                self.logger.error(msg)
+                return
+
+    def reconnect_delay(self, attempt: int) -> float:
+        """第attempt次重连之前等待的时间: [d/2, d]之间随机, d = interval * 2^attempt"""
+        delay = min(self._ws_reconnect_max_interval,
+                    self._ws_reconnect_interval * 2 ** min(attempt, 16))
+        return delay / 2 + random.uniform(0, delay / 2)
+
+    async def _backoff(self):
+        delay = self.reconnect_delay(self._reconnect_attempt)
+        self._reconnect_attempt += 1
+        self.logger.warning(f'websocket reconnect in {delay:.1f}s...')
+        await asyncio.sleep(delay)
+
+    async def _close_ws_client(self):
+        if self._ws_client is not None:
+            try:
+                await self._ws_client.close()
+            except Exception as exc:
+                msg = LogMsgFmt.EXCEPTION.value.format(exc=exc)
+                self.logger.error(msg)
+            self._ws_client = None
+
     async def subscribe(self, *args, **kwargs):
         while True:
             try:
                 if not self.ws_client:
                     await self.setup_ws_client()
-                for channel_info in self.register_hub:
-                    await self.ws_client.send_json(channel_info)
+                if self._ack_watcher is not None:
+                    self._ack_watcher.cancel()
+                self._acked.clear()
+                await self.send_channels(
+                    self.connection_hub +
+                    self.build_subscribe_msgs(self.register_hub)
+                )
+                self._watch_acks()
             except Exception as exc:
                 msg = LogMsgFmt.EXCEPTION.value.format(exc=exc)
                 self.logger.error(msg, exc_info=True)
                 if self._ws_retry:
-                    await asyncio.sleep(self._ws_reconnect_interval)
-                    self.logger.warning('websocket reconnect...')
+                    await self._close_ws_client()
+                    await self._backoff()
                 else:
                     raise
             else:
                 break
 
     async def connect(self, handler: Callable):
+        recorder = self.recorder
         async for msg in self.ws_client:
+            if recorder is not None:
+                recorder.write(msg)
             await handler(msg)
 
+    async def _resubscribe(self):
+        """
+        重连之后重新订阅，subscribe抛出异常(WS_RETRY_ON_CONNECT_LOST关闭或者子类自己的subscribe)时
+        退避之后重试，不能让异常结束keep_connect的重连循环
+        """
+        while True:
+            try:
+                await self.subscribe()
+            except asyncio.CancelledError:
+                raise
+            except Exception as exc:
+                msg = LogMsgFmt.EXCEPTION.value.format(exc=exc)
+                self.logger.error(msg, exc_info=True)
+                await self._close_ws_client()
+                await self._backoff()
+            else:
+                return
+
     async def keep_connect(self, handler: Callable):
         while True:
+            connected_at = time.monotonic()
             try:
                 await self.connect(handler)
             except Exception as exc:
@@ -220,11 +413,19 @@ class WebsocketSdkAbstract(ABC):
             finally:
                 # reconnect
                 # 有时候ws链接会正常关闭，必须重连否则收不到新的消息
-                await asyncio.sleep(self._ws_reconnect_interval)
-                self.logger.warning('websocket reconnect...')
-                await self.ws_client.close()
-                self.ws_client = None
-                await self.subscribe()
+                down_since = time.monotonic()
+                if down_since - connected_at > self._ws_reconnect_max_interval:
+                    self._reconnect_attempt = 0     # 连接稳定过一段时间，退避重新开始
+                await self._close_ws_client()
+                await self._backoff()
+                await self._resubscribe()
+                stats = self.connection_stats
+                stats.observe_downtime(time.monotonic() - down_since)
+                msg = LogMsgFmt.WS_RECONNECT.value.format(
+                    downtime=stats.downtime_last,
+                    reconnects=stats.reconnects
+                )
+                self.logger.warning(msg)
 
 
 
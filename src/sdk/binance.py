@@ -109,6 +109,11 @@ class BinanceWebsocket(WebsocketSdkAbstract):
         channel_info = f"{symbol.lower()}@depth{levels}"
         self.register_channel(channel_info)
 
+    def register_diff_depth(self, symbol: str):
+        """增量depth, 需要配合REST depth snapshot维护本地orderbook"""
+        channel_info = f"{symbol.lower()}@depth"
+        self.register_channel(channel_info)
+
     def register_ticker(self, symbol: str):
         channel_info = f"{symbol.lower()}@ticker"
         self.register_channel(channel_info)
@@ -131,8 +136,7 @@ class BinanceWebsocket(WebsocketSdkAbstract):
                 msg = LogMsgFmt.EXCEPTION.value.format(exc=exc)
                 self.logger.error(msg, exc_info=True)
                 if self._ws_retry:
-                    await asyncio.sleep(self._ws_reconnect_interval)
-                    self.logger.info('websocket reconnect...')
+                    await self._backoff()
                 else:
                     raise
             else:
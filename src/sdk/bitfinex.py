@@ -119,6 +119,19 @@ class BitfinexRest(RestSdkAbstract):
 
 class BitfinexWebsocket(WebsocketSdkAbstract):
     ws_url = 'wss://api.bitfinex.com/ws/2'
+    FLAG_SEQ_ALL = 65536
+    FLAG_CHECKSUM = 131072
+
+    def register_conf(self, flags: int):
+        """
+        doc: https://docs.bitfinex.com/v2/docs/ws-general#section-configuration
+        需要在订阅channel之前发送
+        """
+        channel_info = {
+            'event': 'conf',
+            'flags': flags
+        }
+        self.register_connection_channel(channel_info)
 
     def register_ticker(self, symbol: str):
         channel_info = {
@@ -161,3 +174,13 @@ class BitfinexWebsocket(WebsocketSdkAbstract):
             'length': length
         }
         self.register_channel(channel_info)
+
+    def channel_id(self, channel_info: dict) -> Union[tuple, None]:
+        """
+        订阅消息和确认消息({'event': 'subscribed', 'channel', 'symbol'|'key', 'chanId'})
+        得到的是同一个标识
+        """
+        if 'channel' not in channel_info:
+            return None
+        return (channel_info['channel'],
+                channel_info.get('key') or channel_info.get('symbol'))
@@ -1,7 +1,6 @@
 """
 Author: thomaszdxsn
 """
-import asyncio
 
 from . import WebsocketSdkAbstract
 from ..utils import chunk
@@ -16,18 +15,17 @@ class BitmexWebsocket(WebsocketSdkAbstract):
     doc: https://www.bitmex.com/app/wsAPI 
     """
     ws_url = 'wss://www.bitmex.com/realtime'
+    _ws_subscribe_rate = 1.0        # 每秒一条订阅消息
 
-    async def subscribe(self, *args, **kwargs):
-        if not self.ws_client:
-            await self.setup_ws_client()
+    def build_subscribe_msgs(self, channels: list) -> list:
         # 参数不能过长
-        for args in chunk(self.register_hub, 10):
-            sub_msg = {
+        return [
+            {
                 'op': 'subscribe',
-                'args': args
+                'args': list(args)
             }
-            await self.ws_client.send_json(sub_msg)
-            await asyncio.sleep(1)
+            for args in chunk(channels, 10)
+        ]
 
     def register_trade_bin(self, symbol: str, type_: str='1m'):
         """
@@ -71,4 +69,12 @@ class BitmexWebsocket(WebsocketSdkAbstract):
     def register_orderbook10(self, symbol: str):
         channel_info = f'orderBook10:{symbol.upper()}'
         self.register_channel(channel_info)
+
+    def register_orderbook_l2(self, symbol: str, full: bool=False):
+        """
+        desc: Full level 2 orderBook(full=True) or top 25 levels
+        """
+        table = 'orderBookL2' if full else 'orderBookL2_25'
+        channel_info = f'{table}:{symbol.upper()}'
+        self.register_channel(channel_info)
     
\ No newline at end of file
@@ -83,12 +83,12 @@ class CoinbaseProRest(RestSdkAbstract):
 class CoinbaseProWebsocket(WebsocketSdkAbstract):
     ws_url = 'wss://ws-feed.pro.coinbase.com'
 
-    async def subscribe(self, *args, **kwargs):
-        sub_msg = {
+    def build_subscribe_msgs(self, channels: list) -> list:
+        """一条消息订阅所有channel"""
+        return [{
             'type': 'subscribe',
-            'channels': self.register_hub
-        }
-        await self.ws_client.send_json(sub_msg)
+            'channels': list(channels)
+        }]
 
     def register_ticker(self, product_id: str):
         channel_info = {
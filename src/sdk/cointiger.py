@@ -2,13 +2,12 @@
 Author: thomaszdxsn
 """
 import asyncio
-import json
-import gzip
 from urllib.parse import urljoin
 from typing import Callable
 
 from . import RestSdkAbstract, WebsocketSdkAbstract
 from ..schemas import Params
+from ..utils import GZIP_WBITS
 
 __all__ = (
     'CointigerRest',
@@ -85,6 +84,7 @@ class CointigerRest(RestSdkAbstract):
 
 class CointigerWebsocket(WebsocketSdkAbstract):
     ws_url = 'wss://api.cointiger.pro/exchange-market/ws'
+    _ws_wbits = GZIP_WBITS
 
     def register_kline(self, 
                        symbol:str, 
@@ -137,9 +137,11 @@ class CointigerWebsocket(WebsocketSdkAbstract):
         self.register_channel(channel_info)
 
     async def connect(self, handler: Callable):
+        recorder = self.recorder
         async for msg in self.ws_client:
-            raw_data = gzip.decompress(msg.data)
-            data = json.loads(raw_data, encoding='ascii')
+            if recorder is not None:
+                recorder.write(msg)
+            data = self.decode(msg.data, inflate=True)
             ping = data.get('ping')
             if ping:
                 await self.ws_client.send_json({
@@ -0,0 +1,77 @@
+"""
+author: thomaszdxsn
+
+websocket消息的json解码
+
+安装了orjson的时候使用orjson，否则使用标准库json，
+也可以通过settings的JSON_DECODER指定(orjson|ujson|json)
+loads直接接受str或者bytes(ws的TEXT帧是str，BINARY帧/解压之后是bytes)，调用方不需要先decode
+"""
+import importlib
+import json
+import logging
+import zlib
+from typing import Any, Callable, Dict, Union
+
+from dynaconf import settings
+
+__all__ = (
+    'DECODERS',
+    'json_loads',
+    'get_decoder',
+    'loads',
+    'decoder_name',
+    'DECODE_ERRORS',
+)
+
+logger = logging.getLogger('sdk.decoder')
+
+# 名字 -> 模块名，auto的时候按顺序使用第一个能import的
+DECODERS: Dict[str, str] = {
+    'orjson': 'orjson',
+    'json': 'json',
+    'ujson': 'ujson',
+}
+AUTO_ORDER = ('orjson', 'json')
+# 解压/解码失败的异常: json/orjson的JSONDecodeError和UnicodeDecodeError都是ValueError，ujson直接抛ValueError
+DECODE_ERRORS = (ValueError, zlib.error)
+
+
+def json_loads(data: Union[str, bytes]) -> Any:
+    """
+    标准库json.loads遇到bytes会先用python实现的detect_encoding检测编码，
+    ws消息都是utf-8，这里直接decode
+    """
+    if data.__class__ is bytes:
+        data = data.decode()
+    return json.loads(data)
+
+
+def _import_loads(name: str) -> Union[Callable[[Union[str, bytes]], Any],
+                                      None]:
+    if name == 'json':
+        return json_loads
+    try:
+        return importlib.import_module(DECODERS[name]).loads
+    except ImportError:
+        return None
+
+
+def get_decoder(name: str=None) -> Callable[[Union[str, bytes]], Any]:
+    """name为None或者'auto'时自动选择，指定的库没有安装时退回标准库json"""
+    if name and name != 'auto':
+        if name not in DECODERS:
+            raise ValueError(f'unknown json decoder: {name}')
+        func = _import_loads(name)
+        if func is not None:
+            return func
+        logger.warning(f'json decoder {name} is not installed, use json')
+        return json_loads
+    for candidate in AUTO_ORDER:
+        func = _import_loads(candidate)
+        if func is not None:
+            return func
+
+
+loads = get_decoder(settings.get('JSON_DECODER'))
+decoder_name = 'json' if loads is json_loads else loads.__module__
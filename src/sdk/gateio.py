@@ -93,7 +93,10 @@ class GateIOWebsocket(WebsocketSdkAbstract):
         # 这个ws接口需要重复request才会返回数据
         i = 1
         chan_nums = len(self.register_hub) + 1
+        recorder = self.recorder
         async for msg in self.ws_client:
+            if recorder is not None:
+                recorder.write(msg)
             await handler(msg)
             if i % chan_nums == 0:      # TODO: 需要为每个数据类型配置不同的sleep时间
                 await asyncio.sleep(1)  # TODO: need configify
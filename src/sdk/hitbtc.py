@@ -114,14 +114,31 @@ class HitBTCWebsocket(WebsocketSdkAbstract):
         self.register_channel(channel_info)
 
     def register_depth(self, symbol: str):
-        channel_info = {
-            'method': 'subscribeOrderbook',
+        channel_info = self._depth_channel_info('subscribeOrderbook', symbol)
+        self.register_channel(channel_info)
+
+    async def resubscribe_depth(self, symbol: str):
+        """
+        不断开连接重新订阅orderbook，服务器会重新推送snapshotOrderbook
+        连接不可用时(重连期间)不发送，重连之后的_resubscribe会重新订阅所有channel
+        """
+        ws_client = self.ws_client_for(
+            self._depth_channel_info('subscribeOrderbook', symbol)
+        )
+        if not self.is_open(ws_client):
+            return
+        for method in ('unsubscribeOrderbook', 'subscribeOrderbook'):
+            channel_info = self._depth_channel_info(method, symbol)
+            await ws_client.send_json(channel_info)
+
+    def _depth_channel_info(self, method: str, symbol: str) -> dict:
+        return {
+            'method': method,
             'params': {
                 'symbol': symbol.upper()
             },
             'id': '1'
         }
-        self.register_channel(channel_info)
 
     def register_trades(self, symbol: str):
         channel_info = {
@@ -1,8 +1,6 @@
 """
 author: thomaszdxsn
 """
-import gzip
-import json
 import random
 from urllib.parse import urljoin
 
@@ -10,6 +8,7 @@ from aiohttp import WSMessage
 
 from . import RestSdkAbstract, WebsocketSdkAbstract
 from ..schemas import Params
+from ..utils import GZIP_WBITS
 
 __all__ = (
     'HuobiRest',
@@ -81,6 +80,7 @@ class HuobiRest(RestSdkAbstract):
 
 class HuobiWebsocket(WebsocketSdkAbstract):
     ws_url = 'wss://api.huobi.pro/ws'
+    _ws_wbits = GZIP_WBITS
 
     def _gen_random_id(self) -> str:
         if not getattr(self, '_id_bucket', None):
@@ -120,11 +120,15 @@ class HuobiWebsocket(WebsocketSdkAbstract):
         self.register_channel(channel_info)
 
     async def handle_ws_ping(self, msg: WSMessage) -> dict:
-        raw_data = gzip.decompress(msg.data)
-        data = json.loads(raw_data, encoding='ascii')
+        data = self.decode(msg.data, inflate=True)
         ping = data.get('ping')
-        if ping:
+        # 没有连接时不回复，重连之后服务器会在新的连接上重新ping
+        if ping and self.is_open(self.ws_client):
             await self.ws_client.send_json({
                 'pong': ping
             })
-        return data
\ No newline at end of file
+        return data
+
+    def channel_id(self, channel_info: dict) -> str:
+        """确认消息: {'status': 'ok', 'subbed': 'market.btcusdt.trade.detail'}"""
+        return channel_info.get('sub')
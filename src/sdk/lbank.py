@@ -1,7 +1,6 @@
 """
 Author: thomaszdxsn
 """
-import asyncio
 from datetime import datetime, timedelta
 from urllib.parse import urljoin
 from typing import Union
@@ -100,6 +99,7 @@ class LBankRest(RestSdkAbstract):
     
 class LBankWebsocket(WebsocketSdkAbstract):
     ws_url = 'ws://api.lbank.info/ws/V2/'
+    _ws_subscribe_rate = 5
 
     def register_depth(self, symbol: str, size: int=10):
         channel_info = {
@@ -134,10 +134,3 @@ class LBankWebsocket(WebsocketSdkAbstract):
             'pair': symbol
         }
         self.register_channel(channel_info)
-
-    async def subscribe(self, *args, **kwargs):
-        if not self.ws_client:
-            await self.setup_ws_client()
-        for channel_info in self.register_hub:
-            await self.ws_client.send_json(channel_info)
-            await asyncio.sleep(.2)
\ No newline at end of file
@@ -5,6 +5,7 @@ from urllib.parse import urljoin
 
 from . import RestSdkAbstract, WebsocketSdkAbstract
 from ..schemas import Params
+from ..utils import OKEX_WBITS
 
 __all__ = (
     'OkexFutureRest',
@@ -99,6 +100,7 @@ class OkexFutureRest(RestSdkAbstract):
 
 class OkexFutureWebsocket(WebsocketSdkAbstract):
     ws_url = 'wss://real.okex.com:10440/websocket/okexapi'
+    _ws_wbits = OKEX_WBITS
 
     def register_kline(self,
                        symbol: str,
@@ -130,4 +132,8 @@ class OkexFutureWebsocket(WebsocketSdkAbstract):
             'event': 'addChannel',
             'channel': f"ok_sub_futureusd_{symbol}_depth_{contract_type}_{size}"
         }
-        self.register_channel(channel_info)
\ No newline at end of file
+        self.register_channel(channel_info)
+
+    def channel_id(self, channel_info: dict) -> str:
+        """确认消息: {'channel': 'addChannel', 'data': {'result': true, 'channel': ...}}"""
+        return channel_info.get('channel')
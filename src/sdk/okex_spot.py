@@ -6,6 +6,7 @@ from typing import Union
 
 from . import RestSdkAbstract, WebsocketSdkAbstract
 from ..schemas import Params
+from ..utils import OKEX_WBITS
 
 
 class OkexSpotRest(RestSdkAbstract):
@@ -90,6 +91,7 @@ class OkexSpotRest(RestSdkAbstract):
 
 class OkexSpotWebsocket(WebsocketSdkAbstract):
     ws_url = 'wss://real.okex.com:10441/websocket'
+    _ws_wbits = OKEX_WBITS
 
     def register_ticker(self, symbol: str):
         channel_info = {
@@ -118,3 +120,7 @@ class OkexSpotWebsocket(WebsocketSdkAbstract):
             'channel': f'ok_sub_spot_{symbol}_kline_{type_}'
         }
         self.register_channel(channel_info)
+
+    def channel_id(self, channel_info: dict) -> str:
+        """确认消息: {'channel': 'addChannel', 'data': {'result': true, 'channel': ...}}"""
+        return channel_info.get('channel')
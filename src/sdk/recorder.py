@@ -0,0 +1,122 @@
+"""
+author: thomaszdxsn
+
+录制/回放websocket的原始消息
+
+录制: settings的WS_RECORD_DIR非空时，每个交易所的ws sdk在connect里把收到的TEXT/BINARY帧
+      原样写入 {WS_RECORD_DIR}/{exchange}-{开始时间}-{pid}.frames.gz
+文件格式: gzip压缩的连续记录，每条记录是 <dBI 头(接收时间戳, 消息类型, 长度) + 原始数据，
+          TEXT帧按utf-8编码保存；进程被杀掉时文件末尾不完整的记录读取时会被忽略
+回放: replay(read_frames(path), monitor.dispatch_ws_msg, speed)，
+      speed=1按录制时的间隔回放，speed=N快N倍，speed=0不等待(最大速度)
+"""
+import asyncio
+import atexit
+import gzip
+import logging
+import os
+import struct
+import time
+import zlib
+from datetime import datetime
+from typing import Callable, Iterable, Iterator, NamedTuple, Union
+
+from aiohttp import WSMessage, WSMsgType
+
+from ..schemas.logs import LogMsgFmt
+
+__all__ = (
+    'Frame',
+    'FrameRecorder',
+    'read_frames',
+    'replay',
+)
+
+HEADER = struct.Struct('<dBI')
+RECORD_TYPES = (WSMsgType.TEXT, WSMsgType.BINARY)
+
+
+class Frame(NamedTuple):
+    received: float         # 接收时的time.time()
+    type: WSMsgType
+    data: Union[str, bytes]
+
+    def to_message(self) -> WSMessage:
+        return WSMessage(self.type, self.data, None)
+
+
+class FrameRecorder(object):
+    """一个交易所一个文件，分片的连接共用"""
+
+    def __init__(self, directory: str, name: str, compresslevel: int=1):
+        os.makedirs(directory, exist_ok=True)
+        started = datetime.utcnow().strftime('%Y%m%d%H%M%S')
+        self.path = os.path.join(
+            directory, f'{name}-{started}-{os.getpid()}.frames.gz'
+        )
+        self._file = gzip.open(self.path, 'wb', compresslevel=compresslevel)
+        self.frames = 0
+        atexit.register(self.close)
+
+    def write(self, msg: WSMessage):
+        if msg.type not in RECORD_TYPES or self._file.closed:
+            return
+        data = msg.data
+        if msg.type == WSMsgType.TEXT:
+            data = data.encode()
+        self._file.write(HEADER.pack(time.time(), msg.type, len(data)))
+        self._file.write(data)
+        self.frames += 1
+
+    def close(self):
+        if not self._file.closed:
+            self._file.close()
+
+
+def read_frames(path: str) -> Iterator[Frame]:
+    with gzip.open(path, 'rb') as f:
+        while True:
+            try:
+                header = f.read(HEADER.size)
+                if len(header) < HEADER.size:
+                    return
+                received, type_, length = HEADER.unpack(header)
+                data = f.read(length)
+            except (EOFError, zlib.error):
+                return      # 没有正常关闭的文件
+            if len(data) < length:
+                return
+            type_ = WSMsgType(type_)
+            if type_ == WSMsgType.TEXT:
+                data = data.decode()
+            yield Frame(received, type_, data)
+
+
+async def replay(frames: Iterable[Frame],
+                 handler: Callable,
+                 speed: float=1.0) -> dict:
+    """
+    按顺序把frame交给handler(和connect里一样是WSMessage)，
+    handler抛出的异常记录日志之后继续回放
+    """
+    logger = logging.getLogger('sdk.replay')
+    loop = asyncio.get_event_loop()
+    stats = {'frames': 0, 'bytes': 0, 'errors': 0}
+    started = first = None
+    for frame in frames:
+        if first is None:
+            started, first = loop.time(), frame.received
+        elif speed > 0:
+            delay = (frame.received - first) / speed - (loop.time() - started)
+            if delay > 0:
+                await asyncio.sleep(delay)
+        try:
+            await handler(frame.to_message())
+        except Exception as exc:
+            stats['errors'] += 1
+            msg = LogMsgFmt.EXCEPTION.value.format(exc=exc)
+            logger.error(msg, exc_info=True)
+        stats['frames'] += 1
+        stats['bytes'] += len(frame.data)
+    stats['seconds'] = loop.time() - started if started is not None else 0.0
+    return stats
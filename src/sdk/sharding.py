@@ -0,0 +1,117 @@
+"""
+author: thomaszdxsn
+
+把一个交易所的register_hub分到多个websocket连接上
+
+monitor照常register_xxx |> subscribe |> keep_connect，
+ShardedWebsocket在subscribe的时候创建N个同类的sdk实例(分片)，每个分片:
+    - 只订阅register_hub里连续的一段(同一个symbol的几个channel通常在一起)
+    - connection_hub(比如bitfinex的conf)每个分片都会发送
+    - 有自己的连接、读取协程和重连循环，一个分片断开或者变慢不影响其他分片
+所有分片的消息都交给同一个handler，handler里通过ws_sdk.ws_client拿到的是
+收到这条消息的分片的连接，ws_sdk.current_shard_index()是分片序号
+"""
+import asyncio
+import logging
+from asyncio import AbstractEventLoop
+from typing import Callable, List, Type, Union
+
+from . import WebsocketSdkAbstract, current_shard
+
+__all__ = (
+    'ShardedWebsocket',
+    'split_hub',
+)
+
+
+def split_hub(register_hub: list, n: int) -> List[list]:
+    """按顺序尽量平均地分成n段"""
+    n = max(1, min(n, len(register_hub)))
+    size, extra = divmod(len(register_hub), n)
+    chunks, start = [], 0
+    for i in range(n):
+        end = start + size + (1 if i < extra else 0)
+        chunks.append(register_hub[start: end])
+        start = end
+    return chunks
+
+
+class ShardedWebsocket(object):
+    """除了subscribe/keep_connect，其他属性都转发给register用的sdk实例"""
+
+    def __init__(self,
+                 sdk_class: Type[WebsocketSdkAbstract],
+                 shards: int,
+                 loop: Union[AbstractEventLoop, None]=None):
+        self.sdk_class = sdk_class
+        self.num_shards = shards
+        self._loop = loop
+        self.sdk = sdk_class(loop)
+        self.logger = logging.getLogger(f'sdk.{sdk_class.__name__}')
+
+    def __getattr__(self, name):
+        return getattr(self.sdk, name)
+
+    @property
+    def shards(self) -> List[WebsocketSdkAbstract]:
+        return self.sdk._shards
+
+    @property
+    def subscribe_rate(self) -> float:
+        return self.sdk.subscribe_rate
+
+    @subscribe_rate.setter
+    def subscribe_rate(self, rate: float):
+        """每个分片各自按这个速率发送订阅消息"""
+        self.sdk.subscribe_rate = rate
+        for shard in self.shards:
+            shard.subscribe_rate = rate
+
+    @property
+    def recorder(self):
+        return self.sdk.recorder
+
+    @recorder.setter
+    def recorder(self, recorder):
+        """所有分片写入同一个文件"""
+        self.sdk.recorder = recorder
+        for shard in self.shards:
+            shard.recorder = recorder
+
+    def _create_shards(self):
+        for index, hub in enumerate(split_hub(self.sdk.register_hub,
+                                              self.num_shards)):
+            shard = self.sdk_class(self._loop)
+            shard.shard_index = index
+            shard.register_hub = hub
+            shard.connection_hub = self.sdk.connection_hub
+            shard.subscribe_rate = self.sdk.subscribe_rate
+            shard.recorder = self.sdk.recorder
+            shard.logger = logging.getLogger(
+                f'sdk.{self.sdk_class.__name__}.shard{index}'
+            )
+            self.sdk._shards.append(shard)
+
+    async def subscribe(self, *args, **kwargs):
+        if not self.shards:
+            self._create_shards()
+        await asyncio.gather(*(
+            self._in_shard(shard, shard.subscribe(*args, **kwargs))
+            for shard in self.shards
+        ))
+
+    async def keep_connect(self, handler: Callable):
+        results = await asyncio.gather(*(
+            self._in_shard(shard, shard.keep_connect(handler))
+            for shard in self.shards
+        ), return_exceptions=True)
+        for shard, result in zip(self.shards, results):
+            if isinstance(result, Exception):
+                self.logger.error(f'shard{shard.shard_index} stopped: '
+                                  f'{result!r}')
+
+    @staticmethod
+    async def _in_shard(shard: WebsocketSdkAbstract, coro):
+        """gather给每个协程单独的task(context)，设置的分片只对这个分片可见"""
+        current_shard.set(shard)
+        return await coro
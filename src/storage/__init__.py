@@ -18,4 +18,5 @@ class StorageAbstract(ABC):
         pass
 
 
-from .mongo import MongoStorage
\ No newline at end of file
+from .mongo import MongoStorage
+from .pool import WriterPool
\ No newline at end of file
@@ -0,0 +1,165 @@
+"""
+author: thomaszdxsn
+
+MongoStorage的批量写入策略
+
+一个batch在以下任一条件满足时flush:
+    size: 攒够max_size条
+    bytes: 估算的BSON大小超过max_bytes
+    linger: 第一条数据进入batch之后已经等待了max_linger秒
+数据量小的collection(bitmex settlement, kline, 冷门交易对的ticker...)
+不会再因为攒不够一个batch而在内存里停留几分钟甚至几小时
+"""
+import asyncio
+import bisect
+import collections
+import time
+from dataclasses import dataclass, field, replace
+from typing import Dict, List, Tuple
+
+from bson import BSON
+from dynaconf import settings
+
+from ..tunnels import TunnelAbstract
+
+__all__ = (
+    'BatchPolicy',
+    'BatchStats',
+    'fetch_batch',
+    'get_batch_policy',
+)
+
+FLUSH_SIZE = 'size'
+FLUSH_BYTES = 'bytes'
+FLUSH_LINGER = 'linger'
+FLUSH_STOPPED = 'stopped'
+
+BATCH_SIZE_BUCKETS = (1, 2, 5, 10, 20, 50, 100, 200, 500, 1000)
+
+
+@dataclass
+class BatchPolicy:
+    max_size: int = 15
+    max_linger: float = 5.0         # seconds
+    max_bytes: int = 8 * 1024 * 1024
+
+
+@dataclass
+class BatchStats:
+    """单个collection的flush原因计数和batch大小直方图"""
+    flush_reasons: collections.Counter = field(
+        default_factory=collections.Counter
+    )
+    # batch_sizes[i]: 大小 <= BATCH_SIZE_BUCKETS[i] 的batch数，最后一个是+Inf
+    batch_sizes: List[int] = field(
+        default_factory=lambda: [0] * (len(BATCH_SIZE_BUCKETS) + 1)
+    )
+    items: int = 0
+    write_latency: float = None     # bulk_write耗时的指数移动平均(s)
+    writes: int = 0
+    write_seconds: float = 0.0      # bulk_write总耗时(s)
+
+    def observe(self, size: int, reason: str):
+        self.flush_reasons[reason] += 1
+        self.batch_sizes[bisect.bisect_left(BATCH_SIZE_BUCKETS, size)] += 1
+        self.items += size
+
+    def observe_write(self, seconds: float, alpha: float=0.2):
+        self.writes += 1
+        self.write_seconds += seconds
+        if self.write_latency is None:
+            self.write_latency = seconds
+        else:
+            self.write_latency += alpha * (seconds - self.write_latency)
+
+    @property
+    def mean_batch_size(self) -> float:
+        flushes = sum(self.batch_sizes)
+        return self.items / flushes if flushes else 0.0
+
+    def histogram(self) -> Dict[str, int]:
+        bounds = [str(b) for b in BATCH_SIZE_BUCKETS] + ['+Inf']
+        return dict(zip(bounds, self.batch_sizes))
+
+
+def get_batch_policy(collection: str) -> BatchPolicy:
+    """
+    默认值来自MONGO_BATCH_OP_SIZE/MONGO_BATCH_LINGER/MONGO_BATCH_MAX_BYTES,
+    MONGO_BATCH_POLICIES可以按collection名(bitmex0settlement)或者
+    数据类型(kline)覆盖，collection名优先
+    """
+    policy = BatchPolicy(
+        max_size=int(settings.get('MONGO_BATCH_OP_SIZE', 15)),
+        max_linger=float(settings.get('MONGO_BATCH_LINGER', 5)),
+        max_bytes=int(settings.get('MONGO_BATCH_MAX_BYTES', 8 * 1024 * 1024))
+    )
+    overrides = settings.get('MONGO_BATCH_POLICIES') or {}
+    data_type = collection.split('0', 1)[-1]
+    for key in (data_type, collection):
+        if key in overrides:
+            policy = replace(policy, **overrides[key])
+    return policy
+
+
+def estimate_bson_size(item) -> int:
+    return len(BSON.encode(item.data.to_dict()))
+
+
+async def _get_many(tunnel: TunnelAbstract,
+                    id_: str,
+                    max_n: int,
+                    stop: asyncio.Event=None,
+                    timeout: float=None) -> list:
+    """
+    一次取走queue里已有的数据(最多max_n条)，queue为空时最多等待timeout秒
+    超时或者stop被set的时候返回空列表，不会吃掉queue里的数据
+    """
+    items = await tunnel.get_many(id_, max_n, timeout=0)
+    if items:
+        return items
+    if stop is None:
+        return await tunnel.get_many(id_, max_n, timeout)
+    getter = asyncio.ensure_future(tunnel.get_many(id_, max_n))
+    stopper = asyncio.ensure_future(stop.wait())
+    try:
+        await asyncio.wait((getter, stopper), timeout=timeout,
+                           return_when=asyncio.FIRST_COMPLETED)
+    finally:
+        stopper.cancel()
+        if not getter.done():
+            getter.cancel()         # 还没有从queue里取出数据, cancel是安全的
+    return getter.result() if getter.done() else []
+
+
+async def fetch_batch(tunnel: TunnelAbstract,
+                      id_: str,
+                      policy: BatchPolicy,
+                      stop: asyncio.Event=None) -> Tuple[list, str]:
+    """
+    从tunnel取一个batch，返回(items, flush原因)
+    第一条数据之前会一直等待，空batch没有意义;
+    stop被set的时候立即返回已经取到的数据(可能为空), 原因是'stopped'
+    batch的字节数用第一条数据的BSON大小估算，同一个collection的数据大小基本一致，
+    不需要每条都多编码一次
+    """
+    items = await _get_many(tunnel, id_, 1, stop)
+    if not items:
+        return [], FLUSH_STOPPED
+    max_size, full_reason = policy.max_size, FLUSH_SIZE
+    if max_size > 1:
+        max_by_bytes = max(1, policy.max_bytes // estimate_bson_size(items[0]))
+        if max_by_bytes < max_size:
+            max_size, full_reason = max_by_bytes, FLUSH_BYTES
+    deadline = time.monotonic() + policy.max_linger
+    while len(items) < max_size:
+        timeout = deadline - time.monotonic()
+        if timeout <= 0:
+            return items, FLUSH_LINGER
+        more = await _get_many(tunnel, id_, max_size - len(items),
+                               stop, timeout)
+        if not more:
+            if stop is not None and stop.is_set():
+                return items, FLUSH_STOPPED
+            return items, FLUSH_LINGER
+        items.extend(more)
+    return items, full_reason
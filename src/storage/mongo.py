@@ -1,19 +1,24 @@
 """
 author: thomaszdxsn
 """
+import asyncio
 import inspect
 import json
+import time
 from datetime import datetime
 from urllib.parse import unquote
-from typing import List, Union
+from typing import Dict, List, Tuple, Union
 
 from dynaconf import settings
 from pymongo import InsertOne, ReplaceOne, WriteConcern
-from pymongo.errors import BulkWriteError
+from pymongo.errors import BulkWriteError, ConnectionFailure
 from motor.motor_asyncio import AsyncIOMotorClient
 from bson import json_util as bson_json_utils
 
 from . import StorageAbstract
+from .batching import BatchPolicy, BatchStats, fetch_batch, get_batch_policy
+from .priority import create_write_scheduler
+from ..latency import latency_enabled, latency_stats
 from ..schemas.logs import LogMsgFmt
 from ..schemas.regexes import MONGO_URI_UNPACK
 from ..tunnels import TunnelAbstract
@@ -24,29 +29,50 @@ __all__ = (
 
 
 class MongoStorage(StorageAbstract):
-    batch_op_size: int = int(settings.get('MONGO_BATCH_OP_SIZE', 30))
+    max_retry_backoff: int = 30
 
     def __init__(self, uri, pool_size):
         super(MongoStorage, self).__init__()
+        self.write_scheduler = create_write_scheduler(pool_size)   # 按优先级分配连接池
         self._mongo_client = AsyncIOMotorClient(
             uri,
-            maxPoolSize=pool_size
+            maxPoolSize=pool_size + self.write_scheduler.overdraft    # 借用的名额也要有连接
         )
         self.__uri = uri
         self.__db = settings['MONGO_DATABASE']
         self._data_db = self._mongo_client[self.__db]
         self._separator = '0'
+        self.batch_stats: Dict[str, BatchStats] = {}
+        self.latency = latency_stats if latency_enabled() else None
 
     async def fetch_n_items(self,
                             tunnel: TunnelAbstract,
                             id_: str,
-                            n: int) -> list:
-        items = []
-        while True:
-            item = await tunnel.get_async(id_)
-            items.append(item)
-            if len(items) >= n:
-                return items
+                            policy: BatchPolicy,
+                            stop: asyncio.Event=None) -> Tuple[list, str]:
+        """按policy取一个batch(size/bytes/linger任一满足即返回), 返回(items, flush原因)"""
+        return await fetch_batch(tunnel, id_, policy, stop)
+
+    def collection_name(self, id_: str) -> str:
+        exchange, data_type = id_.split('|')
+        return f'{exchange}{self._separator}{data_type}'            # 以0作为交易所和数据类型之间的分隔符
+
+    def get_batch_stats(self, id_: str) -> BatchStats:
+        return self.batch_stats.setdefault(self.collection_name(id_),
+                                           BatchStats())
+
+    def log_batch_stats(self):
+        for collection, stats in self.batch_stats.items():
+            msg = LogMsgFmt.MONGO_BATCH_STATS.value.format(
+                collection=collection,
+                reasons=dict(stats.flush_reasons),
+                sizes=stats.histogram()
+            )
+            self.logger.info(msg)
+        for name, stats in self.write_scheduler.stats().items():
+            msg = LogMsgFmt.MONGO_PRIORITY_STATS.value.format(name=name,
+                                                              stats=stats)
+            self.logger.info(msg)
 
     async def bulk_op(self, collection: str,
                       items: list, ordered: bool=False):
@@ -83,15 +109,23 @@ class MongoStorage(StorageAbstract):
 
     async def worker(self,
                      tunnel: TunnelAbstract,
-                     id_: str):
-        exchange, data_type  = id_.split('|')
-        collection = f'{exchange}{self._separator}{data_type}'      # 以0作为交易所和数据类型之间的分隔符
-        while True:
+                     id_: str,
+                     stop: asyncio.Event=None):
+        """
+        不断从tunnel取batch写入mongo
+        stop被set之后，写完手上的batch再退出(WriterPool缩容用)
+        """
+        collection = self.collection_name(id_)
+        policy = get_batch_policy(collection)
+        stats = self.get_batch_stats(id_)
+        while stop is None or not stop.is_set():
             try:
-                items = await self.fetch_n_items(tunnel,
-                                                 id_,
-                                                 self.batch_op_size)
-                await self.bulk_op(collection, items)
+                items, reason = await self.fetch_n_items(tunnel, id_,
+                                                         policy, stop)
+                if not items:
+                    return
+                stats.observe(len(items), reason)
+                await self._write_batch(id_, items, stats)
             except BulkWriteError as bwe:
                 msg = str(bwe.details)
                 self.logger.error(msg)
@@ -99,6 +133,33 @@ class MongoStorage(StorageAbstract):
                 msg = LogMsgFmt.EXCEPTION.value.format(exc=exc)
                 self.logger.error(msg)
 
+    async def _write_batch(self,
+                           id_: str,
+                           items: list,
+                           stats: BatchStats):
+        """
+        先按id_的优先级类别等待写入名额，再bulk_write
+        mongo连接失败的时候不丢弃手上的batch，按指数退避一直重试;
+        重试期间worker不再取数据，积压留在tunnel里(SpillTunnel会溢出到磁盘)
+        """
+        collection = self.collection_name(id_)
+        backoff = 1
+        while True:
+            async with self.write_scheduler.slot(id_):
+                start = time.monotonic()
+                try:
+                    await self.bulk_op(collection, items)
+                    if self.latency is not None:
+                        self.latency.observe_write(items)
+                    return
+                except ConnectionFailure as exc:
+                    msg = LogMsgFmt.EXCEPTION.value.format(exc=exc)
+                    self.logger.warning(f'{msg}|retry in {backoff}s')
+                finally:
+                    stats.observe_write(time.monotonic() - start)
+            await asyncio.sleep(backoff)
+            backoff = min(backoff * 2, self.max_retry_backoff)
+
     async def list_collections(self) -> List[str]:
         return await self._data_db.list_collection_names()
 
@@ -0,0 +1,140 @@
+"""
+author: thomaszdxsn
+
+mongo写入worker池
+
+每个tunnel key的worker数在[min, max]之间，根据queue积压和bulk_write耗时伸缩:
+    一个worker每秒大约能写 batch_size / write_latency 条，
+    需要的worker数 = 在MONGO_WRITER_TARGET_DRAIN秒内写完当前积压所需的数量
+扩容立即生效，缩容每个周期最多减少一个worker，避免抖动
+tunnel出现新key时立即开启min个worker，不再等待下一分钟的cron
+"""
+import asyncio
+import collections
+import logging
+import math
+from typing import Dict, List, Tuple
+
+from dynaconf import settings
+
+from . import StorageAbstract
+from .batching import get_batch_policy
+from ..tunnels import QueueTunnel
+
+__all__ = (
+    'WriterPool',
+    'desired_workers',
+    'get_worker_bounds',
+)
+
+
+def get_worker_bounds(key: str) -> Tuple[int, int]:
+    """(min, max), MONGO_WRITER_BOUNDS可以按数据类型覆盖"""
+    data_type = key.split('|', 1)[-1]
+    bounds = (settings.get('MONGO_WRITER_BOUNDS') or {}).get(data_type)
+    if bounds:
+        return int(bounds[0]), int(bounds[1])
+    return (int(settings.get('MONGO_WRITER_MIN', 1)),
+            int(settings.get('MONGO_WRITER_MAX', 6)))
+
+
+def desired_workers(backlog: int,
+                    write_latency: float,
+                    batch_size: int,
+                    target_drain: float,
+                    bounds: Tuple[int, int]) -> int:
+    min_workers, max_workers = bounds
+    if not backlog or not write_latency:
+        return min_workers
+    per_worker = batch_size / write_latency * target_drain
+    need = math.ceil(backlog / per_worker)
+    return max(min_workers, min(max_workers, need))
+
+
+class WriterPool(object):
+
+    def __init__(self,
+                 storage: StorageAbstract,
+                 tunnel: QueueTunnel,
+                 loop=None):
+        self.storage = storage
+        self.tunnel = tunnel
+        self.interval = float(settings.get('MONGO_WRITER_ADJUST_INTERVAL', 5))
+        self.target_drain = float(settings.get('MONGO_WRITER_TARGET_DRAIN', 5))
+        self.logger = logging.getLogger(f'storage.{self.__class__.__name__}')
+        self._loop = loop or asyncio.get_event_loop()
+        # key -> [(worker task, stop event), ...]
+        self._workers: Dict[str, List[Tuple[asyncio.Task, asyncio.Event]]] = \
+            collections.defaultdict(list)
+        self._adjuster = None
+
+    def start(self):
+        self.tunnel.add_key_listener(self.add_key)
+        for key in self.tunnel.keys():
+            self.add_key(key)
+        self._adjuster = self._loop.create_task(self._adjust_forever())
+
+    async def stop(self):
+        """通知所有worker写完手上的batch后退出"""
+        if self._adjuster is not None:
+            self._adjuster.cancel()
+        tasks = []
+        for workers in self._workers.values():
+            for task, stop in workers:
+                stop.set()
+                tasks.append(task)
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+    def add_key(self, key: str):
+        if key not in self._workers:
+            self.resize(key, get_worker_bounds(key)[0])
+
+    def worker_count(self, key: str) -> int:
+        return sum(1 for task, _ in self._workers.get(key, ()) if not task.done())
+
+    def resize(self, key: str, n: int):
+        workers = self._workers[key]
+        workers[:] = [w for w in workers if not w[0].done()]
+        while len(workers) < n:
+            stop = asyncio.Event(loop=self._loop)
+            task = self._loop.create_task(
+                self.storage.worker(self.tunnel, key, stop)
+            )
+            workers.append((task, stop))
+        while len(workers) > n:
+            _, stop = workers.pop()
+            stop.set()
+
+    def backlog(self, key: str) -> int:
+        """内存queue里的数据加上SpillTunnel溢出到磁盘的数据"""
+        backlog = self.tunnel.get_queue(key).qsize()
+        spilled_count = getattr(self.tunnel, 'spilled_count', None)
+        if spilled_count is not None:
+            backlog += spilled_count(key)
+        return backlog
+
+    def adjust(self):
+        for key in list(self._workers):
+            current = self.worker_count(key)
+            desired = desired_workers(
+                backlog=self.backlog(key),
+                write_latency=self.storage.get_batch_stats(key).write_latency,
+                batch_size=get_batch_policy(
+                    self.storage.collection_name(key)
+                ).max_size,
+                target_drain=self.target_drain,
+                bounds=get_worker_bounds(key)
+            )
+            if desired < current:
+                desired = current - 1
+            if desired != current:
+                self.logger.info(f'resize|{key}|{current}->{desired}')
+            self.resize(key, desired)
+
+    async def _adjust_forever(self):
+        while True:
+            await asyncio.sleep(self.interval)
+            try:
+                self.adjust()
+            except Exception as exc:
+                self.logger.exception(exc)
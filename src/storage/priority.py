@@ -0,0 +1,228 @@
+"""
+author: thomaszdxsn
+
+mongo写入的优先级通道
+
+所有worker共用MONGO_WRITE_SLOTS个bulk_write并发名额(默认等于MONGO_POOL_SIZE，
+也就是mongo连接池的大小)，每种数据类型属于一个优先级类别(MONGO_PRIORITY_CLASSES):
+    priority: 越大越优先，空出来的名额先给优先级高的类别里等待的worker
+    reserved: 给这个类别预留的名额，优先级更低的类别不能占用，
+              所以depth积压再多也不会让trades等待depth的bulk_write完成
+    max_delay: 等待名额的上限，超过之后如果是优先级更低的类别占着名额，
+               就从overdraft(MONGO_WRITE_OVERDRAFT)里借一个额外的名额，不再等待;
+               没有可借的名额时记为late
+正在进行的bulk_write没有办法中断，所以借用的名额是额外的mongo连接(连接池按slots+overdraft创建)，
+优先级最低的类别等多久都不会借用
+
+stats()返回每个类别的in_use/waiting/acquired/waited/late/borrowed/max_wait，定期打印到日志
+"""
+import asyncio
+import collections
+import time
+from contextlib import asynccontextmanager
+from typing import Dict, List
+
+from dynaconf import settings
+
+__all__ = (
+    'PriorityClass',
+    'WriteScheduler',
+    'create_write_scheduler',
+)
+
+
+class PriorityClass(object):
+
+    def __init__(self,
+                 name: str,
+                 priority: int=0,
+                 reserved: int=0,
+                 max_delay: float=5.0):
+        self.name = name
+        self.priority = priority
+        self.reserved = reserved
+        self.max_delay = max_delay
+        self.in_use = 0
+        self.max_wait = 0.0
+        self.stats = collections.Counter()
+        self._waiters = collections.deque()     # (deadline, future)
+
+    def __repr__(self):
+        return f'<PriorityClass {self.name} priority={self.priority} ' \
+               f'reserved={self.reserved}>'
+
+    @property
+    def waiting(self) -> int:
+        return len(self._waiters)
+
+    def observe_wait(self, seconds: float=None, borrowed: bool=False):
+        """seconds为None表示不需要等待就拿到了名额，借用overdraft的不算late"""
+        self.stats['acquired'] += 1
+        if seconds is None:
+            return
+        self.stats['waited'] += 1
+        if seconds > self.max_delay and not borrowed:
+            self.stats['late'] += 1
+        self.max_wait = max(self.max_wait, seconds)
+
+
+class WriteScheduler(object):
+
+    def __init__(self,
+                 slots: int,
+                 classes: List[PriorityClass],
+                 routes: Dict[str, str],
+                 default: str,
+                 overdraft: int=0,
+                 loop=None):
+        """
+        routes: 数据类型或者collection名 -> 类别名
+        overdraft: 等待超过max_delay的worker可以借用的额外名额
+        """
+        self.slots = slots
+        self.overdraft = overdraft
+        self.classes = sorted(classes, key=lambda c: -c.priority)
+        self._by_name = {c.name: c for c in self.classes}
+        self._routes = routes
+        self._default = self._by_name[default]
+        self._loop = loop
+        self.in_use = 0
+
+    def get_class(self, key: str) -> PriorityClass:
+        """key: tunnel的key(交易所|数据类型)"""
+        exchange, _, data_type = key.partition('|')
+        name = self._routes.get(f'{exchange}0{data_type}') or \
+            self._routes.get(data_type)
+        return self._by_name[name] if name else self._default
+
+    def _headroom(self, cls: PriorityClass) -> int:
+        """
+        优先级比cls高的类别还没用掉的预留名额
+        预留总数配置得比slots还多的时候，至少留一个名额给cls，避免永远拿不到
+        """
+        headroom = sum(
+            max(other.reserved - other.in_use, 0)
+            for other in self.classes
+            if other.priority > cls.priority
+        )
+        return min(headroom, self.slots - 1)
+
+    def _can_acquire(self, cls: PriorityClass) -> bool:
+        free = self.slots - self.in_use
+        if free <= 0:
+            return False
+        if cls.in_use < cls.reserved:
+            return True
+        return free > self._headroom(cls)
+
+    def _can_borrow(self, cls: PriorityClass) -> bool:
+        """优先级更低的类别占着名额的时候，超时的worker可以借用overdraft"""
+        if self.in_use >= self.slots + self.overdraft:
+            return False
+        return any(other.in_use > 0 for other in self.classes
+                   if other.priority < cls.priority)
+
+    def _grant(self, cls: PriorityClass):
+        cls.in_use += 1
+        self.in_use += 1
+
+    def _dispatch(self):
+        """
+        名额空出来之后按优先级唤醒等待的worker，
+        然后给等待超过max_delay的worker借用overdraft名额
+        """
+        for cls in self.classes:
+            while cls._waiters and self._can_acquire(cls):
+                _, waiter = cls._waiters.popleft()
+                if waiter.done():       # 已经被取消
+                    continue
+                self._grant(cls)
+                waiter.set_result(False)
+        if not self.overdraft:
+            return
+        now = time.monotonic()
+        for cls in self.classes:
+            while cls._waiters and cls._waiters[0][0] <= now and \
+                    self._can_borrow(cls):
+                _, waiter = cls._waiters.popleft()
+                if waiter.done():
+                    continue
+                self._grant(cls)
+                cls.stats['borrowed'] += 1
+                waiter.set_result(True)
+
+    async def acquire(self, key: str) -> PriorityClass:
+        cls = self.get_class(key)
+        if not cls._waiters and self._can_acquire(cls):
+            self._grant(cls)
+            cls.observe_wait()
+        else:
+            start = time.monotonic()
+            loop = self._loop or asyncio.get_event_loop()
+            waiter = loop.create_future()
+            cls._waiters.append((start + cls.max_delay, waiter))
+            timer = None
+            if self.overdraft:
+                timer = loop.call_later(cls.max_delay, self._dispatch)
+            try:
+                borrowed = await waiter
+            except asyncio.CancelledError:
+                if waiter.done() and not waiter.cancelled():
+                    self.release(cls)       # 拿到名额的同时被取消
+                raise
+            finally:
+                if timer is not None:
+                    timer.cancel()
+            cls.observe_wait(time.monotonic() - start, borrowed)
+        return cls
+
+    def release(self, cls: PriorityClass):
+        cls.in_use -= 1
+        self.in_use -= 1
+        self._dispatch()
+
+    @asynccontextmanager
+    async def slot(self, key: str):
+        """async with scheduler.slot(key): await bulk_write(...)"""
+        cls = await self.acquire(key)
+        try:
+            yield cls
+        finally:
+            self.release(cls)
+
+    def stats(self) -> Dict[str, dict]:
+        return {
+            cls.name: {
+                'in_use': cls.in_use,
+                'waiting': cls.waiting,
+                'acquired': cls.stats['acquired'],
+                'waited': cls.stats['waited'],
+                'late': cls.stats['late'],
+                'borrowed': cls.stats['borrowed'],
+                'max_wait': round(cls.max_wait, 3),
+            }
+            for cls in self.classes
+        }
+
+
+def create_write_scheduler(pool_size: int) -> WriteScheduler:
+    """
+    从settings读取:
+        MONGO_WRITE_SLOTS: 0或者不配置表示等于pool_size
+        MONGO_PRIORITY_CLASSES: 类别名 -> {priority, reserved, max_delay, data_types}
+        MONGO_PRIORITY_DEFAULT: 没有配置的数据类型使用的类别
+        MONGO_WRITE_OVERDRAFT: 超过max_delay之后可以借用的额外名额
+    """
+    slots = int(settings.get('MONGO_WRITE_SLOTS') or pool_size)
+    overdraft = int(settings.get('MONGO_WRITE_OVERDRAFT') or 0)
+    config = settings.get('MONGO_PRIORITY_CLASSES') or {}
+    default = settings.get('MONGO_PRIORITY_DEFAULT') or 'default'
+    classes, routes = [], {}
+    for name, options in config.items():
+        options = dict(options)
+        for data_type in options.pop('data_types', ()):
+            routes[data_type] = name
+        classes.append(PriorityClass(name, **options))
+    if default not in config:
+        classes.append(PriorityClass(default))
+    return WriteScheduler(slots, classes, routes, default, overdraft)
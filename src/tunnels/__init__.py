@@ -1,7 +1,9 @@
 """
 author: thomaszdxsn
 """
+import asyncio
 from abc import ABC, abstractmethod
+from typing import List
 
 from ..schemas.items import Item
 
@@ -27,5 +29,43 @@ class TunnelAbstract(ABC):
     async def get_async(self, *args):
         pass
 
+    def put_many(self, items: List[Item]):
+        for item in items:
+            self.put(item)
 
-from .queues import QueueTunnel
\ No newline at end of file
+    async def get_many(self,
+                       id_: str,
+                       max_n: int,
+                       timeout: float=None) -> List[Item]:
+        """
+        最多等待timeout秒直到有数据，然后一次取走当前已有的数据(最多max_n条)
+        超时返回空列表，timeout=0表示不等待
+        默认实现一次只取一条，子类应该覆盖
+        """
+        try:
+            return [await asyncio.wait_for(self.get_async(id_), timeout)]
+        except asyncio.TimeoutError:
+            return []
+
+    async def iter_batches(self, id_: str, max_n: int):
+        """async for items in tunnel.iter_batches(id_, 100): ..."""
+        while True:
+            yield await self.get_many(id_, max_n)
+
+    async def iter_items(self, id_: str, max_n: int=100):
+        """async for item in tunnel.iter_items(id_): ..."""
+        async for items in self.iter_batches(id_, max_n):
+            for item in items:
+                yield item
+
+    async def drain(self, *args):
+        """背压: 等待tunnel有空间接收新数据，默认不等待"""
+        pass
+
+
+from .queues import QueueTunnel
+from .shm import SharedMemoryTunnel
+from .spill import SpillTunnel
+from .fanout import FanoutTunnel
+from .server import FanoutServer
+from .null import NullTunnel
@@ -0,0 +1,190 @@
+"""
+author: thomaszdxsn
+
+发布/订阅tunnel
+
+put进来的数据先分发给所有匹配的订阅者，再交给内部的tunnel(默认QueueTunnel，
+也就是写入mongo的那一路)，get_*/keys/drain等都作用在内部tunnel上
+
+订阅者用key的通配符订阅(ExchangeItem.id, 比如'binance|depth', 'okex_spot|*', '*|trades')，
+每个订阅者有自己的缓冲区和读取进度，互不影响:
+    分发是同步的，不会等待订阅者；
+    订阅者的缓冲区超过limit说明它跟不上，直接断开(reason='slow')，不会拖慢采集
+"""
+import asyncio
+import collections
+import fnmatch
+import logging
+from typing import Callable, Dict, Iterable, List
+
+from . import TunnelAbstract
+from .queues import QueueTunnel
+from ..schemas.items import ExchangeItem
+
+__all__ = (
+    'FanoutTunnel',
+    'Subscription',
+)
+
+
+class Subscription(object):
+
+    def __init__(self,
+                 patterns: Iterable[str],
+                 limit: int=10000,
+                 on_close: Callable[['Subscription'], None]=None,
+                 loop=None):
+        self.patterns = tuple(patterns)
+        self.limit = limit
+        self.on_close = on_close
+        self.closed = False
+        self.reason = None
+        self.delivered = 0
+        self._buffer = collections.deque()
+        self._matches: Dict[str, bool] = {}
+        self._waiter = None
+        self._loop = loop or asyncio.get_event_loop()
+
+    def matches(self, key: str) -> bool:
+        result = self._matches.get(key)
+        if result is None:
+            result = self._matches[key] = any(
+                fnmatch.fnmatchcase(key, pattern) for pattern in self.patterns
+            )
+        return result
+
+    def backlog(self) -> int:
+        return len(self._buffer)
+
+    def _wakeup(self):
+        if self._waiter is not None and not self._waiter.done():
+            self._waiter.set_result(None)
+
+    def push(self, item: ExchangeItem) -> bool:
+        if self.closed:
+            return False
+        if len(self._buffer) >= self.limit:
+            self.close('slow')
+            return False
+        self._buffer.append(item)
+        self._wakeup()
+        return True
+
+    def close(self, reason: str='closed'):
+        if self.closed:
+            return
+        self.closed = True
+        self.reason = reason
+        self._buffer.clear()
+        self._wakeup()
+        if self.on_close is not None:
+            self.on_close(self)
+
+    async def get_many(self,
+                       max_n: int,
+                       timeout: float=None) -> List[ExchangeItem]:
+        """和TunnelAbstract.get_many一样，订阅关闭之后返回空列表"""
+        if not self._buffer and not self.closed and timeout != 0:
+            self._waiter = self._loop.create_future()
+            try:
+                await asyncio.wait_for(self._waiter, timeout)
+            except asyncio.TimeoutError:
+                pass
+            finally:
+                self._waiter = None
+        n = min(max_n, len(self._buffer))
+        items = [self._buffer.popleft() for _ in range(n)]
+        self.delivered += n
+        return items
+
+    async def __aiter__(self):
+        """async for item in subscription: ...  订阅关闭之后结束"""
+        while not self.closed:
+            for item in await self.get_many(1000):
+                yield item
+
+
+class FanoutTunnel(TunnelAbstract):
+
+    def __init__(self, tunnel: TunnelAbstract=None, limit: int=10000):
+        self.tunnel = tunnel if tunnel is not None else QueueTunnel()
+        self.limit = limit
+        self.logger = logging.getLogger(f'tunnel.{self.__class__.__name__}')
+        self.disconnected = collections.Counter()      # reason -> 次数
+        self._subscriptions: List[Subscription] = []
+        self._routes: Dict[str, List[Subscription]] = {}   # key -> 匹配的订阅者
+
+    @property
+    def subscriptions(self) -> List[Subscription]:
+        return list(self._subscriptions)
+
+    def subscribe(self, *patterns: str, limit: int=None) -> Subscription:
+        sub = Subscription(patterns or ('*',),
+                           limit or self.limit,
+                           on_close=self._on_close)
+        self._subscriptions.append(sub)
+        self._routes.clear()
+        return sub
+
+    def unsubscribe(self, sub: Subscription):
+        sub.close()
+
+    def _on_close(self, sub: Subscription):
+        self._subscriptions.remove(sub)
+        self._routes.clear()
+        self.disconnected[sub.reason] += 1
+        if sub.reason == 'slow':
+            self.logger.warning(f'fanout|disconnect slow subscriber|'
+                                f'{sub.patterns}|delivered={sub.delivered}')
+
+    def _route(self, key: str) -> List[Subscription]:
+        subs = self._routes.get(key)
+        if subs is None:
+            subs = self._routes[key] = [
+                sub for sub in self._subscriptions if sub.matches(key)
+            ]
+        return subs
+
+    def publish(self, item: ExchangeItem):
+        subs = self._route(item.id)
+        if subs:
+            for sub in list(subs):      # push可能会断开订阅者，修改_routes
+                sub.push(item)
+
+    def put(self, item: ExchangeItem):
+        self.publish(item)
+        self.tunnel.put(item)
+
+    def put_many(self, items: List[ExchangeItem]):
+        if self._subscriptions:
+            for item in items:
+                self.publish(item)
+        self.tunnel.put_many(items)
+
+    async def put_async(self, item: ExchangeItem):
+        self.publish(item)
+        await self.tunnel.put_async(item)
+
+    async def drain(self, *args):
+        await self.tunnel.drain(*args)
+
+    def keys(self):
+        return self.tunnel.keys()
+
+    def add_key_listener(self, callback):
+        self.tunnel.add_key_listener(callback)
+
+    def get_queue(self, id_: str):
+        return self.tunnel.get_queue(id_)
+
+    def get(self, id_: str) -> ExchangeItem:
+        return self.tunnel.get(id_)
+
+    async def get_async(self, id_: str) -> ExchangeItem:
+        return await self.tunnel.get_async(id_)
+
+    async def get_many(self,
+                       id_: str,
+                       max_n: int,
+                       timeout: float=None) -> List[ExchangeItem]:
+        return await self.tunnel.get_many(id_, max_n, timeout)
@@ -0,0 +1,52 @@
+"""
+author: thomaszdxsn
+"""
+import asyncio
+import collections
+from typing import List
+
+from . import TunnelAbstract
+from ..schemas.items import ExchangeItem
+
+__all__ = (
+    'NullTunnel',
+)
+
+
+class NullTunnel(TunnelAbstract):
+    """
+    只计数不保存的tunnel，回放/压测时代替真实的tunnel，
+    counts: key -> 放入的数据条数
+    """
+
+    def __init__(self):
+        self.counts = collections.Counter()
+
+    def keys(self):
+        return list(self.counts.keys())
+
+    def put(self, item: ExchangeItem):
+        self.counts[item.id] += 1
+
+    def put_many(self, items: List[ExchangeItem]):
+        for item in items:
+            self.counts[item.id] += 1
+
+    async def put_async(self, item: ExchangeItem):
+        self.put(item)
+
+    def get(self, id_: str):
+        return None
+
+    async def get_async(self, id_: str):
+        """永远没有数据"""
+        await asyncio.Future()
+
+    async def get_many(self,
+                       id_: str,
+                       max_n: int,
+                       timeout: float=None) -> List[ExchangeItem]:
+        if timeout is None:
+            await asyncio.Future()
+        await asyncio.sleep(timeout)
+        return []
@@ -1,23 +1,164 @@
 """
 author: thomaszdxsn
 """
+import asyncio
 import collections
+import itertools
 from asyncio.queues import Queue
-from typing import Tuple
+from typing import Callable, Dict, List, Union
+
+from dynaconf import settings
 
 from . import TunnelAbstract
 from ..schemas.items import ExchangeItem
 
-__all__ = ('QueueTunnel',)
+__all__ = (
+    'QueueTunnel',
+    'BoundedQueue',
+    'ConflatingQueue',
+)
+
+OVERFLOW_BLOCK = 'block'
+OVERFLOW_DROP_OLDEST = 'drop_oldest'
+OVERFLOW_CONFLATE = 'conflate'
+# conflate时区分"同一份数据"的字段，okex_future同一个pair有this_week/next_week/quarter三个合约
+CONFLATE_IDENTITY_FIELDS = ('pair', 'contract_type')
+
+
+def get_policy(policies: Dict[str, dict], data_type: str) -> Union[dict, None]:
+    """数据类型的溢出策略，没有配置的使用default"""
+    return policies.get(data_type) or policies.get('default')
+
+
+class BoundedQueue(Queue):
+    """
+    超过limit之后按overflow策略处理，put_nowait永远不会抛出QueueFull:
+        block: 不丢数据，由put_async/QueueTunnel.drain等待queue有空间(背压)
+        drop_oldest: 丢掉最旧的数据
+    stats记录dropped/conflated/blocked的次数
+    """
+
+    def __init__(self, limit: int, overflow: str=OVERFLOW_BLOCK, loop=None):
+        super(BoundedQueue, self).__init__(maxsize=0, loop=loop)
+        self.limit = limit
+        self.overflow = overflow
+        self.stats = collections.Counter()
+        self._room = asyncio.Event(loop=loop)
+        self._room.set()
+
+    def is_full(self) -> bool:
+        return 0 < self.limit <= self.qsize()
+
+    @property
+    def blocking(self) -> bool:
+        """block策略并且已经超过上限，写入方应该等待"""
+        return not self._room.is_set()
+
+    def put_nowait(self, item):
+        if self.is_full() and self._overflow(item):
+            return
+        super(BoundedQueue, self).put_nowait(item)
+        if self.overflow == OVERFLOW_BLOCK and self.is_full():
+            self._room.clear()
+
+    def _overflow(self, item) -> bool:
+        """返回True表示item已经被处理，不需要再放入queue"""
+        if self.overflow == OVERFLOW_BLOCK:
+            self.stats['over_limit'] += 1
+        else:
+            self.get_nowait()
+            self.task_done()
+            self.stats['dropped'] += 1
+        return False
+
+    def _get(self):
+        item = super(BoundedQueue, self)._get()
+        if not self._room.is_set() and not self.is_full():
+            self._room.set()
+        return item
+
+    async def wait_for_room(self):
+        if not self._room.is_set():
+            self.stats['blocked'] += 1
+            await self._room.wait()
+
+
+class ConflatingQueue(BoundedQueue):
+    """
+    conflate: 超过limit时，同一个pair(和contract_type)还没被取走的数据直接替换成最新的(位置不变)，
+    没有待取走的数据时丢掉最旧的
+    """
+    _identity_fields: Dict[type, tuple] = {}
+
+    def __init__(self, limit: int, overflow: str=OVERFLOW_CONFLATE, loop=None):
+        super(ConflatingQueue, self).__init__(limit, overflow, loop)
+
+    @classmethod
+    def conflate_key(cls, item) -> Union[tuple, None]:
+        """schema里有的CONFLATE_IDENTITY_FIELDS组成的元组，没有pair的数据不合并"""
+        data = item.data
+        fields = cls._identity_fields.get(type(data))
+        if fields is None:
+            fields = cls._identity_fields[type(data)] = tuple(
+                name for name in CONFLATE_IDENTITY_FIELDS
+                if hasattr(data, name)
+            )
+        if 'pair' not in fields:
+            return None
+        return tuple(getattr(data, name) for name in fields)
+
+    def _init(self, maxsize):
+        self._queue = collections.OrderedDict()     # slot -> item
+        self._pending = {}                          # pair -> slot
+        self._slots = itertools.count()
+
+    def _put(self, item):
+        slot = next(self._slots)
+        self._queue[slot] = item
+        key = self.conflate_key(item)
+        if key is not None:
+            self._pending[key] = slot
+
+    def _get(self):
+        slot, item = self._queue.popitem(last=False)
+        key = self.conflate_key(item)
+        if self._pending.get(key) == slot:
+            del self._pending[key]
+        if not self._room.is_set() and not self.is_full():
+            self._room.set()
+        return item
+
+    def conflate(self, item) -> bool:
+        """同一个pair还有没被取走的数据时原地替换成item，返回是否替换了"""
+        slot = self._pending.get(self.conflate_key(item))
+        if slot is None:
+            return False
+        self._queue[slot] = item
+        self.stats['conflated'] += 1
+        return True
+
+    def _overflow(self, item) -> bool:
+        if self.conflate(item):
+            return True
+        return super(ConflatingQueue, self)._overflow(item)
 
 
 class QueueTunnel(TunnelAbstract):
-    # TODO: 做成异步迭代器的形式
 
-    def __init__(self, maxsize=0, loop=None):
-        def queue_factory():
-            return Queue(maxsize=maxsize, loop=loop)
-        self._container = collections.defaultdict(queue_factory)
+    def __init__(self, maxsize=0, loop=None, policies: Dict[str, dict]=None):
+        """
+        policies: 数据类型 -> {'maxsize': int, 'overflow': block|drop_oldest|conflate}
+        默认读取settings的TUNNEL_POLICIES，没有配置的数据类型使用default，
+        都没有的话使用maxsize参数的普通Queue
+        """
+        if policies is None:
+            policies = settings.get('TUNNEL_POLICIES') or {}
+        self._maxsize = maxsize
+        self._loop = loop
+        self._policies = policies
+        self._container = {}
+        self._blocked = set()                   # 超过上限的block策略的key
+        self._key_listeners = []
 
     def __len__(self):
         return len(self._container)
@@ -25,16 +166,70 @@ class QueueTunnel(TunnelAbstract):
     def keys(self):
         return list(self._container.keys())
 
+    def add_key_listener(self, callback: Callable[[str], None]):
+        """tunnel出现新key的时候立即回调callback(key)"""
+        self._key_listeners.append(callback)
+
+    def _create_queue(self, item_id: str) -> Queue:
+        data_type = item_id.split('|', 1)[-1]
+        policy = get_policy(self._policies, data_type)
+        if not policy or not policy.get('maxsize'):
+            return Queue(maxsize=self._maxsize, loop=self._loop)
+        overflow = policy.get('overflow', OVERFLOW_BLOCK)
+        queue_class = ConflatingQueue if overflow == OVERFLOW_CONFLATE \
+            else BoundedQueue
+        return queue_class(int(policy['maxsize']), overflow, loop=self._loop)
+
     def get_queue(self, item_id):
-        return self._container[item_id]
+        queue = self._container.get(item_id)
+        if queue is None:
+            queue = self._container[item_id] = self._create_queue(item_id)
+            for callback in self._key_listeners:
+                callback(item_id)
+        return queue
+
+    def stats(self) -> Dict[str, Dict[str, int]]:
+        """key -> dropped/conflated/blocked/over_limit计数"""
+        return {
+            key: dict(queue.stats)
+            for key, queue in self._container.items()
+            if isinstance(queue, BoundedQueue)
+        }
 
     def put(self, item: ExchangeItem):
         queue = self.get_queue(item.id)
         queue.put_nowait(item)
+        if getattr(queue, 'blocking', False):
+            self._blocked.add(item.id)
+
+    def put_many(self, items: List[ExchangeItem]):
+        """同一个key的连续数据只查找一次queue"""
+        id_ = queue = None
+        for item in items:
+            if item.id != id_:
+                id_ = item.id
+                queue = self.get_queue(id_)
+            queue.put_nowait(item)
+            if getattr(queue, 'blocking', False):
+                self._blocked.add(id_)
 
     async def put_async(self, item: ExchangeItem):
         queue = self.get_queue(item.id)
-        await queue.put(item)
+        if isinstance(queue, BoundedQueue):
+            await queue.wait_for_room()
+            queue.put_nowait(item)
+        else:
+            await queue.put(item)
+
+    async def drain(self, exchange: str=None):
+        """等待(这个交易所的)block策略的queue回到上限以下"""
+        if not self._blocked:
+            return
+        prefix = f'{exchange}|' if exchange else ''
+        for key in list(self._blocked):
+            if key.startswith(prefix):
+                await self._container[key].wait_for_room()
+                self._blocked.discard(key)
 
     async def get_async(self, id_: str) -> ExchangeItem:
         queue = self.get_queue(id_)
@@ -42,8 +237,30 @@ class QueueTunnel(TunnelAbstract):
         queue.task_done()
         return item
 
+    async def get_many(self,
+                       id_: str,
+                       max_n: int,
+                       timeout: float=None) -> List[ExchangeItem]:
+        queue = self.get_queue(id_)
+        items = []
+        if queue.empty():
+            if timeout == 0:
+                return items
+            try:
+                if timeout is None:
+                    items.append(await queue.get())
+                else:
+                    items.append(await asyncio.wait_for(queue.get(), timeout))
+            except asyncio.TimeoutError:
+                return items
+        while len(items) < max_n and not queue.empty():
+            items.append(queue.get_nowait())
+        for _ in items:
+            queue.task_done()
+        return items
+
     def get(self, id_: str) -> ExchangeItem:
         queue = self.get_queue(id_)
         item = queue.get_nowait()
         queue.task_done()
-        return item
\ No newline at end of file
+        return item
@@ -0,0 +1,150 @@
+"""
+author: thomaszdxsn
+
+把FanoutTunnel的实时数据通过本地Unix socket或者TCP暴露给策略进程，代替轮询mongo
+
+协议(一行一条JSON，\\n结尾):
+    客户端连接之后发送一行订阅的key通配符，空格分隔: 'binance|depth okex_spot|*'
+    服务端之后不断推送: {"id": "binance|depth", "data": {...}}
+    datetime字段是ISO格式的字符串
+
+跟不上的客户端会被断开，不会影响采集:
+    - 订阅者缓冲区超过limit(见FanoutTunnel)
+    - socket的发送缓冲区超过max_buffer字节
+"""
+import asyncio
+import json
+import logging
+from datetime import datetime
+from typing import AsyncIterator, Dict, Iterable, Union
+
+from .fanout import FanoutTunnel, Subscription
+from ..schemas.items import ExchangeItem
+
+__all__ = (
+    'FanoutServer',
+    'parse_address',
+    'encode_item',
+    'subscribe',
+)
+
+
+def _json_default(obj):
+    if isinstance(obj, datetime):
+        return obj.isoformat()
+    raise TypeError(f'{obj.__class__.__name__} is not JSON serializable')
+
+
+def encode_item(item: ExchangeItem) -> bytes:
+    data = item.data
+    if hasattr(data, 'to_dict'):
+        data = data.to_dict()
+    line = json.dumps({'id': item.id, 'data': data},
+                      default=_json_default, separators=(',', ':'))
+    return line.encode() + b'\n'
+
+
+def parse_address(address: str) -> Dict[str, Union[str, int]]:
+    """'/tmp/marketking.sock' -> unix socket, 'host:port' -> TCP"""
+    if address.startswith('unix:'):
+        return {'path': address[5:]}
+    if '/' in address:
+        return {'path': address}
+    host, port = address.rsplit(':', 1)
+    return {'host': host or '127.0.0.1', 'port': int(port)}
+
+
+class FanoutServer(object):
+
+    def __init__(self,
+                 tunnel: FanoutTunnel,
+                 address: str,
+                 max_buffer: int=4 * 1024 * 1024,
+                 batch: int=500):
+        self.tunnel = tunnel
+        self.address = address
+        self.max_buffer = max_buffer
+        self.batch = batch
+        self.logger = logging.getLogger(f'tunnel.{self.__class__.__name__}')
+        self._server = None
+
+    async def start(self):
+        kwargs = parse_address(self.address)
+        if 'path' in kwargs:
+            self._server = await asyncio.start_unix_server(self._handle,
+                                                           **kwargs)
+        else:
+            self._server = await asyncio.start_server(self._handle, **kwargs)
+        self.logger.info(f'fanout server listening on {self.address}')
+
+    @property
+    def sockets(self):
+        return self._server.sockets if self._server is not None else []
+
+    async def stop(self):
+        if self._server is not None:
+            self._server.close()
+            await self._server.wait_closed()
+            self._server = None
+
+    async def _handle(self,
+                      reader: asyncio.StreamReader,
+                      writer: asyncio.StreamWriter):
+        try:
+            line = await asyncio.wait_for(reader.readline(), 10)
+        except asyncio.TimeoutError:
+            writer.close()
+            return
+        patterns = line.decode().split()
+        if not patterns:
+            writer.close()
+            return
+        transport = writer.transport
+        # 订阅者被断开时直接abort，正在等待drain的协程会马上抛出异常
+        sub = self.tunnel.subscribe(*patterns)
+        sub.on_close = self._on_close(sub.on_close, transport)
+        try:
+            while not sub.closed:
+                items = await sub.get_many(self.batch)
+                if not items:
+                    continue
+                writer.write(b''.join(map(encode_item, items)))
+                if transport.get_write_buffer_size() > self.max_buffer:
+                    sub.close('slow')
+                    break
+                await writer.drain()
+        except ConnectionError:
+            pass
+        finally:
+            sub.close('disconnected')
+            transport.abort()
+
+    @staticmethod
+    def _on_close(callback, transport):
+        def on_close(sub: Subscription):
+            callback(sub)
+            transport.abort()
+        return on_close
+
+
+async def subscribe(address: str,
+                    patterns: Iterable[str]) -> AsyncIterator[dict]:
+    """
+    客户端:
+        async for msg in subscribe('/tmp/marketking.sock', ['binance|depth']):
+            msg['id'], msg['data']
+    """
+    kwargs = parse_address(address)
+    if 'path' in kwargs:
+        reader, writer = await asyncio.open_unix_connection(**kwargs)
+    else:
+        reader, writer = await asyncio.open_connection(**kwargs)
+    writer.write(' '.join(patterns).encode() + b'\n')
+    try:
+        while True:
+            line = await reader.readline()
+            if not line:
+                return
+            yield json.loads(line)
+    finally:
+        writer.close()
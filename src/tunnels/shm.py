@@ -0,0 +1,249 @@
+"""
+author: thomaszdxsn
+
+基于共享内存环形缓冲区的tunnel，用于多进程:
+    采集进程只负责解析数据和put，写入进程从环形缓冲区取数据批量写入mongo
+
+缓冲区是一个multiprocessing.RawArray，head/tail是单调递增的字节偏移(RawValue)，
+实际位置是offset % capacity:
+    记录格式: [uint32 长度][pickle数据]
+    尾部剩余空间放不下一条记录时写入WRAP标记(剩余不足4字节时不写)，读取方跳到缓冲区开头
+多个写入进程共用write_lock，多个读取进程共用read_lock
+
+消费进程里，pump协程把记录解包之后按key分发到本地的QueueTunnel，
+get_async/get_many/keys/add_key_listener都作用在本地tunnel上，
+所以MongoStorage.worker和WriterPool可以直接使用
+
+消费者落后(缓冲区满)的时候:
+    drain(): 等待pending写完、缓冲区空闲空间回到capacity的1/4以上(monitor每条ws消息之后都会调用)
+    put_async(): 等待直到放得下
+    put(): 同步调用不能等待，按TUNNEL_POLICIES里数据类型的overflow策略处理:
+        block(trades等): 暂存在本进程的pending里，之后按顺序写入缓冲区，由drain()背压
+        drop_oldest/conflate(depth/ticker): 已经写入缓冲区的数据不能替换，丢掉这条数据并计数
+"""
+import asyncio
+import collections
+import ctypes
+import multiprocessing
+import pickle
+import struct
+from typing import Dict, List
+
+from dynaconf import settings
+
+from . import TunnelAbstract
+from .queues import OVERFLOW_BLOCK, QueueTunnel, get_policy
+from ..schemas.items import Item
+
+__all__ = (
+    'SharedMemoryTunnel',
+)
+
+LENGTH = struct.Struct('<I')
+WRAP = 0xFFFFFFFF
+
+
+class SharedMemoryTunnel(TunnelAbstract):
+
+    def __init__(self,
+                 capacity: int=64 * 1024 * 1024,
+                 poll_interval: float=0.005,
+                 policies: Dict[str, dict]=None):
+        """policies: 同QueueTunnel，默认读取settings的TUNNEL_POLICIES"""
+        if policies is None:
+            policies = settings.get('TUNNEL_POLICIES') or {}
+        self.capacity = capacity
+        self.poll_interval = poll_interval
+        self._policies = policies
+        self._overflows = {}                    # data_type -> overflow
+        self._pending = collections.deque()     # block策略暂存的记录(本进程)
+        self._stats = collections.defaultdict(collections.Counter)
+        self._buffer = multiprocessing.RawArray(ctypes.c_char, capacity)
+        self._head = multiprocessing.RawValue(ctypes.c_uint64, 0)
+        self._tail = multiprocessing.RawValue(ctypes.c_uint64, 0)
+        self._dropped = multiprocessing.RawValue(ctypes.c_uint64, 0)
+        self._write_lock = multiprocessing.Lock()
+        self._read_lock = multiprocessing.Lock()
+        self._view = None
+        self._local = None
+        self._pump = None
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state.update(_view=None, _local=None, _pump=None,
+                     _pending=collections.deque(),
+                     _stats=collections.defaultdict(collections.Counter))
+        return state
+
+    @property
+    def view(self) -> memoryview:
+        if self._view is None:
+            self._view = memoryview(self._buffer).cast('B')
+        return self._view
+
+    # ---- 写入(采集进程) ----
+
+    @property
+    def dropped(self) -> int:
+        return self._dropped.value
+
+    def lag(self) -> int:
+        """还没有被消费的字节数"""
+        return self._head.value - self._tail.value
+
+    def free(self) -> int:
+        return self.capacity - self.lag()
+
+    def _write(self, payload: bytes) -> bool:
+        need = LENGTH.size + len(payload)
+        if need > self.capacity:
+            raise ValueError(f'record size {need} > capacity {self.capacity}')
+        view = self.view
+        with self._write_lock:
+            head = self._head.value
+            pos = head % self.capacity
+            pad = self.capacity - pos
+            if pad >= need:
+                pad = 0
+            if head + pad + need - self._tail.value > self.capacity:
+                return False
+            if pad:
+                if pad >= LENGTH.size:
+                    LENGTH.pack_into(view, pos, WRAP)
+                pos = 0
+            LENGTH.pack_into(view, pos, len(payload))
+            view[pos + LENGTH.size: pos + need] = payload
+            self._head.value = head + pad + need
+        return True
+
+    @property
+    def pending(self) -> int:
+        """本进程里等待写入缓冲区的记录数"""
+        return len(self._pending)
+
+    def _flush_pending(self) -> bool:
+        """按顺序写入pending，全部写完返回True"""
+        pending = self._pending
+        while pending:
+            if not self._write(pending[0]):
+                return False
+            pending.popleft()
+        return True
+
+    def _overflow(self, item: Item) -> str:
+        data_type = item.id.split('|', 1)[-1]
+        overflow = self._overflows.get(data_type)
+        if overflow is None:
+            policy = get_policy(self._policies, data_type) or {}
+            overflow = self._overflows[data_type] = policy.get(
+                'overflow', OVERFLOW_BLOCK
+            )
+        return overflow
+
+    def put(self, item: Item) -> bool:
+        """缓冲区满并且item的策略不是block的时候丢掉item并返回False"""
+        payload = pickle.dumps(item, pickle.HIGHEST_PROTOCOL)
+        if self._flush_pending() and self._write(payload):
+            return True
+        if self._overflow(item) == OVERFLOW_BLOCK:
+            self._pending.append(payload)
+            self._stats[item.id]['over_limit'] += 1
+            return True
+        self._stats[item.id]['dropped'] += 1
+        with self._write_lock:
+            self._dropped.value += 1
+        return False
+
+    def put_many(self, items: List[Item]):
+        for item in items:
+            self.put(item)
+
+    async def put_async(self, item: Item):
+        payload = pickle.dumps(item, pickle.HIGHEST_PROTOCOL)
+        while not (self._flush_pending() and self._write(payload)):
+            await asyncio.sleep(self.poll_interval)
+
+    async def drain(self, *args):
+        while not self._flush_pending() or self.free() < self.capacity // 4:
+            await asyncio.sleep(self.poll_interval)
+
+    def stats(self) -> Dict[str, Dict[str, int]]:
+        """key -> 本进程写入缓冲区时的dropped/over_limit计数，消费进程里加上本地tunnel的计数"""
+        stats = {key: dict(counts) for key, counts in self._stats.items()}
+        if self._local is not None:
+            for key, counts in self._local.stats().items():
+                merged = stats.setdefault(key, {})
+                for event, n in counts.items():
+                    merged[event] = merged.get(event, 0) + n
+        return stats
+
+    # ---- 读取(写入mongo的进程) ----
+
+    def read_many(self, max_n: int) -> List[Item]:
+        """不等待，最多取出max_n条"""
+        payloads = []
+        view = self.view
+        with self._read_lock:
+            with self._write_lock:      # 保证读到head之前写入的数据
+                head = self._head.value
+            tail = self._tail.value
+            while tail < head and len(payloads) < max_n:
+                pos = tail % self.capacity
+                remain = self.capacity - pos
+                if remain < LENGTH.size:
+                    tail += remain
+                    continue
+                length, = LENGTH.unpack_from(view, pos)
+                if length == WRAP:
+                    tail += remain
+                    continue
+                start = pos + LENGTH.size
+                payloads.append(bytes(view[start: start + length]))
+                tail += LENGTH.size + length
+            self._tail.value = tail
+        return [pickle.loads(payload) for payload in payloads]
+
+    def start_consumer(self, local: QueueTunnel=None, batch: int=1000):
+        """在消费进程的event loop里调用，开始把数据分发到本地tunnel"""
+        self._local = local if local is not None else QueueTunnel()
+        self._pump = asyncio.ensure_future(self._pump_forever(batch))
+
+    async def _pump_forever(self, batch: int):
+        interval = self.poll_interval
+        while True:
+            items = self.read_many(batch)
+            if items:
+                self._local.put_many(items)
+                await self._local.drain()
+                interval = self.poll_interval
+                await asyncio.sleep(0)
+            else:
+                await asyncio.sleep(interval)
+                interval = min(interval * 2, 0.1)
+
+    @property
+    def local(self) -> QueueTunnel:
+        if self._local is None:
+            raise RuntimeError('call start_consumer() in the consumer process')
+        return self._local
+
+    def keys(self):
+        return self.local.keys()
+
+    def add_key_listener(self, callback):
+        self.local.add_key_listener(callback)
+
+    def get_queue(self, id_: str):
+        return self.local.get_queue(id_)
+
+    def get(self, id_: str) -> Item:
+        return self.local.get(id_)
+
+    async def get_async(self, id_: str) -> Item:
+        return await self.local.get_async(id_)
+
+    async def get_many(self,
+                       id_: str,
+                       max_n: int,
+                       timeout: float=None) -> List[Item]:
+        return await self.local.get_many(id_, max_n, timeout)
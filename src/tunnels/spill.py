@@ -0,0 +1,252 @@
+"""
+author: thomaszdxsn
+
+内存queue超过阈值之后溢出到本地磁盘的tunnel
+
+每个key一个目录(目录名是quote之后的key)，目录里是固定大小、mmap映射的segment文件(只追加):
+    segment头部: [uint64 read_offset][uint64 write_offset]
+    记录: [uint32 长度][pickle数据]
+读写偏移直接写在mmap的头部，进程重启之后从read_offset继续读;
+read_offset在数据补充回内存queue时就前移，所以进程崩溃时丢失的只有内存queue里的数据
+(每个key最多memory_limit条，和不溢出时一样)，磁盘上还没补充回内存的数据不会丢失;
+mmap的修改由flush()写回磁盘(main里每SPILL_FLUSH_INTERVAL秒一次，退出时一次)
+读完的segment会被删除，正在写的segment读完之后从头复用
+
+溢出策略: 内存queue的上限是threshold和TUNNEL_POLICIES的maxsize中较小的一个，
+到达上限时原本会block(背压)或者drop_oldest(丢数据)的，改为写入磁盘；
+conflate策略的queue里同一个pair还没被取走时仍然在内存里合并，不能合并时才溢出
+
+顺序保证: 某个key一旦开始溢出，之后的数据都先写入磁盘(也不再合并)，
+消费时先取内存queue，内存queue低于上限的一半时按顺序从磁盘补充，磁盘读空之后再回到内存
+"""
+import collections
+import logging
+import mmap
+import os
+import pickle
+import struct
+from pathlib import Path
+from typing import Dict, List, Union
+from urllib.parse import quote, unquote
+
+from .queues import ConflatingQueue, QueueTunnel
+from ..schemas.items import ExchangeItem
+
+__all__ = (
+    'Segment',
+    'SegmentLog',
+    'SpillTunnel',
+)
+
+HEADER = struct.Struct('<QQ')
+LENGTH = struct.Struct('<I')
+
+
+class Segment(object):
+
+    def __init__(self, path: Path, size: int):
+        self.path = path
+        exists = path.exists()
+        with open(path, 'r+b' if exists else 'w+b') as f:
+            if not exists:
+                f.truncate(size)
+            self.size = os.fstat(f.fileno()).st_size
+            self._mmap = mmap.mmap(f.fileno(), self.size)
+        if exists:
+            self.read_offset, self.write_offset = HEADER.unpack_from(self._mmap)
+        else:
+            self.read_offset = self.write_offset = HEADER.size
+            self._save_offsets()
+
+    def _save_offsets(self):
+        HEADER.pack_into(self._mmap, 0, self.read_offset, self.write_offset)
+
+    def exhausted(self) -> bool:
+        return self.read_offset >= self.write_offset
+
+    def append(self, payload: bytes) -> bool:
+        end = self.write_offset + LENGTH.size + len(payload)
+        if end > self.size:
+            return False
+        LENGTH.pack_into(self._mmap, self.write_offset, len(payload))
+        self._mmap[self.write_offset + LENGTH.size: end] = payload
+        self.write_offset = end
+        self._save_offsets()
+        return True
+
+    def read(self, max_n: int) -> List[bytes]:
+        payloads = []
+        offset = self.read_offset
+        while offset < self.write_offset and len(payloads) < max_n:
+            length, = LENGTH.unpack_from(self._mmap, offset)
+            start = offset + LENGTH.size
+            payloads.append(self._mmap[start: start + length])
+            offset = start + length
+        self.read_offset = offset
+        self._save_offsets()
+        return payloads
+
+    def reset(self):
+        """读完的segment从头开始复用"""
+        self.read_offset = self.write_offset = HEADER.size
+        self._save_offsets()
+
+    def count(self) -> int:
+        """还没有读取的记录数"""
+        n, offset = 0, self.read_offset
+        while offset < self.write_offset:
+            length, = LENGTH.unpack_from(self._mmap, offset)
+            offset += LENGTH.size + length
+            n += 1
+        return n
+
+    def flush(self):
+        self._mmap.flush()
+
+    def remove(self):
+        self._mmap.close()
+        self.path.unlink()
+
+
+class SegmentLog(object):
+    """一个目录下按序号排列的segment文件"""
+
+    def __init__(self, directory: Union[str, Path], segment_size: int):
+        self.directory = Path(directory)
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self.segment_size = segment_size
+        self._segments = collections.deque(
+            Segment(path, segment_size)
+            for path in sorted(self.directory.glob('*.seg'))
+        )
+        self.pending = sum(segment.count() for segment in self._segments)
+
+    def __len__(self) -> int:
+        return self.pending
+
+    def _new_segment(self) -> Segment:
+        seq = int(self._segments[-1].path.stem) + 1 if self._segments else 0
+        segment = Segment(self.directory / f'{seq:012d}.seg',
+                          self.segment_size)
+        self._segments.append(segment)
+        return segment
+
+    def append(self, payload: bytes):
+        if HEADER.size + LENGTH.size + len(payload) > self.segment_size:
+            raise ValueError(f'record size {len(payload)} > segment size')
+        if not self._segments or not self._segments[-1].append(payload):
+            self._new_segment().append(payload)
+        self.pending += 1
+
+    def read(self, max_n: int) -> List[bytes]:
+        payloads = []
+        while self._segments and len(payloads) < max_n:
+            segment = self._segments[0]
+            payloads.extend(segment.read(max_n - len(payloads)))
+            if segment.exhausted():
+                if len(self._segments) == 1:
+                    segment.reset()
+                    break
+                self._segments.popleft().remove()
+        self.pending -= len(payloads)
+        return payloads
+
+    def flush(self):
+        for segment in self._segments:
+            segment.flush()
+
+
+class SpillTunnel(QueueTunnel):
+
+    def __init__(self,
+                 directory: Union[str, Path],
+                 threshold: int=10000,
+                 segment_size: int=64 * 1024 * 1024,
+                 loop=None,
+                 policies: Dict[str, dict]=None):
+        super(SpillTunnel, self).__init__(loop=loop, policies=policies)
+        self.logger = logging.getLogger(f'tunnel.{self.__class__.__name__}')
+        self.directory = Path(directory)
+        self.threshold = threshold
+        self.segment_size = segment_size
+        self._logs = {}
+        self.spilled = collections.Counter()
+        for path in sorted(self.directory.glob('*')):     # 恢复上次没写完的数据
+            key = unquote(path.name)
+            if path.is_dir() and '|' in key:
+                self._logs[key] = SegmentLog(path, segment_size)
+                self.get_queue(key)
+
+    def _get_log(self, key: str) -> SegmentLog:
+        log = self._logs.get(key)
+        if log is None:
+            log = self._logs[key] = SegmentLog(
+                self.directory / quote(key, safe=''),
+                self.segment_size
+            )
+        return log
+
+    def spilled_count(self, key: str) -> int:
+        log = self._logs.get(key)
+        return len(log) if log is not None else 0
+
+    def memory_limit(self, queue) -> int:
+        """threshold和queue的上限(TUNNEL_POLICIES的maxsize)中较小的一个"""
+        limit = getattr(queue, 'limit', 0)
+        return min(limit, self.threshold) if limit else self.threshold
+
+    def _refill(self, key: str, queue):
+        """内存queue低于上限的一半时，按顺序从磁盘补充"""
+        log = self._logs.get(key)
+        limit = self.memory_limit(queue)
+        if not log or queue.qsize() * 2 >= limit:
+            return
+        payloads = log.read(limit - queue.qsize())
+        for payload in payloads:
+            queue.put_nowait(pickle.loads(payload))
+
+    def put(self, item: ExchangeItem):
+        key = item.id
+        queue = self.get_queue(key)
+        if not self.spilled_count(key):
+            if queue.qsize() < self.memory_limit(queue):
+                super(SpillTunnel, self).put(item)
+                return
+            if isinstance(queue, ConflatingQueue) and queue.conflate(item):
+                return
+        try:
+            self._get_log(key).append(
+                pickle.dumps(item, pickle.HIGHEST_PROTOCOL)
+            )
+        except (OSError, ValueError) as exc:    # 磁盘满了，按queue的溢出策略处理
+            self.logger.error(f'spill|{key}|{exc!r}')
+            super(SpillTunnel, self).put(item)
+            return
+        self.spilled[key] += 1
+        self._refill(key, queue)
+
+    def put_many(self, items: List[ExchangeItem]):
+        for item in items:
+            self.put(item)
+
+    async def put_async(self, item: ExchangeItem):
+        self.put(item)
+
+    def get(self, id_: str) -> ExchangeItem:
+        self._refill(id_, self.get_queue(id_))
+        return super(SpillTunnel, self).get(id_)
+
+    async def get_async(self, id_: str) -> ExchangeItem:
+        self._refill(id_, self.get_queue(id_))
+        return await super(SpillTunnel, self).get_async(id_)
+
+    async def get_many(self,
+                       id_: str,
+                       max_n: int,
+                       timeout: float=None) -> List[ExchangeItem]:
+        self._refill(id_, self.get_queue(id_))
+        return await super(SpillTunnel, self).get_many(id_, max_n, timeout)
+
+    def flush(self):
+        for log in self._logs.values():
+            log.flush()
@@ -24,11 +24,31 @@ from .schemas.sdk import ResponseMsg, HttpErrorEnum
 from .schemas.logs import LogMsgFmt
 
 
-def decompress_okex_data(raw_data: bytes) -> str:
-    decompressor = zlib.decompressobj(-zlib.MAX_WBITS)
-    inflated = decompressor.decompress(raw_data)
-    inflated += decompressor.flush()
-    return inflated.decode()
+OKEX_WBITS = -zlib.MAX_WBITS        # raw deflate, 没有header
+GZIP_WBITS = 16 + zlib.MAX_WBITS    # gzip header
+
+
+class Inflater(object):
+    """
+    websocket连接的解压上下文，每个连接一个
+
+    okex/huobi的每一帧都是独立的deflate/gzip流(没有context takeover)，
+    所以不能用一个decompressobj连续解压，
+    这里用一次性的zlib.decompress(不需要创建decompressobj和flush)，
+    并记住最近的解压大小作为输出缓冲区的初始大小，大的depth帧不用多次扩容；
+    gzip也走zlib(16+MAX_WBITS)，不经过gzip.decompress的GzipFile/BytesIO
+    返回bytes，直接交给json解码，不需要再decode成str
+    """
+
+    def __init__(self, wbits: int=OKEX_WBITS, bufsize: int=zlib.DEF_BUF_SIZE):
+        self.wbits = wbits
+        self.bufsize = bufsize
+
+    def __call__(self, raw_data: bytes) -> bytes:
+        inflated = zlib.decompress(raw_data, self.wbits, self.bufsize)
+        if len(inflated) > self.bufsize:
+            self.bufsize = len(inflated)
+        return inflated
 
 
 def compress_file(input_file: Union[str, Path],
@@ -23,6 +23,22 @@ def loop_factory():
     return uvloop.EventLoopPolicy()
 
 
+@pytest.fixture(autouse=True)
+def default_event_loop(request):
+    """
+    aiohttp的loop fixture结束时会把当前event loop设为None,
+    同步测试里创建Queue/Lock需要一个当前loop
+    """
+    if 'loop' in request.fixturenames:
+        yield
+        return
+    loop = asyncio.new_event_loop()
+    asyncio.set_event_loop(loop)
+    yield
+    loop.close()
+    asyncio.set_event_loop(None)
+
+
 @pytest.fixture
 def scheduler(loop):
     yield create_scheduler(loop)
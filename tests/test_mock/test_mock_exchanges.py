@@ -0,0 +1,141 @@
+"""
+author: thomaszdxsn
+"""
+import asyncio
+import json
+
+import aiohttp
+import pytest
+
+from src.mock import BitfinexMock, HuobiMock, OkexSpotMock, PoloniexMock
+from src.mock.bitfinex import FLAG_CHECKSUM
+from src.schemas.markets import BitfinexTradeOrderbook
+from src.utils import GZIP_WBITS, Inflater, OKEX_WBITS
+
+
+@pytest.fixture
+async def connect(loop, monkeypatch):
+    """启动模拟服务并连接，返回(server, ws)"""
+    monkeypatch.delenv('http_proxy', raising=False)
+    servers = []
+    session = aiohttp.ClientSession()
+
+    async def factory(server):
+        url = await server.start()
+        servers.append(server)
+        return await session.ws_connect(url)
+
+    yield factory
+    await session.close()
+    for server in servers:
+        await server.stop()
+
+
+async def receive(ws, inflater=None, timeout=2):
+    msg = await ws.receive(timeout=timeout)
+    if inflater is not None:
+        return json.loads(inflater(msg.data))
+    return json.loads(msg.data)
+
+
+async def test_huobi_subscribe_and_heartbeat(connect):
+    server = HuobiMock(rate=50, heartbeat=0.05)
+    ws = await connect(server)
+    inflate = Inflater(GZIP_WBITS)
+    await ws.send_json({'sub': 'market.btcusdt.bad', 'id': 1})
+    assert (await receive(ws, inflate))['status'] == 'error'
+    await ws.send_json({'sub': 'market.btcusdt.trade.detail', 'id': 2})
+    ack = await receive(ws, inflate)
+    assert ack['status'] == 'ok'
+    assert ack['subbed'] == 'market.btcusdt.trade.detail'
+    kinds = set()
+    while len(kinds) < 2:
+        data = await receive(ws, inflate)
+        if 'ping' in data:
+            await ws.send_json({'pong': data['ping']})
+            kinds.add('ping')
+        else:
+            assert data['ch'] == 'market.btcusdt.trade.detail'
+            kinds.add('data')
+    await asyncio.sleep(0.01)
+    assert server.stats['pongs'] >= 1
+
+
+async def test_huobi_closes_without_pong(connect):
+    ws = await connect(HuobiMock(rate=0.001, heartbeat=0.02))
+    pings = 0
+    async for msg in ws:
+        pings += 'ping' in json.loads(Inflater(GZIP_WBITS)(msg.data))
+    assert ws.closed
+    assert pings == HuobiMock.max_missed_pongs
+
+
+async def test_okex_spot_deflate_ack(connect):
+    ws = await connect(OkexSpotMock(rate=20))
+    inflate = Inflater(OKEX_WBITS)
+    channel = 'ok_sub_spot_btc_usdt_depth_5'
+    await ws.send_json({'event': 'addChannel', 'channel': channel})
+    ack = await receive(ws, inflate)
+    assert ack == [{'channel': 'addChannel',
+                    'data': {'result': True, 'channel': channel}}]
+    data = await receive(ws, inflate)
+    assert data[0]['channel'] == channel
+    assert len(data[0]['data']['asks']) == 20
+    await ws.send_json({'event': 'ping'})
+    while True:
+        data = await receive(ws, inflate)
+        if data == {'event': 'pong'}:
+            break
+
+
+async def test_bitfinex_checksum_matches_book(connect):
+    ws = await connect(BitfinexMock(rate=200))
+    assert (await receive(ws))['event'] == 'info'
+    await ws.send_json({'event': 'conf', 'flags': FLAG_CHECKSUM})
+    assert (await receive(ws))['status'] == 'OK'
+    await ws.send_json({'event': 'subscribe', 'channel': 'book',
+                        'symbol': 'tBTCUSD'})
+    subscribed = await receive(ws)
+    chan_id = subscribed['chanId']
+    book = BitfinexTradeOrderbook('BTCUSD')
+    snapshot = await receive(ws)
+    assert snapshot[0] == chan_id
+    book.initialize(snapshot[1])
+    checked = 0
+    while checked < 5:
+        data = await receive(ws)
+        if data[1] == 'cs':
+            assert data[2] == book.checksum()
+            checked += 1
+        elif data[1] != 'hb':
+            book.update(data[1])
+
+
+async def test_bitfinex_channel_limit(connect):
+    server = BitfinexMock(rate=1)
+    server.max_channels = 1
+    ws = await connect(server)
+    await receive(ws)
+    for symbol in ('tBTCUSD', 'tETHUSD'):
+        await ws.send_json({'event': 'subscribe', 'channel': 'ticker',
+                            'symbol': symbol})
+    replies = [await receive(ws) for _ in range(2)]
+    events = [r['event'] for r in replies if isinstance(r, dict)]
+    assert events == ['subscribed', 'error']
+    assert replies[1]['code'] == 10305
+
+
+async def test_poloniex_snapshot_then_sequence(connect):
+    ws = await connect(PoloniexMock(rate=100))
+    await ws.send_json({'command': 'subscribe', 'channel': 'BTC_ETH'})
+    snapshot = await receive(ws)
+    pair_id, seq = snapshot[0], snapshot[1]
+    assert snapshot[2][0][0] == 'i'
+    assert snapshot[2][0][1]['currencyPair'] == 'BTC_ETH'
+    for _ in range(5):
+        data = await receive(ws)
+        if data == [1010]:
+            continue
+        assert data[0] == pair_id
+        assert data[1] == seq + 1
+        seq = data[1]
@@ -0,0 +1,80 @@
+"""
+author: thomaszdxsn
+"""
+import random
+from datetime import datetime, timedelta
+
+from src.latency import (LatencyHistogram, LatencyStats, bucket_bounds,
+                         bucket_index)
+from src.monitors import BinanceMonitor
+from src.schemas.items import ExchangeItem
+from src.schemas.markets.trades import BinanceTrades, OkexSpotTrades
+from src.tunnels import NullTunnel
+
+
+def test_bucket_bounds_contain_value():
+    for value in list(range(300)) + [random.randint(0, 10 ** 10)
+                                     for _ in range(1000)]:
+        low, high = bucket_bounds(bucket_index(value))
+        assert low <= value <= high
+        assert high - low <= max(1, low / 64)
+
+
+def test_histogram_percentiles():
+    hist = LatencyHistogram()
+    for ms in range(1, 1001):
+        hist.record(ms / 1000)
+    hist.record(-0.5)
+    assert hist.count == 1001
+    assert hist.negative == 1
+    assert abs(hist.percentile(50) - 0.5) < 0.5 * 0.02
+    assert abs(hist.percentile(99) - 0.99) < 0.99 * 0.02
+    assert hist.percentile(100) == hist.max == 1.0
+    other = LatencyHistogram()
+    other.record(2)
+    hist.merge(other)
+    assert hist.max == 2 and hist.count == 1002
+    summary = hist.summary()
+    assert summary['count'] == 1002 and summary['negative'] == 1
+
+
+def test_observe_receive_picks_exchange_time():
+    stats = LatencyStats()
+    created = datetime(2018, 1, 1, 0, 0, 1)
+    trades = BinanceTrades(pair='btcusdt', tid='1', price=1, amount=1,
+                           trade_time=created - timedelta(seconds=5),
+                           event_time=created - timedelta(seconds=0.25),
+                           created=created)
+    stats.observe_receive('binance', 'trades', trades)
+    hist = stats.receive[('binance', 'trades', 'btcusdt')]
+    assert hist.count == 1
+    assert abs(hist.max - 0.25) < 1e-6
+    # okex的trade_time是字符串，没有交易所时间
+    okex = OkexSpotTrades(pair='btc_usdt', tid='1', price=1, amount=1,
+                          trade_time='12:00:00')
+    stats.observe_receive('okex_spot', 'trades', okex)
+    assert ('okex_spot', 'trades', 'btc_usdt') not in stats.receive
+
+    item = ExchangeItem('binance', 'trades', trades)
+    stats.observe_write([item, item], now=created + timedelta(seconds=2))
+    assert stats.write[('binance', 'trades', 'btcusdt')].count == 2
+    records = stats.export()
+    assert [(r['key'], r['stage'], r['count']) for r in records] == [
+        ('binance|trades|btcusdt', 'receive', 1),
+        ('binance|trades|btcusdt', 'write', 2),
+    ]
+    assert records[1]['p50'] == 2000.0
+    assert stats.export() == []
+
+
+async def test_transport_records_latency(loop, scheduler):
+    monitor = BinanceMonitor(symbols=[], scheduler=scheduler,
+                             tunnel=NullTunnel(), loop=loop)
+    monitor.latency = LatencyStats()
+    now = datetime.utcnow()
+    data = [BinanceTrades(pair='ethbtc', tid=str(i), price=1, amount=1,
+                          trade_time=now, event_time=now) for i in range(3)]
+    monitor.transport('trades', data[0])
+    monitor.transport_many('trades', data[1:])
+    assert monitor.latency.receive[('binance', 'trades', 'ethbtc')].count == 3
+    assert monitor.tunnel.counts['binance|trades'] == 3
@@ -0,0 +1,133 @@
+"""
+author: thomaszdxsn
+"""
+from types import SimpleNamespace
+
+import aiohttp
+import pytest
+
+from src.metrics import (MetricsRegistry, MetricsServer, collect_tunnel,
+                         histogram_samples, metrics)
+from src.monitors import BinanceMonitor
+from src.schemas.items import ExchangeItem
+from src.schemas.markets.trades import BinanceTrades
+from src.tunnels import FanoutTunnel, NullTunnel, QueueTunnel
+
+
+def parse(text: str) -> dict:
+    """'name{labels} value' -> {'name{labels}': value}"""
+    samples = {}
+    for line in text.splitlines():
+        if line and not line.startswith('#'):
+            name, value = line.rsplit(' ', 1)
+            samples[name] = float(value)
+    return samples
+
+
+def test_counter_is_pre_bound():
+    registry = MetricsRegistry()
+    counter = registry.counter('msgs_total', 'messages', exchange='huobi')
+    assert registry.counter('msgs_total', 'messages',
+                            exchange='huobi') is counter
+    counter.inc()
+    counter.inc(2)
+    registry.counter('msgs_total', 'messages', exchange='okex_spot').inc()
+    text = registry.render()
+    assert text.count('# TYPE msgs_total counter') == 1
+    assert parse(text) == {'msgs_total{exchange="huobi"}': 3,
+                           'msgs_total{exchange="okex_spot"}': 1}
+
+
+def test_histogram_and_collectors():
+    registry = MetricsRegistry()
+
+    def collector():
+        yield from histogram_samples('batch_size', 'items', {'c': 'x'},
+                                     (1, 10), [2, 3, 1], 40)
+
+    class Owner(object):
+        def collect(self):
+            yield 'owner', 'gauge', 'owner alive', {'q': 'a"b'}, 1.5
+
+    owner = Owner()
+    registry.add_collector(collector)
+    registry.add_collector(owner.collect)
+    text = registry.render()
+    assert '# TYPE batch_size histogram' in text
+    assert parse(text) == {
+        'batch_size_bucket{c="x",le="1"}': 2,
+        'batch_size_bucket{c="x",le="10"}': 5,
+        'batch_size_bucket{c="x",le="+Inf"}': 6,
+        'batch_size_sum{c="x"}': 40,
+        'batch_size_count{c="x"}': 6,
+        'owner{q="a\\"b"}': 1.5,
+    }
+    del owner
+    assert 'owner' not in parse(registry.render())
+
+
+def test_collect_tunnel_depth_and_fanout():
+    tunnel = FanoutTunnel(QueueTunnel(policies={
+        'trades': {'maxsize': 1, 'overflow': 'drop_oldest'}
+    }))
+    trades = BinanceTrades(pair='btcusdt', tid='1', price=1, amount=1,
+                           trade_time=None)
+    for _ in range(3):
+        tunnel.put(ExchangeItem('binance', 'trades', trades))
+    tunnel.put(ExchangeItem('binance', 'ticker', trades))
+    tunnel.disconnected['slow'] += 1
+    registry = MetricsRegistry()
+    registry.add_collector(lambda: collect_tunnel(tunnel))
+    samples = parse(registry.render())
+    labels = 'exchange="binance",data_type="{}"'
+    assert samples[f'marketking_tunnel_queue_depth{{{labels.format("trades")}}}'] == 1
+    assert samples[f'marketking_tunnel_queue_depth{{{labels.format("ticker")}}}'] == 1
+    assert samples['marketking_fanout_disconnected_total{reason="slow"}'] == 1
+    overflow = (f'marketking_tunnel_overflow_total{{'
+                f'{labels.format("trades")},event="dropped"}}')
+    assert samples[overflow] == 2
+
+
+async def test_metrics_endpoint(loop, scheduler, aiohttp_unused_port,
+                                monkeypatch):
+    monkeypatch.delenv('http_proxy', raising=False)
+    monitor = BinanceMonitor(symbols=[], scheduler=scheduler,
+                             tunnel=NullTunnel(), loop=loop)
+    jobs = []
+    monkeypatch.setattr(monitor, '_run_later',
+                        lambda coro, args=None, **kwargs: jobs.append(args))
+
+    async def dispatch(msg):
+        data = monitor.ws_sdk.decode(msg.data)
+        if 'price' in data:
+            float(data['price'])
+
+    monitor.run_ws_in_background(dispatch)
+    handle = jobs[0][0]
+    await handle(SimpleNamespace(data='{}'))
+    with pytest.raises(ValueError):
+        await handle(SimpleNamespace(data='{'))
+    # 解码之后handler里的ValueError不算解码失败
+    with pytest.raises(ValueError):
+        await handle(SimpleNamespace(data='{"price": "-"}'))
+
+    port = aiohttp_unused_port()
+    server = MetricsServer(metrics, f'127.0.0.1:{port}', lag_interval=0.01)
+    await server.start()
+    try:
+        async with aiohttp.ClientSession() as session:
+            resp = await session.get(f'http://127.0.0.1:{port}/metrics')
+            assert resp.status == 200
+            assert resp.headers['Content-Type'].startswith('text/plain')
+            samples = parse(await resp.text())
+    finally:
+        await server.stop()
+    exchange = '{exchange="binance"}'
+    shard = '{exchange="binance",shard="0"}'
+    assert samples[f'marketking_ws_messages_total{exchange}'] == 3
+    assert samples[f'marketking_ws_handler_errors_total{exchange}'] == 2
+    assert samples[f'marketking_ws_decode_errors_total{shard}'] == 1
+    assert samples[f'marketking_orderbooks{exchange}'] == 0
+    assert 'marketking_ws_reconnects_total{exchange="binance",shard="0"}' \
+        in samples
+    assert 'marketking_event_loop_lag_seconds' in samples
@@ -0,0 +1,65 @@
+"""
+author: thomaszdxsn
+"""
+import json
+from types import SimpleNamespace
+
+from src.monitors import BinanceMonitor, BitmexMonitor, OkexFutureMonitor
+from src.tunnels.queues import QueueTunnel
+
+
+def create_monitor(monitor_class, scheduler, loop):
+    return monitor_class(symbols=[], scheduler=scheduler,
+                         tunnel=QueueTunnel(), loop=loop)
+
+
+def count_parse(monitor, monkeypatch) -> list:
+    channels = []
+    parse_route = monitor._parse_route
+
+    def counting(channel):
+        channels.append(channel)
+        return parse_route(channel)
+
+    monkeypatch.setattr(monitor, '_parse_route', counting)
+    return channels
+
+
+async def test_route_is_cached(loop, scheduler, monkeypatch):
+    monitor = create_monitor(BinanceMonitor, scheduler, loop)
+    parsed = count_parse(monitor, monkeypatch)
+    handled = []
+
+    async def handle_trade(data, pair):
+        handled.append((data['data']['t'], pair))
+
+    monitor._handle_trade = handle_trade
+    for tid in range(3):
+        msg = SimpleNamespace(data=json.dumps({'stream': 'btcusdt@trade',
+                                               'data': {'t': tid}}))
+        await monitor.dispatch_ws_msg(msg)
+    assert handled == [(0, 'btcusdt'), (1, 'btcusdt'), (2, 'btcusdt')]
+    assert parsed == ['btcusdt@trade']
+    assert monitor.route('btcusdt@trade') == (handle_trade, 'btcusdt', ())
+
+
+async def test_route_extra_and_unknown_channel(loop, scheduler):
+    monitor = create_monitor(OkexFutureMonitor, scheduler, loop)
+    handler, symbol, extra = monitor.route(
+        'ok_sub_futureusd_btc_depth_this_week_20'
+    )
+    assert (handler, symbol, extra) == (monitor._handle_depth, 'btc',
+                                        ('this_week',))
+    assert monitor.route('not_a_channel') is None
+    assert 'not_a_channel' in monitor._routes
+
+
+async def test_route_cache_size(loop, scheduler, monkeypatch):
+    monitor = create_monitor(BitmexMonitor, scheduler, loop)
+    monitor._route_cache_size = 1
+    parsed = count_parse(monitor, monkeypatch)
+    for _ in range(2):
+        assert monitor.route('trade')[0] == monitor._handle_trade
+        assert monitor.route('orderBookL2')[0] == monitor._handle_orderbook_l2
+    assert parsed == ['trade', 'orderBookL2', 'orderBookL2']
+    await monitor.dispatch_ws_msg(SimpleNamespace(data='{"info": "Welcome"}'))
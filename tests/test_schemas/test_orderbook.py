@@ -0,0 +1,288 @@
+"""
+author: thomaszdxsn
+"""
+import zlib
+
+import pytest
+
+from src.schemas.markets import (BitfinexTradeOrderbook,
+                                 BitfinexFundingOrderbook,
+                                 HitBTCOrderbook, PoloniexOrderbook,
+                                 BinanceOrderbook, BitmexOrderbook)
+from src.schemas.markets import depth as depth_module
+from src.schemas.markets._orderbook import js_number_str
+from src.schemas.markets._sorted_book import SortedBook, to_ticks
+
+
+@pytest.fixture(autouse=True)
+def dict_levels(monkeypatch):
+    monkeypatch.setattr(depth_module, 'DEPTH_LEVEL_FORMAT', 'dict')
+
+
+def test_sorted_book_keeps_order():
+    asks, bids = SortedBook(), SortedBook(descending=True)
+    for price in (3.0, 1.0, 2.0, 5.0, 4.0):
+        asks[price] = price
+        bids[price] = price
+    asks.pop(1.0)
+    bids.pop(5.0)
+    bids.pop(100.0)                     # missing level is ignored
+    assert [p for p, _ in asks.top(2)] == [2.0, 3.0]
+    assert [p for p, _ in bids.top(10)] == [4.0, 3.0, 2.0, 1.0]
+    assert len(asks) == 4 and 1.0 not in asks
+
+
+def test_bitfinex_trade_orderbook():
+    orderbook = BitfinexTradeOrderbook('tBTCUSD')
+    orderbook.initialize([
+        [6094, 1, 0.2], [6095, 2, 1.5], [6097, 1, -0.3], [6096, 3, -2.0]
+    ])
+    orderbook.update([6095, 0, 1])      # remove bid
+    orderbook.update([6098, 1, -1.0])
+    depth = orderbook.snapshot()
+    assert [i['price'] for i in depth.bids] == [6094]
+    assert [i['price'] for i in depth.asks] == [6096, 6097, 6098]
+    assert depth.asks[0] == {'price': 6096, 'count': 3, 'amount': -2.0}
+
+
+def test_bitfinex_funding_orderbook():
+    orderbook = BitfinexFundingOrderbook('fUSD')
+    orderbook.initialize([
+        [0.0002, 30, 1, -100], [0.0003, 2, 1, -50], [0.0001, 2, 2, 300]
+    ])
+    depth = orderbook.snapshot()
+    assert [i['rate'] for i in depth.bids] == [0.0003, 0.0002]
+    assert depth.asks == [
+        {'rate': 0.0001, 'count': 2, 'amount': 300, 'period': 2}
+    ]
+
+
+def test_hitbtc_orderbook():
+    orderbook = HitBTCOrderbook('BTCUSD')
+    orderbook.initialize({'params': {
+        'ask': [{'price': '6400.10', 'size': '1.2'},
+                {'price': '6399.90', 'size': '0.5'}],
+        'bid': [{'price': '6398.00', 'size': '2'},
+                {'price': '6398.50', 'size': '3'}]
+    }})
+    orderbook.update({'params': {
+        'ask': [{'price': '6399.90', 'size': '0.00'}],
+        'bid': [{'price': '6399.00', 'size': '0.1'}]
+    }})
+    depth = orderbook.snapshot()
+    assert depth.asks == [{'price': 6400.1, 'amount': 1.2}]
+    assert [i['price'] for i in depth.bids] == [6399.0, 6398.5, 6398.0]
+
+
+def test_poloniex_orderbook():
+    orderbook = PoloniexOrderbook('BTC_ETH')
+    orderbook.initialize([
+        {'0.07000000': '1.0', '0.06990000': '2.0'},
+        {'0.06900000': '3.0', '0.06950000': '4.0'}
+    ])
+    orderbook.update(['o', 0, '0.06990000', '0.00000000'])
+    orderbook.update(['o', 1, '0.06960000', '5.0'])
+    depth = orderbook.snapshot()
+    assert depth.asks == [{'price': 0.07, 'amount': 1.0}]
+    assert [i['price'] for i in depth.bids] == [0.0696, 0.0695, 0.069]
+
+
+def test_snapshot_if_changed_skips_invisible_updates(monkeypatch):
+    from src.schemas.markets import _orderbook
+    monkeypatch.setattr(_orderbook, 'ORDERBOOK_LEVEL', 2)
+    orderbook = BitfinexTradeOrderbook('tEOSGBP')
+    orderbook.initialize([
+        [10, 1, 1.0], [9, 1, 1.0], [8, 1, 1.0],
+        [11, 1, -1.0], [12, 1, -1.0], [13, 1, -1.0]
+    ])
+    assert orderbook.snapshot_if_changed() is not None
+    assert orderbook.snapshot_if_changed() is None
+
+    orderbook.update([8, 2, 3.0])       # third bid level is not visible
+    orderbook.update([13, 0, -1])
+    orderbook.update([20, 0, -1])       # unknown level
+    assert orderbook.snapshot_if_changed() is None
+    assert orderbook.suppressed_snapshots == 2
+
+    orderbook.update([12, 0, -1])       # second ask level removed
+    depth = orderbook.snapshot_if_changed()
+    assert [i['price'] for i in depth.asks] == [11]
+
+    orderbook.update([9.5, 1, 1.0])     # new level inside the top
+    assert orderbook.snapshot_if_changed() is not None
+
+
+@pytest.mark.parametrize('raw,precision,result', [
+    ('0.00001823', 8, 1823),
+    ('6400.1', 2, 640010),
+    ('12', 3, 12000),
+    ('0.10000000000', 2, 10),
+    ('-0.5', 1, -5),
+])
+def test_to_ticks(raw, precision, result):
+    assert to_ticks(raw, precision) == result
+
+
+def test_to_ticks_rejects_lossy_precision():
+    with pytest.raises(ValueError):
+        to_ticks('0.123', 2)
+
+
+def test_fixed_point_orderbook_merges_equal_prices():
+    orderbook = PoloniexOrderbook('BTC_ETH')
+    orderbook.initialize([{'0.0700': '1.0'}, {}])
+    orderbook.update(['o', 0, '0.07000000', '2.5'])
+    assert orderbook.snapshot().asks == [{'price': 0.07, 'amount': 2.5}]
+
+
+def _binance_event(first_id, last_id, bids=(), asks=()):
+    return {'e': 'depthUpdate', 'E': 0, 's': 'BNBBTC',
+            'U': first_id, 'u': last_id, 'b': list(bids), 'a': list(asks)}
+
+
+def test_binance_orderbook_applies_diff_events_in_sequence():
+    orderbook = BinanceOrderbook('bnbbtc')
+    orderbook.initialize({
+        'lastUpdateId': 100,
+        'bids': [['0.00150000', '10.00000000', []]],
+        'asks': [['0.00160000', '5.00000000', []]]
+    })
+    # already contained in the REST snapshot
+    orderbook.update(_binance_event(95, 100, bids=[['0.00150000', '0', []]]))
+    # overlapping first event
+    orderbook.update(_binance_event(99, 102, asks=[['0.00155000', '1', []]]))
+    orderbook.update(_binance_event(103, 103, bids=[['0.00150000', '0', []]]))
+    depth = orderbook.snapshot()
+    assert not orderbook.stale
+    assert depth.last_update_id == 103
+    assert depth.bids == []
+    assert [i['price'] for i in depth.asks] == [0.00155, 0.0016]
+
+
+def test_binance_orderbook_marks_gap_as_stale():
+    orderbook = BinanceOrderbook('bnbbtc')
+    orderbook.initialize({'lastUpdateId': 100, 'bids': [], 'asks': []})
+    orderbook.update(_binance_event(105, 110, bids=[['0.0015', '1', []]]))
+    assert orderbook.stale
+    assert orderbook.last_update_id == 100
+    assert orderbook.snapshot().bids == []
+
+
+def test_bitmex_orderbook_l2_actions():
+    orderbook = BitmexOrderbook('XBTUSD')
+    orderbook.initialize([
+        {'symbol': 'XBTUSD', 'id': 1, 'side': 'Sell', 'size': 10,
+         'price': 6401.5},
+        {'symbol': 'XBTUSD', 'id': 2, 'side': 'Sell', 'size': 20,
+         'price': 6401.0},
+        {'symbol': 'XBTUSD', 'id': 3, 'side': 'Buy', 'size': 30,
+         'price': 6400.5},
+    ])
+    orderbook.update({'action': 'update', 'data': [
+        {'symbol': 'XBTUSD', 'id': 2, 'side': 'Sell', 'size': 25}
+    ]})
+    orderbook.update({'action': 'insert', 'data': [
+        {'symbol': 'XBTUSD', 'id': 4, 'side': 'Buy', 'size': 5,
+         'price': 6400.0}
+    ]})
+    orderbook.update({'action': 'delete', 'data': [
+        {'symbol': 'XBTUSD', 'id': 1, 'side': 'Sell'},
+        {'symbol': 'XBTUSD', 'id': 99, 'side': 'Sell'}
+    ]})
+    depth = orderbook.snapshot()
+    assert depth.asks == [{'price': 6401.0, 'amount': 25}]
+    assert depth.bids == [{'price': 6400.5, 'amount': 30},
+                          {'price': 6400.0, 'amount': 5}]
+
+
+def test_check_sequence_marks_gap_as_stale():
+    orderbook = PoloniexOrderbook('BTC_ETH')
+    orderbook.sequence = 10
+    assert orderbook.check_sequence(11)
+    assert not orderbook.check_sequence(11)     # duplicated
+    assert not orderbook.stale
+    assert not orderbook.check_sequence(13)
+    assert orderbook.stale
+    assert not orderbook.check_sequence(14)
+    assert orderbook.sequence == 11
+
+
+def test_poloniex_orderbook_initialize_from_rest():
+    orderbook = PoloniexOrderbook('BTC_ETH')
+    orderbook.initialize_rest({
+        'asks': [['0.07000000', 1.5]],
+        'bids': [['0.06900000', 2]],
+        'isFrozen': '0',
+        'seq': 42
+    })
+    assert orderbook.sequence == 42
+    assert orderbook.snapshot().asks == [{'price': 0.07, 'amount': 1.5}]
+
+
+def test_poloniex_truncated_rest_snapshot_drops_updates_out_of_range():
+    orderbook = PoloniexOrderbook('BTC_ETH')
+    orderbook.initialize_rest({
+        'asks': [['0.07000000', 1], ['0.07100000', 1]],
+        'bids': [['0.06900000', 1]],
+        'seq': 1
+    }, depth=2)
+    assert orderbook.bid_bound is None          # bids没有截断
+    orderbook.update(['o', 0, '0.07200000', '3'])   # 超出asks范围
+    orderbook.update(['o', 0, '0.07050000', '2'])
+    orderbook.update(['o', 1, '0.05000000', '4'])
+    assert [level['price'] for level in orderbook.snapshot().asks] == \
+        [0.07, 0.0705, 0.071]
+    assert [level['price'] for level in orderbook.snapshot().bids] == \
+        [0.069, 0.05]
+
+
+@pytest.mark.parametrize('value,result', [
+    (6094, '6094'),
+    (0.210617, '0.210617'),
+    (-0.00001, '-0.00001'),
+    (1.5e-07, '1.5e-7'),
+    (1e+22, '1e+22'),
+])
+def test_js_number_str(value, result):
+    assert js_number_str(value) == result
+
+
+def test_bitfinex_checksum():
+    orderbook = BitfinexTradeOrderbook('tBTCUSD')
+    orderbook.initialize([
+        [6000, 1, 0.5], [5999, 2, 1], [6001, 1, -0.25]
+    ])
+    payload = b'6000:0.5:6001:-0.25:5999:1'
+    crc = zlib.crc32(payload)
+    expected = crc - (1 << 32) if crc >= (1 << 31) else crc
+    assert orderbook.checksum() == expected
+    assert orderbook.verify_checksum(expected)
+    assert not orderbook.verify_checksum(expected + 1)
+    assert orderbook.stale
+
+
+def test_packed_depth_levels(monkeypatch):
+    monkeypatch.setattr(depth_module, 'DEPTH_LEVEL_FORMAT', 'packed')
+    orderbook = PoloniexOrderbook('BTC_ETH')
+    orderbook.initialize([
+        {'0.07000000': '1.0', '0.07100000': '2.5'},
+        {'0.06900000': '3.0'}
+    ])
+    depth = orderbook.snapshot()
+    assert depth.asks == [[0.07, 1.0], [0.071, 2.5]]
+    assert depth.bids == [[0.069, 3.0]]
+
+    orderbook = BitfinexTradeOrderbook('tBTCUSD')
+    orderbook.initialize([[6094, 1, 0.2], [6096, 3, -2.0]])
+    depth = orderbook.snapshot()
+    assert depth.asks == [[6096, 3, -2.0]]
+    assert depth.level_fields == ('price', 'count', 'amount')
+
+
+def test_format_levels(monkeypatch):
+    levels = [(1.0, 2.0), (3.0, 4.0)]
+    assert depth_module.format_levels(levels) == [
+        {'price': 1.0, 'amount': 2.0}, {'price': 3.0, 'amount': 4.0}
+    ]
+    monkeypatch.setattr(depth_module, 'DEPTH_LEVEL_FORMAT', 'packed')
+    assert depth_module.format_levels(iter(levels)) == [[1.0, 2.0], [3.0, 4.0]]
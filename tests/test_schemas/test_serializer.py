@@ -0,0 +1,64 @@
+"""
+author: thomaszdxsn
+"""
+import dataclasses
+from collections import OrderedDict
+from datetime import datetime
+
+import pytest
+
+from src.schemas import markets, Params
+from src.schemas.sdk import ResponseMsg
+
+SAMPLE_VALUES = {
+    str: 'btc_usdt',
+    int: 1,
+    float: 1.5,
+    bool: True,
+    datetime: datetime(2018, 8, 1),
+}
+
+MARKET_SCHEMAS = [
+    obj for name, obj in vars(markets).items()
+    if isinstance(obj, type) and dataclasses.is_dataclass(obj)
+]
+
+
+def make_sample(cls):
+    kwargs = {}
+    for f in dataclasses.fields(cls):
+        if f.type is list:
+            kwargs[f.name] = [{'price': 1.0, 'amount': 2.0}, [3.0, 4.0]]
+        else:
+            kwargs[f.name] = SAMPLE_VALUES.get(f.type)
+    return cls(**kwargs)
+
+
+@pytest.mark.parametrize('cls', MARKET_SCHEMAS, ids=lambda c: c.__name__)
+def test_to_dict_matches_asdict(cls):
+    item = make_sample(cls)
+    assert item.to_dict() == dataclasses.asdict(item)
+
+
+def test_to_dict_shares_list_fields():
+    depth = make_sample(markets.PoloniexDepth)
+    result = depth.to_dict()
+    assert result['asks'] is depth.asks
+    assert result is not depth.to_dict()
+
+
+def test_to_dict_converts_nested_dataclass():
+    depth = make_sample(markets.PoloniexDepth)
+    response = ResponseMsg(data=[depth, {'depth': depth}, 1])
+    assert response.to_dict() == dataclasses.asdict(response)
+    params = Params(args=(1, depth), kwargs={'a': 1})
+    result = params.to_dict()
+    assert result == dataclasses.asdict(params)
+    assert result['kwargs'] is params.kwargs
+
+
+def test_to_dict_with_dict_factory():
+    ticker = make_sample(markets.PoloniexTicker)
+    result = ticker.to_dict(dict_factory=OrderedDict)
+    assert isinstance(result, OrderedDict)
+    assert list(result) == [f.name for f in dataclasses.fields(ticker)]
@@ -0,0 +1,26 @@
+"""
+author: thomaszdxsn
+"""
+import json
+
+import pytest
+
+from src.sdk import decoder
+
+
+def test_get_decoder_by_name():
+    assert decoder.get_decoder('json') is decoder.json_loads
+    with pytest.raises(ValueError):
+        decoder.get_decoder('simplejson')
+
+
+def test_get_decoder_fallback_when_not_installed(monkeypatch):
+    monkeypatch.setitem(decoder.DECODERS, 'orjson', 'not_installed_orjson')
+    assert decoder.get_decoder('orjson') is decoder.json_loads
+    assert decoder.get_decoder('auto') is decoder.json_loads
+    assert decoder.get_decoder() is decoder.json_loads
+
+
+def test_loads_accepts_str_and_bytes():
+    raw = '{"ch": "market.btcusdt.depth.step0", "tick": {"bids": [[1.5, 2]]}}'
+    assert decoder.loads(raw) == decoder.loads(raw.encode()) == json.loads(raw)
@@ -0,0 +1,33 @@
+"""
+author: thomaszdxsn
+"""
+import gzip
+import json
+import zlib
+
+from src.sdk import HuobiWebsocket, OkexSpotWebsocket, BinanceWebsocket
+from src.utils import Inflater, OKEX_WBITS
+
+PAYLOAD = json.dumps({'ch': 'market.btcusdt.depth.step0',
+                      'tick': {'bids': [[6000.0 - i, 0.1] for i in range(500)]}})
+
+
+def _deflate(data: bytes) -> bytes:
+    compressor = zlib.compressobj(wbits=-zlib.MAX_WBITS)
+    return compressor.compress(data) + compressor.flush()
+
+
+def test_inflater_returns_bytes_and_grows_buffer():
+    inflater = Inflater(OKEX_WBITS, bufsize=64)
+    for _ in range(3):
+        # 每一帧都是独立的deflate流
+        assert inflater(_deflate(PAYLOAD.encode())) == PAYLOAD.encode()
+    assert inflater.bufsize == len(PAYLOAD)
+
+
+def test_sdk_inflate(loop):
+    okex = OkexSpotWebsocket(loop)
+    assert okex.inflate(_deflate(PAYLOAD.encode())) == PAYLOAD.encode()
+    huobi = HuobiWebsocket(loop)
+    assert huobi.inflate(gzip.compress(PAYLOAD.encode())) == PAYLOAD.encode()
+    assert BinanceWebsocket(loop).inflater is None
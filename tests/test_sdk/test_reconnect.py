@@ -0,0 +1,169 @@
+"""
+author: thomaszdxsn
+"""
+import asyncio
+import json
+import time
+
+import pytest
+from aiohttp import web, WSMsgType
+
+from src.sdk import WebsocketSdkAbstract
+from src.sdk.bitmex import BitmexWebsocket
+from src.sdk.coinbase_pro import CoinbaseProWebsocket
+
+
+class AckWebsocket(WebsocketSdkAbstract):
+    _ws_reconnect_interval = 0.01
+    _ws_reconnect_max_interval = 0.04
+    _ws_ack_timeout = 0.05
+    ws_url = None
+
+    def channel_id(self, channel_info: dict):
+        return channel_info.get('sub')
+
+
+class FlakyWebsocket(AckWebsocket):
+    """前fail_subscribes次subscribe抛出异常"""
+    fail_subscribes = 0
+
+    async def subscribe(self, *args, **kwargs):
+        if self.fail_subscribes:
+            self.fail_subscribes -= 1
+            raise ConnectionResetError('subscribe failed')
+        await super().subscribe(*args, **kwargs)
+
+
+@pytest.fixture
+async def ack_server(aiohttp_server, monkeypatch):
+    """
+    奇数channel第一次订阅不回复确认(模拟被限流)，之后的订阅正常确认
+    每个连接收到的消息记录在server.connections
+    """
+    monkeypatch.delenv('http_proxy', raising=False)
+    connections = []
+    seen = set()
+
+    async def handler(request):
+        ws = web.WebSocketResponse()
+        await ws.prepare(request)
+        received = []
+        connections.append({'received': received, 'ws': ws})
+        async for msg in ws:
+            if msg.type != WSMsgType.TEXT:
+                continue
+            sub = json.loads(msg.data)['sub']
+            received.append(sub)
+            if sub % 2 == 0 or sub in seen:
+                await ws.send_json({'subbed': sub})
+            seen.add(sub)
+        return ws
+
+    app = web.Application()
+    app.router.add_get('/ws', handler)
+    server = await aiohttp_server(app)
+    AckWebsocket.ws_url = str(server.make_url('/ws'))
+    server.connections = connections
+    yield server
+
+
+def test_reconnect_delay_grows_with_jitter():
+    sdk = AckWebsocket()
+    sdk._ws_reconnect_interval = 1
+    sdk._ws_reconnect_max_interval = 30
+    for attempt, expected in ((0, 1), (1, 2), (3, 8), (10, 30), (100, 30)):
+        delays = [sdk.reconnect_delay(attempt) for _ in range(50)]
+        assert all(expected / 2 <= d <= expected for d in delays)
+        assert len(set(delays)) > 1
+
+
+async def test_subscribe_paced_and_only_unacked_resent(loop, ack_server):
+    sdk = AckWebsocket(loop)
+    sdk.subscribe_rate = 100
+    for i in range(6):
+        sdk.register_channel({'sub': i})
+
+    async def handler(msg):
+        sdk.ack(json.loads(msg.data)['subbed'])
+
+    start = time.monotonic()
+    await sdk.subscribe()
+    assert time.monotonic() - start >= 0.05         # 6条，每条间隔0.01s
+    reader = asyncio.ensure_future(sdk.connect(handler))
+    await asyncio.sleep(0.2)
+    received, = [c['received'] for c in ack_server.connections]
+    assert received == [0, 1, 2, 3, 4, 5, 1, 3, 5]
+    assert sdk.unacked_channels() == []
+    assert sdk.connection_stats.unacked == 0
+    reader.cancel()
+    await sdk.ws_client.close()
+
+
+async def test_keep_connect_records_downtime(loop, ack_server):
+    sdk = AckWebsocket(loop)
+    sdk.register_channel({'sub': 0})
+    messages = []
+
+    async def handler(msg):
+        messages.append(msg.data)
+
+    await sdk.subscribe()
+    task = asyncio.ensure_future(sdk.keep_connect(handler))
+    while not messages:
+        await asyncio.sleep(0.01)
+    await ack_server.connections[0]['ws'].close()
+    while sdk.connection_stats.reconnects < 1:
+        await asyncio.sleep(0.01)
+    stats = sdk.connection_stats
+    assert 0 < stats.downtime_last < 1
+    assert stats.histogram()['1'] == 1
+    while len(ack_server.connections) < 2 or \
+            not ack_server.connections[1]['received']:
+        await asyncio.sleep(0.01)
+    assert len(ack_server.connections) == 2
+    assert ack_server.connections[1]['received'] == [0]
+    task.cancel()
+    await sdk.ws_client.close()
+
+
+async def test_keep_connect_survives_subscribe_error(loop, ack_server):
+    FlakyWebsocket.ws_url = AckWebsocket.ws_url
+    sdk = FlakyWebsocket(loop)
+    sdk.register_channel({'sub': 0})
+    messages = []
+
+    async def handler(msg):
+        messages.append(msg.data)
+
+    await sdk.subscribe()
+    task = asyncio.ensure_future(sdk.keep_connect(handler))
+    while not messages:
+        await asyncio.sleep(0.01)
+    sdk.fail_subscribes = 2
+    await ack_server.connections[0]['ws'].close()
+    while sdk.connection_stats.reconnects < 1:
+        assert not task.done()
+        await asyncio.sleep(0.01)
+    assert sdk.fail_subscribes == 0
+    while len(ack_server.connections) < 2 or \
+            not ack_server.connections[1]['received']:
+        await asyncio.sleep(0.01)
+    assert ack_server.connections[1]['received'] == [0]
+    task.cancel()
+    await sdk.ws_client.close()
+
+
+def test_subscribe_msgs_batch_channels(loop):
+    bitmex = BitmexWebsocket(loop)
+    channels = [f'trade:XBT{i}' for i in range(25)]
+    msgs = bitmex.build_subscribe_msgs(channels)
+    assert [len(msg['args']) for msg in msgs] == [10, 10, 5]
+    assert msgs[0] == {'op': 'subscribe', 'args': channels[:10]}
+    assert bitmex.subscribe_rate == 1.0
+
+    coinbase = CoinbaseProWebsocket(loop)
+    channels = [{'name': 'ticker', 'product_ids': ['BTC-USD']},
+                {'name': 'level2', 'product_ids': ['BTC-USD']}]
+    assert coinbase.build_subscribe_msgs(channels) == [
+        {'type': 'subscribe', 'channels': channels}
+    ]
@@ -0,0 +1,113 @@
+"""
+author: thomaszdxsn
+"""
+import asyncio
+import gzip
+import os
+import time
+
+from aiohttp import web, WSMessage, WSMsgType
+
+from src.monitors.huobi import HuobiMonitor
+from src.sdk import WebsocketSdkAbstract
+from src.sdk.hitbtc import HitBTCWebsocket
+from src.sdk.recorder import FrameRecorder, read_frames, replay
+from src.tunnels import NullTunnel
+
+
+class EchoWebsocket(WebsocketSdkAbstract):
+    ws_url = None
+
+
+def test_record_and_read(tmpdir):
+    recorder = FrameRecorder(str(tmpdir), 'okex_spot')
+    recorder.write(WSMessage(WSMsgType.TEXT, '{"a": "中文"}', None))
+    recorder.write(WSMessage(WSMsgType.PING, b'', None))
+    recorder.write(WSMessage(WSMsgType.BINARY, b'\x00\x01', None))
+    recorder.close()
+    assert os.path.basename(recorder.path).startswith('okex_spot-')
+    frames = list(read_frames(recorder.path))
+    assert [(f.type, f.data) for f in frames] == [
+        (WSMsgType.TEXT, '{"a": "中文"}'),
+        (WSMsgType.BINARY, b'\x00\x01'),
+    ]
+    assert frames[0].received <= frames[1].received <= time.time()
+
+
+def test_read_truncated_file(tmpdir):
+    recorder = FrameRecorder(str(tmpdir), 'huobi')
+    for i in range(3):
+        recorder.write(WSMessage(WSMsgType.TEXT, str(i) * 100, None))
+    recorder.close()
+    with gzip.open(recorder.path, 'rb') as f:
+        raw = f.read()
+    with gzip.open(recorder.path, 'wb') as f:
+        f.write(raw[:-10])      # 最后一条不完整
+    assert [f.data[0] for f in read_frames(recorder.path)] == ['0', '1']
+
+
+async def test_replay_speed(loop, tmpdir):
+    recorder = FrameRecorder(str(tmpdir), 'binance')
+    for i in range(3):
+        recorder.write(WSMessage(WSMsgType.TEXT, str(i), None))
+        time.sleep(0.05)
+    recorder.close()
+    received = []
+
+    async def handler(msg):
+        received.append(msg.data)
+        if msg.data == '1':
+            raise ValueError(msg.data)
+
+    frames = list(read_frames(recorder.path))
+    stats = await replay(frames, handler, speed=0)
+    assert received == ['0', '1', '2']
+    assert stats['frames'] == 3 and stats['errors'] == 1
+    assert stats['seconds'] < 0.05
+    stats = await replay(frames, handler, speed=2)
+    assert 0.045 <= stats['seconds'] < 0.1
+
+
+async def test_connect_records_frames(loop, aiohttp_server, monkeypatch,
+                                      tmpdir):
+    monkeypatch.delenv('http_proxy', raising=False)
+
+    async def handler(request):
+        ws = web.WebSocketResponse()
+        await ws.prepare(request)
+        await ws.send_str('hello')
+        await ws.send_bytes(b'world')
+        await ws.close()
+        return ws
+
+    app = web.Application()
+    app.router.add_get('/ws', handler)
+    server = await aiohttp_server(app)
+    EchoWebsocket.ws_url = str(server.make_url('/ws'))
+    sdk = EchoWebsocket(loop)
+    sdk.recorder = FrameRecorder(str(tmpdir), 'echo')
+    await sdk.setup_ws_client()
+    received = []
+
+    async def on_msg(msg):
+        received.append(msg.data)
+
+    await asyncio.wait_for(sdk.connect(on_msg), 1)
+    sdk.recorder.close()
+    await sdk.ws_client.close()
+    assert received == ['hello', b'world']
+    assert [f.data for f in read_frames(sdk.recorder.path)] == received
+
+
+async def test_replay_without_connection(loop, scheduler, tmpdir):
+    recorder = FrameRecorder(str(tmpdir), 'huobi')
+    recorder.write(WSMessage(WSMsgType.BINARY,
+                             gzip.compress(b'{"ping": 1}'), None))
+    recorder.close()
+    monitor = HuobiMonitor(symbols=[], scheduler=scheduler,
+                           tunnel=NullTunnel(), loop=loop)
+    stats = await replay(read_frames(recorder.path),
+                         monitor.dispatch_ws_msg, speed=0)
+    assert stats['frames'] == 1 and stats['errors'] == 0
+    # 重连期间的resync不发送，等_resubscribe重新订阅
+    await HitBTCWebsocket(loop).resubscribe_depth('ETHBTC')
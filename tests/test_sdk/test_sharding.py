@@ -0,0 +1,100 @@
+"""
+author: thomaszdxsn
+"""
+import asyncio
+import itertools
+import json
+
+import pytest
+from aiohttp import web, WSMsgType
+
+from src.sdk import WebsocketSdkAbstract
+from src.sdk.sharding import ShardedWebsocket, split_hub
+
+
+class EchoWebsocket(WebsocketSdkAbstract):
+    _ws_reconnect_interval = 0.01
+    ws_url = None
+
+
+@pytest.fixture
+async def echo_server(aiohttp_server, monkeypatch):
+    """每个连接收到的订阅消息原样返回，并带上连接序号"""
+    monkeypatch.delenv('http_proxy', raising=False)
+    connections = []
+    conn_ids = itertools.count()
+
+    async def handler(request):
+        ws = web.WebSocketResponse()
+        await ws.prepare(request)
+        conn = {'id': next(conn_ids), 'received': [], 'ws': ws}
+        connections.append(conn)
+        async for msg in ws:
+            if msg.type == WSMsgType.TEXT:
+                data = json.loads(msg.data)
+                conn['received'].append(data)
+                await ws.send_json({'conn': conn['id'], 'echo': data})
+        return ws
+
+    app = web.Application()
+    app.router.add_get('/ws', handler)
+    server = await aiohttp_server(app)
+    EchoWebsocket.ws_url = str(server.make_url('/ws'))
+    server.connections = connections
+    yield server
+
+
+def test_split_hub():
+    assert split_hub(list(range(10)), 3) == [[0, 1, 2, 3], [4, 5, 6], [7, 8, 9]]
+    assert split_hub([1, 2], 5) == [[1], [2]]
+    assert split_hub([], 3) == [[]]
+
+
+async def test_channels_spread_over_connections(loop, echo_server):
+    sdk = ShardedWebsocket(EchoWebsocket, 3, loop)
+    sdk.register_connection_channel({'event': 'conf'})
+    for i in range(9):
+        sdk.register_channel({'sub': i})
+    await sdk.subscribe()
+    await asyncio.sleep(0.1)
+    received = sorted((c['received'] for c in echo_server.connections),
+                      key=lambda r: r[1]['sub'])
+    assert received == [
+        [{'event': 'conf'}, {'sub': 0}, {'sub': 1}, {'sub': 2}],
+        [{'event': 'conf'}, {'sub': 3}, {'sub': 4}, {'sub': 5}],
+        [{'event': 'conf'}, {'sub': 6}, {'sub': 7}, {'sub': 8}],
+    ]
+    assert sdk.ws_client_for({'sub': 4}) is sdk.shards[1].ws_client
+    for shard in sdk.shards:
+        await shard.ws_client.close()
+
+
+async def test_handler_sees_its_own_shard(loop, echo_server):
+    sdk = ShardedWebsocket(EchoWebsocket, 2, loop)
+    for i in range(4):
+        sdk.register_channel({'sub': i})
+    seen = []
+
+    async def handler(msg):
+        data = json.loads(msg.data)
+        index = sdk.current_shard_index()
+        assert sdk.ws_client is sdk.shards[index].ws_client
+        seen.append((index, data['echo']['sub']))
+
+    await sdk.subscribe()
+    task = asyncio.ensure_future(sdk.keep_connect(handler))
+    while len(seen) < 4:
+        await asyncio.sleep(0.01)
+    assert sorted(seen) == [(0, 0), (0, 1), (1, 2), (1, 3)]
+
+    # 断开一个分片，只有这个分片重连并重新订阅
+    shard1_conn = next(c for c in echo_server.connections
+                       if c['received'][0] == {'sub': 2})
+    await shard1_conn['ws'].close()
+    while len(seen) < 6:
+        await asyncio.sleep(0.01)
+    assert sorted(seen[4:]) == [(1, 2), (1, 3)]
+    assert len(echo_server.connections) == 3
+    task.cancel()
+    for shard in sdk.shards:
+        await shard.ws_client.close()
@@ -0,0 +1,92 @@
+"""
+author: thomaszdxsn
+"""
+import asyncio
+import time
+from datetime import datetime
+
+from src.schemas.items import ExchangeItem
+from src.schemas.markets import PoloniexTrades
+from src.storage import batching
+from src.storage.batching import BatchPolicy, BatchStats, fetch_batch
+from src.tunnels.queues import QueueTunnel
+
+
+def make_item():
+    trades = PoloniexTrades(pair='BTC_ETH', tid='1', price=0.07, amount=1.0,
+                            trade_time=datetime(2018, 8, 1))
+    return ExchangeItem('poloniex', 'trades', trades)
+
+
+async def test_fetch_batch_flush_on_size(loop):
+    tunnel = QueueTunnel()
+    for _ in range(5):
+        tunnel.put(make_item())
+    items, reason = await fetch_batch(tunnel, 'poloniex|trades',
+                                      BatchPolicy(max_size=3))
+    assert len(items) == 3 and reason == 'size'
+
+
+async def test_fetch_batch_flush_on_linger(loop):
+    tunnel = QueueTunnel()
+    tunnel.put(make_item())
+    tunnel.put(make_item())
+    start = time.monotonic()
+    items, reason = await fetch_batch(tunnel, 'poloniex|trades',
+                                      BatchPolicy(max_size=10, max_linger=0.1))
+    assert len(items) == 2 and reason == 'linger'
+    assert time.monotonic() - start < 1
+    tunnel.put(make_item())             # 超时的get没有吃掉后面的数据
+    assert tunnel.get('poloniex|trades')
+
+
+async def test_fetch_batch_flush_on_bytes(loop):
+    tunnel = QueueTunnel()
+    for _ in range(5):
+        tunnel.put(make_item())
+    size = batching.estimate_bson_size(make_item())
+    items, reason = await fetch_batch(
+        tunnel, 'poloniex|trades',
+        BatchPolicy(max_size=10, max_bytes=size * 2 + 1)
+    )
+    assert len(items) == 2 and reason == 'bytes'
+
+
+def test_get_batch_policy(monkeypatch):
+    monkeypatch.setattr(batching, 'settings', {
+        'MONGO_BATCH_OP_SIZE': 15,
+        'MONGO_BATCH_POLICIES': {
+            'kline': {'max_linger': 10, 'max_size': 5},
+            'okex_future0kline': {'max_size': 1}
+        }
+    })
+    assert batching.get_batch_policy('binance0kline') == BatchPolicy(
+        max_size=5, max_linger=10
+    )
+    assert batching.get_batch_policy('okex_future0kline').max_size == 1
+    assert batching.get_batch_policy('binance0depth').max_size == 15
+
+
+def test_batch_stats():
+    stats = BatchStats()
+    for size, reason in ((1, 'linger'), (15, 'size'), (15, 'size'),
+                         (2000, 'bytes')):
+        stats.observe(size, reason)
+    assert stats.flush_reasons == {'linger': 1, 'size': 2, 'bytes': 1}
+    histogram = stats.histogram()
+    assert histogram['1'] == 1 and histogram['20'] == 2
+    assert histogram['+Inf'] == 1
+    assert stats.items == 2031
+
+
+async def test_fetch_batch_returns_on_stop(loop):
+    tunnel = QueueTunnel()
+    stop = asyncio.Event()
+    tunnel.put(make_item())
+    loop.call_later(0.05, stop.set)
+    items, reason = await fetch_batch(tunnel, 'poloniex|trades',
+                                      BatchPolicy(max_linger=60), stop)
+    assert len(items) == 1 and reason == 'stopped'
+    items, reason = await fetch_batch(tunnel, 'poloniex|trades',
+                                      BatchPolicy(), stop)
+    assert items == [] and reason == 'stopped'
@@ -0,0 +1,99 @@
+"""
+author: thomaszdxsn
+"""
+import asyncio
+from datetime import datetime
+
+import pytest
+
+from src.schemas.items import ExchangeItem
+from src.schemas.markets import PoloniexTrades
+from src.storage import pool as pool_module
+from src.storage.mongo import MongoStorage
+from src.storage.pool import WriterPool, desired_workers
+from src.tunnels.queues import QueueTunnel
+from src.tunnels.spill import SpillTunnel
+
+KEY = 'poloniex|trades'
+
+
+def make_item():
+    trades = PoloniexTrades(pair='BTC_ETH', tid='1', price=0.07, amount=1.0,
+                            trade_time=datetime(2018, 8, 1))
+    return ExchangeItem('poloniex', 'trades', trades)
+
+
+@pytest.fixture
+def storage(loop, monkeypatch):
+    storage = MongoStorage('mongodb://localhost:27017', 1)
+    storage.written = []
+
+    async def bulk_op(collection, items, ordered=False):
+        await asyncio.sleep(0.01)
+        storage.written.extend(items)
+    monkeypatch.setattr(storage, 'bulk_op', bulk_op)
+    monkeypatch.setattr(pool_module, 'settings', {
+        'MONGO_WRITER_MIN': 1,
+        'MONGO_WRITER_MAX': 4,
+        'MONGO_WRITER_ADJUST_INTERVAL': 3600,
+    })
+    return storage
+
+
+@pytest.mark.parametrize('backlog, latency, result', [
+    (0, 0.1, 1),            # 没有积压
+    (100, None, 1),         # 还没有写入过
+    (100, 0.1, 1),          # 一个worker 5s能写750条
+    (3000, 0.1, 4),
+    (100000, 1, 10),        # 不超过max
+])
+def test_desired_workers(backlog, latency, result):
+    assert desired_workers(backlog, latency, batch_size=15, target_drain=5,
+                           bounds=(1, 10)) == result
+
+
+async def test_pool_spawns_workers_for_new_key(storage, loop):
+    tunnel = QueueTunnel()
+    pool = WriterPool(storage, tunnel, loop=loop)
+    pool.start()
+    assert pool.worker_count(KEY) == 0
+    tunnel.put(make_item())
+    assert pool.worker_count(KEY) == 1          # 不需要等待下一次调整
+    await asyncio.sleep(0.05)
+    assert pool.worker_count(KEY) == 1
+    await pool.stop()
+
+
+async def test_pool_grows_on_backlog_and_shrinks_when_idle(storage, loop):
+    tunnel = QueueTunnel()
+    pool = WriterPool(storage, tunnel, loop=loop)
+    pool.start()
+    for _ in range(5000):
+        tunnel.put(make_item())
+    storage.get_batch_stats(KEY).observe_write(1.0)
+    pool.adjust()
+    assert pool.worker_count(KEY) == 4
+
+    while tunnel.get_queue(KEY).qsize():
+        await asyncio.sleep(0.05)
+    for expected in (3, 2, 1, 1):
+        pool.adjust()
+        await asyncio.sleep(0.05)
+        assert pool.worker_count(KEY) == expected
+    await pool.stop()
+    assert len(storage.written) == 5000
+
+
+async def test_pool_counts_spilled_items_in_backlog(storage, loop, tmpdir):
+    tunnel = SpillTunnel(str(tmpdir), threshold=10, loop=loop,
+                         segment_size=1024 * 1024)
+    pool = WriterPool(storage, tunnel, loop=loop)
+    pool.start()
+    for _ in range(5000):
+        tunnel.put(make_item())
+    assert tunnel.get_queue(KEY).qsize() == 10
+    assert pool.backlog(KEY) == 5000
+    storage.get_batch_stats(KEY).observe_write(1.0)
+    pool.adjust()
+    assert pool.worker_count(KEY) == 4
+    await pool.stop()
@@ -0,0 +1,131 @@
+"""
+author: thomaszdxsn
+"""
+import asyncio
+
+import pytest
+
+from src.storage.priority import (PriorityClass, WriteScheduler,
+                                  create_write_scheduler)
+
+
+def make_scheduler(slots: int=4,
+                   reserved: int=2,
+                   overdraft: int=0) -> WriteScheduler:
+    return WriteScheduler(
+        slots,
+        [PriorityClass('critical', priority=2, reserved=reserved,
+                       max_delay=0.01),
+         PriorityClass('default', priority=1),
+         PriorityClass('bulk', priority=0, max_delay=0.01)],
+        routes={'trades': 'critical', 'depth': 'bulk',
+                'bitmex0settlement': 'critical'},
+        default='default',
+        overdraft=overdraft
+    )
+
+
+def test_routes():
+    scheduler = make_scheduler()
+    assert scheduler.get_class('binance|trades').name == 'critical'
+    assert scheduler.get_class('binance|depth').name == 'bulk'
+    assert scheduler.get_class('bitmex|settlement').name == 'critical'
+    assert scheduler.get_class('binance|ticker').name == 'default'
+
+
+async def test_depth_backlog_cannot_take_reserved_slots(loop):
+    scheduler = make_scheduler(slots=4, reserved=2)
+    held = [await scheduler.acquire('binance|depth') for _ in range(2)]
+    blocked = asyncio.ensure_future(scheduler.acquire('binance|depth'))
+    await asyncio.sleep(0)
+    assert not blocked.done()               # 剩下的2个名额留给trades
+    for _ in range(2):
+        cls = await asyncio.wait_for(scheduler.acquire('okex|trades'), 0.1)
+        assert cls.name == 'critical'
+    assert scheduler.stats()['critical']['waited'] == 0
+    assert scheduler.stats()['bulk']['waiting'] == 1
+    scheduler.release(held[0])
+    await asyncio.wait_for(blocked, 0.1)
+    assert scheduler.in_use == 4
+
+
+async def test_released_slot_goes_to_higher_priority(loop):
+    scheduler = make_scheduler(slots=2, reserved=0)
+    held = [await scheduler.acquire('binance|ticker') for _ in range(2)]
+    order = []
+
+    async def write(key):
+        cls = await scheduler.acquire(key)
+        order.append(key)
+        scheduler.release(cls)
+
+    tasks = [asyncio.ensure_future(write(key))
+             for key in ('a|depth', 'b|ticker', 'c|trades')]
+    await asyncio.sleep(0.02)
+    scheduler.release(held[0])
+    await asyncio.gather(*tasks)
+    assert order == ['c|trades', 'b|ticker', 'a|depth']
+    stats = scheduler.stats()['critical']
+    assert stats['waited'] == 1 and stats['late'] == 1
+
+
+async def test_trades_borrow_slot_after_max_delay(loop):
+    scheduler = make_scheduler(slots=2, reserved=0, overdraft=1)
+    held = [await scheduler.acquire('binance|depth') for _ in range(2)]
+    trades = asyncio.ensure_future(scheduler.acquire('binance|trades'))
+    await asyncio.sleep(0)
+    assert not trades.done()            # max_delay之前不借用
+    cls = await asyncio.wait_for(trades, 0.1)
+    assert cls.name == 'critical'
+    assert scheduler.in_use == 3
+    stats = scheduler.stats()['critical']
+    assert stats['borrowed'] == 1 and stats['late'] == 0
+    # overdraft用完之后只能等待
+    second = asyncio.ensure_future(scheduler.acquire('okex|trades'))
+    await asyncio.sleep(0.03)
+    assert not second.done()
+    scheduler.release(cls)
+    await asyncio.wait_for(second, 0.1)
+    assert scheduler.stats()['critical']['borrowed'] == 2
+    # 优先级最低的类别不能借用
+    depth = asyncio.ensure_future(scheduler.acquire('binance|depth'))
+    scheduler.release(await second)
+    await asyncio.sleep(0.03)
+    assert not depth.done()
+    scheduler.release(held[0])
+    await asyncio.wait_for(depth, 0.1)
+    assert scheduler.stats()['bulk']['borrowed'] == 0
+
+
+async def test_cancelled_waiter_does_not_leak_slot(loop):
+    scheduler = make_scheduler(slots=1, reserved=0)
+    cls = await scheduler.acquire('a|trades')
+    waiter = asyncio.ensure_future(scheduler.acquire('a|trades'))
+    await asyncio.sleep(0)
+    waiter.cancel()
+    with pytest.raises(asyncio.CancelledError):
+        await waiter
+    scheduler.release(cls)
+    assert scheduler.in_use == 0
+    async with scheduler.slot('a|trades'):
+        assert scheduler.in_use == 1
+
+
+def test_reserved_larger_than_slots_does_not_starve():
+    scheduler = make_scheduler(slots=1, reserved=30)
+    assert scheduler._can_acquire(scheduler.get_class('a|depth'))
+
+
+def test_create_from_settings(monkeypatch):
+    from src.storage import priority
+    monkeypatch.setattr(priority, 'settings', {
+        'MONGO_WRITE_SLOTS': 0,
+        'MONGO_PRIORITY_CLASSES': {
+            'critical': {'priority': 2, 'reserved': 5,
+                         'data_types': ['trades']},
+        },
+    })
+    scheduler = create_write_scheduler(pool_size=20)
+    assert scheduler.slots == 20
+    assert scheduler.get_class('a|trades').reserved == 5
+    assert scheduler.get_class('a|depth').name == 'default'
@@ -0,0 +1,101 @@
+"""
+author: thomaszdxsn
+"""
+import asyncio
+import os
+
+from src.schemas.items import ExchangeItem
+from src.schemas.markets import PoloniexTrades
+from src.tunnels.fanout import FanoutTunnel
+from src.tunnels.server import FanoutServer, parse_address, subscribe
+
+
+def make_item(i: int, exchange: str='poloniex', data_type: str='trades'):
+    return ExchangeItem(exchange, data_type, i)
+
+
+async def test_subscribers_have_independent_cursors(loop):
+    tunnel = FanoutTunnel(limit=100)
+    fast = tunnel.subscribe('poloniex|*')
+    other = tunnel.subscribe('*|depth')
+    tunnel.put_many([make_item(i) for i in range(5)])
+    tunnel.put(make_item(5, data_type='depth'))
+    assert [i.data for i in await fast.get_many(3)] == [0, 1, 2]
+    assert [i.data for i in await fast.get_many(10)] == [3, 4, 5]
+    assert [i.data for i in await other.get_many(10)] == [5]
+    # mongo那一路不受订阅者影响
+    items = await tunnel.get_many('poloniex|trades', 100, timeout=0)
+    assert [i.data for i in items] == [0, 1, 2, 3, 4]
+    assert await fast.get_many(10, timeout=0) == []
+
+
+async def test_slow_subscriber_disconnected(loop):
+    tunnel = FanoutTunnel(limit=3)
+    slow = tunnel.subscribe('*')
+    fast = tunnel.subscribe('*', limit=100)
+    for i in range(10):
+        tunnel.put(make_item(i))
+    assert slow.closed and slow.reason == 'slow'
+    assert tunnel.subscriptions == [fast]
+    assert tunnel.disconnected['slow'] == 1
+    assert fast.backlog() == 10
+    assert await slow.get_many(10) == []
+
+
+async def test_waiting_subscriber_woken(loop):
+    tunnel = FanoutTunnel()
+    sub = tunnel.subscribe('poloniex|trades')
+    getter = asyncio.ensure_future(sub.get_many(10))
+    await asyncio.sleep(0)
+    tunnel.put(make_item(1))
+    assert [i.data for i in await asyncio.wait_for(getter, 1)] == [1]
+    getter = asyncio.ensure_future(sub.get_many(10))
+    await asyncio.sleep(0)
+    tunnel.unsubscribe(sub)
+    assert await asyncio.wait_for(getter, 1) == []
+
+
+def test_parse_address():
+    assert parse_address('/tmp/a.sock') == {'path': '/tmp/a.sock'}
+    assert parse_address('unix:a.sock') == {'path': 'a.sock'}
+    assert parse_address('127.0.0.1:8700') == {'host': '127.0.0.1',
+                                               'port': 8700}
+
+
+async def test_server_streams_matching_keys(loop, tmpdir):
+    address = os.path.join(str(tmpdir), 'fanout.sock')
+    tunnel = FanoutTunnel()
+    server = FanoutServer(tunnel, address)
+    await server.start()
+    stream = subscribe(address, ['poloniex|trades'])
+    first = asyncio.ensure_future(stream.__anext__())
+    while not tunnel.subscriptions:
+        await asyncio.sleep(0.01)
+    trade = PoloniexTrades(pair='BTC_ETH', tid=1, price=0.07, amount=1.5,
+                           trade_time='2018-08-01 00:00:00')
+    tunnel.put(make_item(0, data_type='depth'))
+    tunnel.put(ExchangeItem('poloniex', 'trades', trade))
+    msg = await asyncio.wait_for(first, 1)
+    assert msg['id'] == 'poloniex|trades'
+    assert msg['data']['tid'] == 1 and msg['data']['price'] == 0.07
+    await stream.aclose()
+    await server.stop()
+
+
+async def test_server_disconnects_client_not_reading(loop, tmpdir):
+    address = os.path.join(str(tmpdir), 'fanout.sock')
+    tunnel = FanoutTunnel(limit=50)
+    server = FanoutServer(tunnel, address, max_buffer=1024)
+    await server.start()
+    reader, writer = await asyncio.open_unix_connection(address)
+    writer.write(b'*\n')
+    while not tunnel.subscriptions:
+        await asyncio.sleep(0.01)
+    payload = 'x' * 1000
+    for _ in range(2000):           # 客户端不读，采集不能被阻塞
+        tunnel.put(make_item(payload))
+        await asyncio.sleep(0)
+    assert tunnel.subscriptions == []
+    assert tunnel.disconnected['slow'] == 1
+    writer.close()
+    await server.stop()
@@ -5,6 +5,7 @@ import asyncio
 import pytest
 
 from src.schemas.items import ExchangeItem
+from src.schemas.markets import OkexFutureDepth, PoloniexDepth
 from src.tunnels.queues import QueueTunnel
 
 
@@ -52,4 +53,102 @@ async def test_async_get_item_and_sync_put(tunnel, loop):
         value = await tunnel.get_async(item.id)
         assert value == item
 
-    t.cancel()
\ No newline at end of file
+    t.cancel()
+
+
+def depth_item(pair, seq):
+    depth = PoloniexDepth(bids=[], asks=[[seq, 1.0]], pair=pair)
+    return ExchangeItem(exchange='poloniex', data_type='depth', data=depth)
+
+
+def future_depth_item(contract_type, seq):
+    depth = OkexFutureDepth(bids=[], asks=[[seq, 1.0]], pair='btc',
+                            contract_type=contract_type)
+    return ExchangeItem(exchange='okex_future', data_type='depth', data=depth)
+
+
+def test_drop_oldest_policy():
+    tunnel = QueueTunnel(policies={
+        'ticker': {'maxsize': 2, 'overflow': 'drop_oldest'}
+    })
+    items = [ExchangeItem(exchange='okex', data_type='ticker', data=i)
+             for i in range(3)]
+    list(map(tunnel.put, items))
+    assert [tunnel.get('okex|ticker').data for _ in range(2)] == [1, 2]
+    assert tunnel.stats() == {'okex|ticker': {'dropped': 1}}
+
+
+def test_conflate_policy():
+    tunnel = QueueTunnel(policies={
+        'depth': {'maxsize': 2, 'overflow': 'conflate'}
+    })
+    for item in (depth_item('BTC_ETH', 1), depth_item('BTC_LTC', 2),
+                 depth_item('BTC_ETH', 3), depth_item('BTC_ETH', 4),
+                 depth_item('BTC_EOS', 5)):
+        tunnel.put(item)
+    result = [tunnel.get('poloniex|depth').data for _ in range(2)]
+    # BTC_ETH的两次更新合并到第一条的位置, BTC_EOS进来时丢掉最旧的BTC_ETH
+    assert [(d.pair, d.asks[0][0]) for d in result] == [('BTC_LTC', 2),
+                                                        ('BTC_EOS', 5)]
+    assert tunnel.stats()['poloniex|depth'] == {'conflated': 2, 'dropped': 1}
+
+
+def test_conflate_keeps_contract_types_apart():
+    tunnel = QueueTunnel(policies={
+        'depth': {'maxsize': 2, 'overflow': 'conflate'}
+    })
+    for item in (future_depth_item('this_week', 1),
+                 future_depth_item('quarter', 2),
+                 future_depth_item('this_week', 3),
+                 future_depth_item('quarter', 4)):
+        tunnel.put(item)
+    result = [tunnel.get('okex_future|depth').data for _ in range(2)]
+    assert [(d.contract_type, d.asks[0][0]) for d in result] == [
+        ('this_week', 3), ('quarter', 4)
+    ]
+    assert tunnel.stats()['okex_future|depth'] == {'conflated': 2}
+
+
+async def test_block_policy_applies_backpressure(loop):
+    tunnel = QueueTunnel(policies={'trades': {'maxsize': 2}}, loop=loop)
+    items = [ExchangeItem(exchange='okex', data_type='trades', data=i)
+             for i in range(3)]
+    list(map(tunnel.put, items))                # 同步put不会丢数据
+    drain = loop.create_task(tunnel.drain('okex'))
+    put = loop.create_task(tunnel.put_async(items[0]))
+    await tunnel.drain('binance')               # 其他交易所不受影响
+    await asyncio.sleep(0.01)
+    assert not drain.done() and not put.done()
+
+    assert await tunnel.get_async('okex|trades') == items[0]
+    assert await tunnel.get_async('okex|trades') == items[1]
+    await asyncio.wait_for(drain, 1)
+    await asyncio.wait_for(put, 1)
+    assert tunnel.get_queue('okex|trades').qsize() == 2
+    assert tunnel.stats()['okex|trades'] == {'over_limit': 1, 'blocked': 2}
+
+
+async def test_put_many_and_get_many(tunnel, loop):
+    items = [ExchangeItem(exchange='okex', data_type='trades', data=i)
+             for i in range(5)]
+    tunnel.put_many(items)
+    assert await tunnel.get_many('okex|trades', 3) == items[:3]
+    assert await tunnel.get_many('okex|trades', 10) == items[3:]
+    assert await tunnel.get_many('okex|trades', 10, timeout=0) == []
+    assert await tunnel.get_many('okex|trades', 10, timeout=0.01) == []
+    assert tunnel.get_queue('okex|trades')._unfinished_tasks == 0
+
+    loop.call_later(0.01, tunnel.put_many, items[:2])
+    assert await tunnel.get_many('okex|trades', 10) == items[:2]
+
+
+async def test_iter_items(tunnel, loop):
+    items = [ExchangeItem(exchange='okex', data_type='trades', data=i)
+             for i in range(5)]
+    tunnel.put_many(items)
+    result = []
+    async for item in tunnel.iter_items('okex|trades', max_n=2):
+        result.append(item)
+        if len(result) == 5:
+            break
+    assert result == items
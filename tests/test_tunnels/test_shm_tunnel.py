@@ -0,0 +1,110 @@
+"""
+author: thomaszdxsn
+"""
+import asyncio
+import multiprocessing
+import pickle
+
+from src.schemas.items import ExchangeItem
+from src.schemas.markets import PoloniexDepth
+from src.tunnels.shm import SharedMemoryTunnel
+
+
+def make_item(i: int) -> ExchangeItem:
+    return ExchangeItem('poloniex', 'trades', i)
+
+
+def test_wraparound_keeps_order():
+    item_size = len(pickle.dumps(make_item(0), pickle.HIGHEST_PROTOCOL)) + 4
+    tunnel = SharedMemoryTunnel(capacity=item_size * 3 + item_size // 2)
+    received = []
+    for i in range(0, 100, 2):
+        assert tunnel.put(make_item(i))
+        assert tunnel.put(make_item(i + 1))
+        received.extend(tunnel.read_many(10))
+    assert [item.data for item in received] == list(range(100))
+    assert tunnel.lag() == 0 and tunnel.dropped == 0
+
+
+POLICIES = {
+    'trades': {'maxsize': 100, 'overflow': 'block'},
+    'depth': {'maxsize': 100, 'overflow': 'conflate'},
+}
+
+
+def test_full_buffer_drops_depth_and_counts():
+    tunnel = SharedMemoryTunnel(capacity=256, policies=POLICIES)
+    results = [tunnel.put(ExchangeItem('poloniex', 'depth', i))
+               for i in range(10)]
+    assert not all(results)
+    assert tunnel.dropped == results.count(False)
+    assert tunnel.stats()['poloniex|depth'] == {'dropped': tunnel.dropped}
+    received = [item.data for item in tunnel.read_many(100)]
+    assert received == [i for i, ok in enumerate(results) if ok]
+
+
+async def test_full_buffer_keeps_trades_until_drained(loop):
+    tunnel = SharedMemoryTunnel(capacity=256, poll_interval=0.001,
+                                policies=POLICIES)
+    assert all(tunnel.put(make_item(i)) for i in range(10))
+    assert tunnel.dropped == 0 and tunnel.pending > 0
+    received = []
+
+    async def consume():
+        while len(received) < 10:
+            received.extend(item.data for item in tunnel.read_many(3))
+            await asyncio.sleep(0.001)
+
+    consumer = asyncio.ensure_future(consume())
+    await asyncio.wait_for(tunnel.drain(), 1)       # 背压: 等pending写入缓冲区
+    assert tunnel.pending == 0
+    await asyncio.wait_for(consumer, 1)
+    assert received == list(range(10))
+
+
+def test_dataclass_items_roundtrip():
+    tunnel = SharedMemoryTunnel(capacity=4096)
+    depth = PoloniexDepth(bids=[[0.069, 3.0]], asks=[[0.07, 1.0]],
+                          pair='BTC_ETH')
+    tunnel.put(ExchangeItem('poloniex', 'depth', depth))
+    item, = tunnel.read_many(1)
+    assert item.data == depth and item.id == 'poloniex|depth'
+
+
+def produce(tunnel: SharedMemoryTunnel, start: int, n: int):
+    loop = asyncio.new_event_loop()
+    for i in range(start, start + n):
+        loop.run_until_complete(tunnel.put_async(make_item(i)))
+
+
+def test_multiprocess_producers():
+    tunnel = SharedMemoryTunnel(capacity=4096)
+    processes = [multiprocessing.Process(target=produce,
+                                         args=(tunnel, i * 1000, 1000))
+                 for i in range(2)]
+    [p.start() for p in processes]
+    received = []
+    while len(received) < 2000:
+        received.extend(item.data for item in tunnel.read_many(100))
+    [p.join() for p in processes]
+    assert sorted(received) == list(range(2000))
+    for start in (0, 1000):             # 同一个生产者的数据保持顺序
+        own = [i for i in received if start <= i < start + 1000]
+        assert own == sorted(own)
+
+
+async def test_consumer_dispatches_by_key(loop):
+    tunnel = SharedMemoryTunnel(capacity=4096, poll_interval=0.001)
+    keys = []
+    tunnel.start_consumer()
+    tunnel.add_key_listener(keys.append)
+    tunnel.put(make_item(1))
+    tunnel.put(ExchangeItem('binance', 'depth', 2))
+    tunnel.put(make_item(3))
+    items = await asyncio.wait_for(tunnel.get_many('poloniex|trades', 10), 1)
+    if len(items) < 2:
+        items += await tunnel.get_many('poloniex|trades', 10, timeout=1)
+    assert [i.data for i in items] == [1, 3]
+    assert (await tunnel.get_async('binance|depth')).data == 2
+    assert keys == ['poloniex|trades', 'binance|depth']
+    tunnel._pump.cancel()
@@ -0,0 +1,144 @@
+"""
+author: thomaszdxsn
+"""
+import asyncio
+from pathlib import Path
+
+from src.schemas.items import ExchangeItem
+from src.schemas.markets import PoloniexDepth
+from src.tunnels.spill import SegmentLog, SpillTunnel
+
+KEY = 'poloniex|trades'
+
+
+def make_item(i: int) -> ExchangeItem:
+    return ExchangeItem('poloniex', 'trades', i)
+
+
+def depth_item(pair, seq):
+    depth = PoloniexDepth(bids=[], asks=[[seq, 1.0]], pair=pair)
+    return ExchangeItem(exchange='poloniex', data_type='depth', data=depth)
+
+
+def drain_all(tunnel: SpillTunnel, key: str=KEY) -> list:
+    loop = asyncio.get_event_loop()
+    received = []
+    while True:
+        items = loop.run_until_complete(tunnel.get_many(key, 7, timeout=0))
+        if not items:
+            return received
+        received.extend(item.data for item in items)
+
+
+def test_order_kept_across_memory_and_disk(tmpdir):
+    tmp_path = Path(str(tmpdir))
+    tunnel = SpillTunnel(tmp_path, threshold=10, segment_size=512)
+    tunnel.put_many([make_item(i) for i in range(100)])
+    assert tunnel.spilled[KEY] == 90
+    assert tunnel.get_queue(KEY).qsize() + tunnel.spilled_count(KEY) == 100
+    received = drain_all(tunnel)
+    assert received == list(range(100))
+    assert tunnel.spilled_count(KEY) == 0
+    tunnel.put(make_item(100))          # 磁盘读空之后回到内存
+    assert tunnel.spilled[KEY] == 90
+    assert tunnel.get(KEY).data == 100
+
+
+def test_segments_rollover_and_removed(tmpdir):
+    tmp_path = Path(str(tmpdir))
+    log = SegmentLog(tmp_path, segment_size=64)
+    for i in range(10):
+        log.append(bytes([i]) * 20)
+    assert len(list(tmp_path.glob('*.seg'))) == 5
+    assert len(log) == 10
+    payloads = log.read(7)
+    assert [p[0] for p in payloads] == list(range(7))
+    assert len(list(tmp_path.glob('*.seg'))) == 2
+    assert [p[0] for p in log.read(100)] == [7, 8, 9]
+    assert len(log) == 0
+    assert len(list(tmp_path.glob('*.seg'))) == 1   # 最后一个从头复用
+
+
+def test_recover_after_restart(tmpdir):
+    tmp_path = Path(str(tmpdir))
+    tunnel = SpillTunnel(tmp_path, threshold=5, segment_size=256)
+    tunnel.put_many([make_item(i) for i in range(30)])
+    assert tunnel.get(KEY).data == 0
+    tunnel.flush()
+    del tunnel                          # 内存里的数据随进程丢失，磁盘上的还在
+
+    tunnel = SpillTunnel(tmp_path, threshold=5, segment_size=256)
+    assert tunnel.keys() == [KEY]
+    assert tunnel.spilled_count(KEY) == 25
+    assert drain_all(tunnel) == list(range(5, 30))
+
+
+def test_disk_error_falls_back_to_memory(tmpdir):
+    tmp_path = Path(str(tmpdir))
+    tunnel = SpillTunnel(tmp_path, threshold=1, segment_size=32)
+    tunnel.put(make_item(0))
+    tunnel.put(ExchangeItem('poloniex', 'trades', 'x' * 100))   # 比segment大
+    assert tunnel.get_queue(KEY).qsize() == 2
+    assert tunnel.spilled_count(KEY) == 0
+
+
+def test_spill_instead_of_dropping(tmpdir):
+    tmp_path = Path(str(tmpdir))
+    tunnel = SpillTunnel(tmp_path, threshold=100, segment_size=512, policies={
+        'trades': {'maxsize': 5, 'overflow': 'drop_oldest'}
+    })
+    tunnel.put_many([make_item(i) for i in range(20)])
+    assert tunnel.get_queue(KEY).qsize() == 5       # policy的maxsize比threshold小
+    assert tunnel.spilled_count(KEY) == 15
+    assert drain_all(tunnel) == list(range(20))
+    assert tunnel.stats()[KEY] == {}                # 没有丢数据
+
+
+def test_conflate_in_memory_before_spilling(tmpdir):
+    tmp_path = Path(str(tmpdir))
+    tunnel = SpillTunnel(tmp_path, threshold=100, segment_size=1024, policies={
+        'depth': {'maxsize': 2, 'overflow': 'conflate'}
+    })
+    for item in (depth_item('BTC_ETH', 1), depth_item('BTC_LTC', 2),
+                 depth_item('BTC_ETH', 3), depth_item('BTC_EOS', 4),
+                 depth_item('BTC_ETH', 5)):
+        tunnel.put(item)
+    key = 'poloniex|depth'
+    assert tunnel.stats()[key] == {'conflated': 1}
+    # BTC_EOS不能合并，溢出到磁盘；之后的数据按顺序排在它后面，不再合并
+    assert tunnel.spilled_count(key) == 2
+    assert [(d.pair, d.asks[0][0]) for d in drain_all(tunnel, key)] == [
+        ('BTC_ETH', 3), ('BTC_LTC', 2), ('BTC_EOS', 4), ('BTC_ETH', 5)
+    ]
+
+
+def test_tunnels_sharing_parent_directory_stay_apart(tmpdir):
+    parent = Path(str(tmpdir))
+    ingest0 = SpillTunnel(parent / 'ingest0', threshold=5, segment_size=256)
+    ingest1 = SpillTunnel(parent / 'ingest1', threshold=5, segment_size=256)
+    ingest0.put_many([make_item(i) for i in range(10)])
+    ingest1.put_many([make_item(i) for i in range(100, 120)])
+    ingest0.flush()
+    ingest1.flush()
+    del ingest0, ingest1
+
+    ingest0 = SpillTunnel(parent / 'ingest0', threshold=5, segment_size=256)
+    ingest1 = SpillTunnel(parent / 'ingest1', threshold=5, segment_size=256)
+    assert ingest0.spilled_count(KEY) == 5
+    assert ingest1.spilled_count(KEY) == 15
+    assert drain_all(ingest0) == list(range(5, 10))
+    assert drain_all(ingest1) == list(range(105, 120))
+
+
+def test_recover_key_with_digits_in_exchange_name(tmpdir):
+    tmp_path = Path(str(tmpdir))
+    key = 'okex_v3|depth0'
+    tunnel = SpillTunnel(tmp_path, threshold=1, segment_size=256)
+    tunnel.put_many([ExchangeItem('okex_v3', 'depth0', i) for i in range(3)])
+    (tmp_path / 'writer0').mkdir()          # 不是key的目录不恢复
+    tunnel.flush()
+    del tunnel
+
+    tunnel = SpillTunnel(tmp_path, threshold=1, segment_size=256)
+    assert tunnel.keys() == [key]
+    assert drain_all(tunnel, key) == [1, 2]